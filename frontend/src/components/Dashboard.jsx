@@ -40,17 +40,25 @@ function Dashboard() {
     fetchCommits()
   }, [])
 
-  // Auto-refresh commits every 30 seconds when tracking
+  // Receive new commits from the live feed while tracking instead of re-polling the full list
   useEffect(() => {
-    let interval
-    if (isTracking) {
-      interval = setInterval(fetchCommits, 30000) // 30 seconds
-    }
-    return () => {
-      if (interval) {
-        clearInterval(interval)
-      }
+    if (!isTracking) {
+      return
     }
+    const unsubscribe = apiService.subscribeToCommits({
+      onCommit: (commit) => {
+        setCommits((current) =>
+          current.some((c) => c.commit_hash === commit.commit_hash) ? current : [commit, ...current]
+        )
+      },
+      onAnalysis: (analysis) => {
+        setCommits((current) =>
+          current.map((c) => (c.commit_hash === analysis.commit_hash ? { ...c, analysis } : c))
+        )
+      },
+      onReset: fetchCommits,
+    })
+    return unsubscribe
   }, [isTracking])
 
   // Handle tracking state change
@@ -50,6 +50,12 @@ export const apiService = {
     return response.data;
   },
 
+  // Get progress of a background ingest run started by startTracking
+  getIngestRun: async (runId) => {
+    const response = await api.get(`/api/ingest-runs/${runId}`);
+    return response.data;
+  },
+
   // Get commits
   getCommits: async () => {
     const response = await api.get('/api/commits');
@@ -68,11 +74,66 @@ export const apiService = {
     return response.data;
   },
 
+  // Queue AI analysis for a commit; resolves with the queued job
+  requestAnalysis: async (commitHash, commitData) => {
+    const response = await api.post(`/api/analysis/${commitHash}`, commitData);
+    return response.data;
+  },
+
+  // Get state of a queued analysis job
+  getAnalysisJob: async (jobId) => {
+    const response = await api.get(`/api/analysis-jobs/${jobId}`);
+    return response.data;
+  },
+
   // Fetch new commits (trigger manual fetch)
   fetchCommits: async () => {
     const response = await api.post('/api/fetch-commits');
     return response.data;
   },
+
+  // Subscribe to the live commit feed (Server-Sent Events)
+  // The browser reconnects automatically and resumes with Last-Event-ID
+  subscribeToCommits: ({ onCommit, onAnalysis, onReset }) => {
+    const source = new EventSource(`${API_BASE_URL}/api/commits/stream`);
+    source.addEventListener('commit', (event) => onCommit?.(JSON.parse(event.data)));
+    source.addEventListener('analysis', (event) => onAnalysis?.(JSON.parse(event.data)));
+    source.addEventListener('reset', () => onReset?.());
+    return () => source.close();
+  },
+
+  // Analyze a commit, receiving model tokens as they are generated (Server-Sent Events)
+  // EventSource cannot POST, so the stream is read with fetch; abort the signal to stop generating
+  streamAnalysis: async (commitData, { onToken, onResult, onError, signal } = {}) => {
+    const response = await fetch(`${API_BASE_URL}/api/analyze/stream`, {
+      method: 'POST',
+      headers: { 'Content-Type': 'application/json' },
+      body: JSON.stringify(commitData),
+      signal,
+    });
+    if (!response.ok) {
+      throw new Error(`Error ${response.status}: failed to analyze commit`);
+    }
+
+    const reader = response.body.pipeThrough(new TextDecoderStream()).getReader();
+    let buffer = '';
+    for (;;) {
+      const { value, done } = await reader.read();
+      if (done) break;
+      buffer += value;
+      const messages = buffer.split('\n\n');
+      buffer = messages.pop();
+      for (const message of messages) {
+        const event = message.match(/^event: (.*)$/m)?.[1];
+        const data = message.match(/^data: (.*)$/m)?.[1];
+        if (!data) continue;
+        const payload = JSON.parse(data);
+        if (event === 'token') onToken?.(payload.text);
+        else if (event === 'result') onResult?.(payload);
+        else if (event === 'error') onError?.(payload.detail);
+      }
+    }
+  },
 };
 
 // Error handling utility
@@ -35,7 +35,9 @@ CREATE TABLE IF NOT EXISTS ai_analysis (
     analysis_type VARCHAR(50) DEFAULT 'commit_analysis',
     analysis_data JSONB NOT NULL,
     model_used VARCHAR(100) DEFAULT 'codellama',
+    prompt_version VARCHAR(20),
     processing_time_ms INTEGER,
+    routing JSONB,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     FOREIGN KEY (commit_hash) REFERENCES commits(commit_hash) ON DELETE CASCADE
 );
@@ -48,6 +50,10 @@ CREATE INDEX IF NOT EXISTS idx_commits_author ON commits(author);
 CREATE INDEX IF NOT EXISTS idx_tracking_sessions_repository ON tracking_sessions(repository);
 CREATE INDEX IF NOT EXISTS idx_ai_analysis_commit_hash ON ai_analysis(commit_hash);
 
+-- One analysis per commit, model and prompt template version
+CREATE UNIQUE INDEX IF NOT EXISTS uq_ai_analysis_commit_model_prompt
+    ON ai_analysis(commit_hash, model_used, prompt_version);
+
 -- Create function to update updated_at timestamp
 CREATE OR REPLACE FUNCTION update_updated_at_column()
 RETURNS TRIGGER AS $$
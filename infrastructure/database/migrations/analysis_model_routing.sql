@@ -0,0 +1,5 @@
+-- Migration script for tiered model routing
+-- Records the model tiers tried for each analysis, with per-tier latency,
+-- confidence and the reason for escalating
+
+ALTER TABLE ai_analysis ADD COLUMN IF NOT EXISTS routing JSONB;
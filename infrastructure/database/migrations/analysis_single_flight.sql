@@ -0,0 +1,27 @@
+-- Migration script for single-flight commit analysis
+-- Guarantees at most one analysis per (commit, model, prompt template version)
+-- and at most one queued or running analysis job per commit
+
+-- Record which prompt template produced each analysis
+ALTER TABLE ai_analysis ADD COLUMN IF NOT EXISTS prompt_version VARCHAR(20);
+
+-- Drop duplicate analyses, keeping the oldest row of each group
+DELETE FROM ai_analysis a
+USING ai_analysis b
+WHERE a.commit_hash = b.commit_hash
+  AND a.model_used IS NOT DISTINCT FROM b.model_used
+  AND a.prompt_version IS NOT DISTINCT FROM b.prompt_version
+  AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS uq_ai_analysis_commit_model_prompt
+    ON ai_analysis(commit_hash, model_used, prompt_version);
+
+-- Only one active job per commit (the table is created by the AI service on startup)
+DO $$
+BEGIN
+    IF EXISTS (SELECT FROM information_schema.tables WHERE table_name = 'analysis_jobs') THEN
+        CREATE UNIQUE INDEX IF NOT EXISTS uq_analysis_jobs_active_commit
+            ON analysis_jobs(commit_hash)
+            WHERE status IN ('queued', 'running');
+    END IF;
+END $$;
@@ -1,19 +1,34 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import AsyncIterator, List, Dict
+import json
+import httpx
 import logging
 import os
 from dotenv import load_dotenv
 from datetime import datetime
 
 # Import our modules
-from models.database import get_db, init_db
+from models.database import SessionLocal, get_db, init_db
 from models.analysis import AIAnalysis
+from models.analysis_job import AnalysisJob
 from services.ollama_client import OllamaClient
+from services.analysis_service import AnalysisService
+from services.analysis_cache import AnalysisCache
+from services.diff_analysis import DiffAnalyzer
+from services.rules import RuleClassifier
+from services.model_router import ModelRouter, parse_model_tiers
+from services.model_pool import ModelWarmPool, OLLAMA_WARM_MODELS
+from services.job_queue import AnalysisWorkerPool, LANES, INTERACTIVE, enqueue_job, promote_commit
+from services.disconnect import ClientDisconnected, cancel_on_disconnect
 
 # Load environment variables
 load_dotenv()
 
+# Most commits one POST /analyze/batch call may carry
+ANALYZE_BATCH_MAX_ITEMS = int(os.getenv("ANALYZE_BATCH_MAX_ITEMS", "500"))
+
 # Set up logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,6 +42,17 @@ app = FastAPI(
 
 # Initialize Ollama client
 ollama_client = OllamaClient()
+analysis_cache = AnalysisCache(SessionLocal)
+analysis_service = AnalysisService(
+    ollama_client, analysis_cache, RuleClassifier(), ModelRouter.from_env(),
+    diff_analyzer=DiffAnalyzer(ollama_client, analysis_cache)
+)
+
+# Models kept loaded in Ollama
+model_pool = ModelWarmPool(ollama_client, parse_model_tiers(OLLAMA_WARM_MODELS) or analysis_service.models)
+
+# Workers draining the analysis job queue
+worker_pool = AnalysisWorkerPool(analysis_service, SessionLocal)
 
 @app.on_event("startup")
 async def startup_event():
@@ -36,15 +62,26 @@ async def startup_event():
         logger.info("AI Service database initialized successfully")
         
         # Test Ollama connection
-        if ollama_client.test_connection():
+        if await ollama_client.test_connection():
             logger.info("Ollama connection successful")
         else:
             logger.warning("Ollama connection failed")
+        
+        # Models load in the background; the first jobs may still pay the load
+        model_pool.start()
+        worker_pool.start()
             
     except Exception as e:
         logger.error(f"AI Service startup failed: {e}")
         raise
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Stop analysis workers and model refreshes, and close the Ollama connection pool"""
+    await worker_pool.stop()
+    await model_pool.stop()
+    await ollama_client.aclose()
+
 @app.get("/")
 async def root():
     """Root endpoint"""
@@ -60,11 +97,21 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "ai-service",
-        "timestamp": datetime.now().isoformat()
+        "timestamp": datetime.now().isoformat(),
+        "analysis_workers": worker_pool.status(),
+        "analysis_cache": analysis_service.cache.stats(),
+        "rules": analysis_service.rules.stats(),
+        "routing": analysis_service.router.stats() if analysis_service.router else None,
+        "generation": ollama_client.metrics.snapshot(),
+        "model_pool": model_pool.status(),
+        "ollama_backends": ollama_client.pool.status(),
+        "concurrency": ollama_client.limiter.status(),
+        "prompts": ollama_client.prompt_builder.stats(),
+        "map_reduce": analysis_service.diff_analyzer.stats()
     }
 
 @app.post("/analyze")
-async def analyze_commit(commit_data: Dict):
+async def analyze_commit(commit_data: Dict, request: Request):
     """Analyze a commit using AI"""
     try:
         commit_message = commit_data.get("message", "")
@@ -76,30 +123,132 @@ async def analyze_commit(commit_data: Dict):
         
         logger.info(f"Analyzing commit: {commit_hash}")
         
-        # Analyze commit using Ollama
-        analysis_result = ollama_client.analyze_commit(commit_message, files_changed)
+        # Analyze commit using Ollama; stop generating if the caller goes away
+        analysis_result = await cancel_on_disconnect(
+            request, analysis_service.analyze_commit(commit_message, files_changed, commit_data.get("author"))
+        )
         
         return {
             "commit_hash": commit_hash,
             "analysis": analysis_result["analysis"],
             "processing_time_ms": analysis_result["processing_time_ms"],
-            "model_used": analysis_result["model_used"]
+            "model_used": analysis_result["model_used"],
+            "routing": analysis_result.get("routing"),
+            "cache_hit": analysis_result["cache_hit"]
         }
         
+    except ClientDisconnected:
+        # Nobody is left to read a response
+        return Response(status_code=499)
     except Exception as e:
         logger.error(f"Failed to analyze commit: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.post("/analyze/stream")
+async def stream_commit_analysis(commit_data: Dict):
+    """Analyze a commit using AI, streaming tokens as Server-Sent Events
+
+    Sends "token" events while the model generates, then one "result" event
+    (or "error" if the generation fails). Closing the connection stops the
+    generation.
+    """
+    commit_message = commit_data.get("message", "")
+    files_changed = commit_data.get("files_changed", [])
+    commit_hash = commit_data.get("commit_hash", "")
+    
+    if not commit_message:
+        raise HTTPException(status_code=400, detail="Commit message is required")
+    
+    logger.info(f"Streaming analysis of commit: {commit_hash}")
+    
+    return StreamingResponse(
+        analysis_events(commit_hash, analysis_service.stream_commit(commit_message, files_changed, commit_data.get("author"))),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+async def analysis_events(commit_hash: str, events: AsyncIterator[Dict]) -> AsyncIterator[str]:
+    """Format analysis stream events as SSE messages"""
+    try:
+        async for event in events:
+            event_type = event.pop("type")
+            if event_type == "result":
+                event.pop("raw_response", None)
+                event["commit_hash"] = commit_hash
+            yield f"event: {event_type}\ndata: {json.dumps(event, default=str)}\n\n"
+    except Exception as e:
+        # Headers are already sent, so report the failure in-band
+        logger.error(f"Failed to stream analysis of {commit_hash}: {e}")
+        yield f"event: error\ndata: {json.dumps({'detail': str(e)})}\n\n"
+
+@app.post("/analyze/batch")
+async def analyze_commit_batch(batch: Dict):
+    """Analyze many commits, streaming one NDJSON line per commit as it finishes
+
+    Takes {"commits": [{"commit_hash", "message", "files_changed", "author"}, ...]}.
+    Each line carries the commit's index in the request and either its
+    analysis or an "error"; rule-based and cached results come first. A final
+    {"done": true, ...} line summarizes the batch. Closing the connection
+    cancels the remaining work.
+    """
+    commits = batch.get("commits")
+    if not isinstance(commits, list) or not commits:
+        raise HTTPException(status_code=400, detail="A non-empty list of commits is required")
+    if len(commits) > ANALYZE_BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {ANALYZE_BATCH_MAX_ITEMS} commits per batch")
+    if not all(isinstance(commit, dict) for commit in commits):
+        raise HTTPException(status_code=400, detail="Each commit must be an object")
+    
+    logger.info(f"Analyzing batch of {len(commits)} commits")
+    
+    return StreamingResponse(
+        batch_results(commits),
+        media_type="application/x-ndjson",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+async def batch_results(commits: List[Dict]) -> AsyncIterator[str]:
+    """Format analyze_many results as NDJSON lines"""
+    failed = 0
+    valid = []
+    for index, commit in enumerate(commits):
+        if not commit.get("message"):
+            failed += 1
+            yield json.dumps({
+                "index": index, "commit_hash": commit.get("commit_hash", ""), "error": "Commit message is required"
+            }) + "\n"
+        else:
+            valid.append(index)
+    
+    async for position, result in analysis_service.analyze_many([commits[index] for index in valid]):
+        index = valid[position]
+        line = {"index": index, "commit_hash": commits[index].get("commit_hash", "")}
+        if isinstance(result, Exception):
+            logger.error(f"Failed to analyze commit {line['commit_hash']} in batch: {result}")
+            failed += 1
+            line["error"] = str(result)
+        else:
+            line.update({
+                "analysis": result["analysis"],
+                "processing_time_ms": result["processing_time_ms"],
+                "model_used": result["model_used"],
+                "routing": result.get("routing"),
+                "cache_hit": result["cache_hit"]
+            })
+        yield json.dumps(line, default=str) + "\n"
+    
+    yield json.dumps({"done": True, "total": len(commits), "failed": failed}) + "\n"
+
 @app.get("/analysis/{commit_hash}")
 async def get_analysis(commit_hash: str, db: Session = Depends(get_db)):
     """Get AI analysis for a specific commit"""
     try:
         # Check if analysis exists in database
-        analysis = db.query(AIAnalysis).filter(
-            AIAnalysis.commit_hash == commit_hash
-        ).first()
+        analysis = analysis_service.get_analysis(db, commit_hash)
         
         if not analysis:
+            # Someone is waiting on this commit: move its queued job ahead of backfill
+            promote_commit(db, commit_hash)
             raise HTTPException(status_code=404, detail="Analysis not found")
         
         return analysis.to_dict()
@@ -111,13 +260,19 @@ async def get_analysis(commit_hash: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/analysis/{commit_hash}")
-async def create_analysis(commit_hash: str, commit_data: Dict, db: Session = Depends(get_db)):
-    """Create AI analysis for a commit and store in database"""
+async def create_analysis(
+    commit_hash: str,
+    commit_data: Dict,
+    priority: str = INTERACTIVE,
+    db: Session = Depends(get_db)
+):
+    """Queue an AI analysis for a commit; a worker stores the result in the database"""
     try:
+        if priority not in LANES:
+            raise HTTPException(status_code=400, detail=f"Priority must be one of: {', '.join(LANES)}")
+        
         # Check if analysis already exists
-        existing_analysis = db.query(AIAnalysis).filter(
-            AIAnalysis.commit_hash == commit_hash
-        ).first()
+        existing_analysis = analysis_service.get_analysis(db, commit_hash)
         
         if existing_analysis:
             return {
@@ -126,40 +281,63 @@ async def create_analysis(commit_hash: str, commit_data: Dict, db: Session = Dep
             }
         
         commit_message = commit_data.get("message", "")
-        files_changed = commit_data.get("files_changed", [])
         
         if not commit_message:
             raise HTTPException(status_code=400, detail="Commit message is required")
         
-        logger.info(f"Creating analysis for commit: {commit_hash}")
+        logger.info(f"Queueing analysis for commit: {commit_hash}")
         
-        # Analyze commit using Ollama
-        analysis_result = ollama_client.analyze_commit(commit_message, files_changed)
+        job = enqueue_job(db, commit_hash, {
+            "message": commit_message,
+            "files_changed": commit_data.get("files_changed", []),
+            # The rule classifier recognizes bot commits by their author
+            "author": commit_data.get("author")
+        }, priority=priority)
+        worker_pool.notify()
         
-        # Store analysis in database
-        new_analysis = AIAnalysis(
-            commit_hash=commit_hash,
-            analysis_type="commit_analysis",
-            analysis_data=analysis_result["analysis"],
-            model_used=analysis_result["model_used"],
-            processing_time_ms=analysis_result["processing_time_ms"]
+        return JSONResponse(
+            status_code=202,
+            content={
+                "message": "Analysis queued",
+                "job": job.to_dict()
+            },
+            headers={"Location": f"/analysis-jobs/{job.id}"}
         )
         
-        db.add(new_analysis)
-        db.commit()
-        db.refresh(new_analysis)
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Failed to queue analysis for {commit_hash}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analysis-jobs/{job_id}")
+async def get_analysis_job(job_id: int, db: Session = Depends(get_db)):
+    """Get the state of a queued analysis"""
+    try:
+        job = db.query(AnalysisJob).filter(AnalysisJob.id == job_id).first()
         
-        logger.info(f"Analysis created and stored for commit: {commit_hash}")
+        if not job:
+            raise HTTPException(status_code=404, detail="Analysis job not found")
         
-        return {
-            "message": "Analysis created successfully",
-            "analysis": new_analysis.to_dict()
-        }
+        return job.to_dict()
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to create analysis for {commit_hash}: {e}")
+        logger.error(f"Failed to get analysis job {job_id}: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/analysis-queue")
+async def get_analysis_queue(db: Session = Depends(get_db)):
+    """Get per-lane queue depth and wait times of the analysis job queue"""
+    try:
+        return {
+            "workers": worker_pool.status(),
+            "lanes": worker_pool.lane_metrics(db)
+        }
+        
+    except Exception as e:
+        logger.error(f"Failed to get analysis queue metrics: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/insights")
@@ -209,7 +387,7 @@ async def get_insights(db: Session = Depends(get_db)):
 async def get_available_models():
     """Get available Ollama models"""
     try:
-        models = ollama_client.get_available_models()
+        models = await ollama_client.get_available_models()
         return {
             "available_models": models,
             "current_model": ollama_client.model
@@ -219,13 +397,33 @@ async def get_available_models():
         logger.error(f"Failed to get available models: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/models/resident")
+async def get_resident_models():
+    """Get the models Ollama currently holds in memory"""
+    try:
+        return {
+            "resident_models": await ollama_client.running_models(),
+            "warm_models": model_pool.models,
+            "keep_alive": ollama_client.keep_alive
+        }
+        
+    except httpx.HTTPError as e:
+        logger.error(f"Failed to get resident models: {e}")
+        raise HTTPException(status_code=503, detail="Ollama is not available")
+    except Exception as e:
+        logger.error(f"Failed to get resident models: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
 @app.post("/models/{model_name}/load")
 async def load_model(model_name: str):
     """Load a specific Ollama model"""
     try:
-        success = ollama_client.load_model(model_name)
+        success = await ollama_client.load_model(model_name)
         
         if success:
+            # Keep the new current model warm too
+            if model_name not in model_pool.models:
+                model_pool.models.append(model_name)
             return {
                 "message": f"Model {model_name} loaded successfully",
                 "current_model": ollama_client.model
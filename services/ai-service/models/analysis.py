@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Text, DateTime, JSON
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, UniqueConstraint
 from sqlalchemy.sql import func
 from .database import Base
 
@@ -16,13 +16,20 @@ class AIAnalysis(Base):
     analysis_type = Column(String(50), default='commit_analysis')
     analysis_data = Column(JSON, nullable=False)  # Store analysis results as JSON
     model_used = Column(String(100), default='codellama')
+    prompt_version = Column(String(20))  # Prompt template that produced the analysis
     
     # Performance metrics
     processing_time_ms = Column(Integer)  # Time taken to process in milliseconds
+    routing = Column(JSON)  # Model tiers tried, with latency, confidence and escalation reason
     
     # Timestamps
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     
+    # A commit is analyzed once per model and prompt template
+    __table_args__ = (
+        UniqueConstraint("commit_hash", "model_used", "prompt_version", name="uq_ai_analysis_commit_model_prompt"),
+    )
+    
     def __repr__(self):
         return f"<AIAnalysis(commit_hash={self.commit_hash}, type={self.analysis_type})>"
     
@@ -34,6 +41,8 @@ class AIAnalysis(Base):
             "analysis_type": self.analysis_type,
             "analysis_data": self.analysis_data,
             "model_used": self.model_used,
+            "prompt_version": self.prompt_version,
             "processing_time_ms": self.processing_time_ms,
+            "routing": self.routing,
             "created_at": self.created_at.isoformat() if self.created_at else None
         }
@@ -0,0 +1,41 @@
+from sqlalchemy import Column, Integer, String, DateTime, JSON
+from sqlalchemy.sql import func
+from .database import Base
+
+class AnalysisCacheEntry(Base):
+    """Model for analyses cached by the content of the prompt that produced them"""
+    __tablename__ = "analysis_cache"
+
+    # sha256 of model, prompt template version and rendered prompt
+    cache_key = Column(String(64), primary_key=True)
+
+    # What produced the entry
+    model = Column(String(100), nullable=False)
+    prompt_version = Column(String(20), nullable=False)
+
+    # Cached result
+    analysis_data = Column(JSON, nullable=False)
+    processing_time_ms = Column(Integer)  # Time the original generation took
+
+    # Usage
+    hit_count = Column(Integer, default=0)
+    last_hit_at = Column(DateTime(timezone=True))
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    def __repr__(self):
+        return f"<AnalysisCacheEntry(cache_key={self.cache_key[:12]}, model={self.model})>"
+
+    def to_dict(self):
+        """Convert cache entry to dictionary"""
+        return {
+            "cache_key": self.cache_key,
+            "model": self.model,
+            "prompt_version": self.prompt_version,
+            "analysis_data": self.analysis_data,
+            "processing_time_ms": self.processing_time_ms,
+            "hit_count": self.hit_count or 0,
+            "last_hit_at": self.last_hit_at.isoformat() if self.last_hit_at else None,
+            "created_at": self.created_at.isoformat() if self.created_at else None
+        }
@@ -0,0 +1,61 @@
+from sqlalchemy import Column, Integer, String, Text, DateTime, JSON, Index, text
+from sqlalchemy.sql import func
+from .database import Base
+
+class AnalysisJob(Base):
+    """Model for queued commit analyses, leased by workers"""
+    __tablename__ = "analysis_jobs"
+
+    # Primary key
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Commit information
+    commit_hash = Column(String(40), nullable=False, index=True)
+    commit_data = Column(JSON, nullable=False)  # Message and files changed, as posted
+
+    # Job status
+    status = Column(String(50), default='queued')  # queued, running, completed, failed
+    priority = Column(String(20), default='interactive')  # interactive, backfill
+    attempts = Column(Integer, default=0)
+    error = Column(Text)
+    analysis_id = Column(Integer)  # Stored AIAnalysis once completed
+
+    # Lease held by the worker processing the job
+    lease_owner = Column(String(100))
+    lease_expires_at = Column(DateTime(timezone=True))
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    queued_at = Column(DateTime(timezone=True))  # Last time the job entered its lane
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    # Workers scan for the oldest queued job of a lane; a commit has at most one active job
+    __table_args__ = (
+        Index("ix_analysis_jobs_status_priority_queued_at", "status", "priority", "queued_at"),
+        Index(
+            "uq_analysis_jobs_active_commit", "commit_hash", unique=True,
+            postgresql_where=text("status IN ('queued', 'running')"),
+            sqlite_where=text("status IN ('queued', 'running')")
+        ),
+    )
+
+    def __repr__(self):
+        return f"<AnalysisJob(id={self.id}, commit_hash={self.commit_hash}, status={self.status})>"
+
+    def to_dict(self):
+        """Convert analysis job to dictionary"""
+        return {
+            "id": self.id,
+            "commit_hash": self.commit_hash,
+            "status": self.status,
+            "priority": self.priority,
+            "attempts": self.attempts or 0,
+            "error": self.error,
+            "analysis_id": self.analysis_id,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "queued_at": self.queued_at.isoformat() if self.queued_at else None,
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None
+        }
@@ -0,0 +1,164 @@
+# Analysis cache for AI Service
+# Reuses analyses for identical prompts: in-process LRU in front of a Postgres table
+import os
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Callable, Dict, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.analysis_cache import AnalysisCacheEntry
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Cache settings
+ANALYSIS_CACHE_ENABLED = os.getenv("ANALYSIS_CACHE_ENABLED", "true").lower() == "true"
+ANALYSIS_CACHE_SIZE = int(os.getenv("ANALYSIS_CACHE_SIZE", "1000"))  # In-process entries
+
+def cache_key(model: str, prompt_version: str, prompt: str) -> str:
+    """Content address of an analysis: sha256 over model, template version and prompt"""
+    digest = hashlib.sha256()
+    for part in (model, prompt_version, prompt):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")  # Separator so ("ab", "c") and ("a", "bc") differ
+    return digest.hexdigest()
+
+class AnalysisCache:
+    """
+    Two-level cache of analysis results keyed by cache_key
+
+    Lookups hit a bounded in-process LRU first and fall back to the
+    analysis_cache table, so results are shared across replicas and survive
+    restarts. Database errors are logged and treated as misses: the cache
+    must never fail an analysis.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session], max_entries: int = ANALYSIS_CACHE_SIZE,
+                 enabled: bool = ANALYSIS_CACHE_ENABLED):
+        self.session_factory = session_factory
+        self.max_entries = max_entries
+        self.enabled = enabled
+        self._entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get_local(self, key: str) -> Optional[Dict]:
+        """Look a key up in the in-process LRU only"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def put_local(self, key: str, entry: Dict):
+        """Store an entry in the in-process LRU"""
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    async def get(self, key: str) -> Optional[Dict]:
+        """
+        Look up a cached analysis
+
+        Returns:
+            {"analysis", "processing_time_ms", "model"} or None on a miss
+        """
+        if not self.enabled:
+            return None
+
+        entry = self.get_local(key)
+        if entry is None:
+            try:
+                entry = await run_in_threadpool(self._load, key)
+            except Exception as e:
+                logger.warning(f"Analysis cache lookup failed: {e}")
+                entry = None
+            if entry is not None:
+                self.put_local(key, entry)
+
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def put(self, key: str, model: str, prompt_version: str, analysis_result: Dict):
+        """Cache an analysis result"""
+        if not self.enabled:
+            return
+
+        entry = {
+            "analysis": analysis_result["analysis"],
+            "processing_time_ms": analysis_result["processing_time_ms"],
+            "model": model
+        }
+        self.put_local(key, entry)
+        try:
+            await run_in_threadpool(self._store, key, model, prompt_version, entry)
+        except Exception as e:
+            logger.warning(f"Failed to store analysis in cache: {e}")
+
+    def clear_local(self):
+        """Drop the in-process entries"""
+        with self._lock:
+            self._entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def stats(self) -> Dict:
+        """Hit/miss counters and LRU size, for health reporting"""
+        return {
+            "enabled": self.enabled,
+            "local_entries": len(self._entries),
+            "max_local_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses
+        }
+
+    def _load(self, key: str) -> Optional[Dict]:
+        db = self.session_factory()
+        try:
+            row = db.query(AnalysisCacheEntry).filter(AnalysisCacheEntry.cache_key == key).first()
+            if row is None:
+                return None
+            row.hit_count = (row.hit_count or 0) + 1
+            row.last_hit_at = datetime.now(timezone.utc)
+            db.commit()
+            return {
+                "analysis": row.analysis_data,
+                "processing_time_ms": row.processing_time_ms,
+                "model": row.model
+            }
+        finally:
+            db.close()
+
+    def _store(self, key: str, model: str, prompt_version: str, entry: Dict):
+        db = self.session_factory()
+        try:
+            db.add(AnalysisCacheEntry(
+                cache_key=key,
+                model=model,
+                prompt_version=prompt_version,
+                analysis_data=entry["analysis"],
+                processing_time_ms=entry["processing_time_ms"],
+                hit_count=0
+            ))
+            db.commit()
+        except IntegrityError:
+            # Another replica cached the same prompt first
+            db.rollback()
+        finally:
+            db.close()
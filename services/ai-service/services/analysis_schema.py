@@ -0,0 +1,149 @@
+# Analysis schema for AI Service
+# JSON schema the model is constrained to, its validation, and an incremental JSON parser
+import json
+from typing import Dict, List, Optional
+
+COMMIT_TYPES = ["feature", "bugfix", "refactor", "docs", "test", "chore"]
+IMPACT_LEVELS = ["high", "medium", "low"]
+COMPLEXITY_LEVELS = ["simple", "moderate", "complex"]
+
+# Sent to Ollama as the "format" of the response, and used to validate it
+ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "commit_type": {"type": "string", "enum": COMMIT_TYPES + ["unknown"]},
+        "impact": {"type": "string", "enum": IMPACT_LEVELS + ["unknown"]},
+        "summary": {"type": "string"},
+        "key_changes": {"type": "array", "items": {"type": "string"}},
+        "potential_risks": {"type": "array", "items": {"type": "string"}},
+        "recommendations": {"type": "array", "items": {"type": "string"}},
+        "complexity": {"type": "string", "enum": COMPLEXITY_LEVELS + ["unknown"]}
+    },
+    "required": [
+        "commit_type", "impact", "summary", "key_changes",
+        "potential_risks", "recommendations", "complexity"
+    ]
+}
+
+# Several commits analyzed in one generation: an array of analyses, each tagged
+# with the number of the commit it answers. Wrapped in an object so the "json"
+# output mode, which only produces objects, can express it too.
+BATCH_ANALYSIS_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "analyses": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"commit": {"type": "integer"}, **ANALYSIS_SCHEMA["properties"]},
+                "required": ["commit"] + ANALYSIS_SCHEMA["required"]
+            }
+        }
+    },
+    "required": ["analyses"]
+}
+
+def field_default(field: str):
+    """Value used for a field the model could not produce"""
+    return [] if ANALYSIS_SCHEMA["properties"][field]["type"] == "array" else "unknown"
+
+def validate_analysis(analysis: Dict) -> Dict[str, str]:
+    """
+    Validate an analysis against ANALYSIS_SCHEMA
+
+    Only the subset of JSON schema used above is supported (string and
+    string-array properties, enums, required).
+
+    Returns:
+        Mapping of invalid field name to the reason; empty if valid
+    """
+    errors = {}
+    for field in ANALYSIS_SCHEMA["required"]:
+        if field not in analysis:
+            errors[field] = "missing"
+
+    for field, spec in ANALYSIS_SCHEMA["properties"].items():
+        if field not in analysis:
+            continue
+        value = analysis[field]
+        if spec["type"] == "string":
+            if not isinstance(value, str):
+                errors[field] = "expected a string"
+            elif "enum" in spec and value not in spec["enum"]:
+                errors[field] = f"expected one of {', '.join(spec['enum'])}"
+        elif spec["type"] == "array":
+            if not isinstance(value, list) or not all(isinstance(item, str) for item in value):
+                errors[field] = "expected a list of strings"
+    return errors
+
+def field_schema(fields: List[str]) -> Dict:
+    """Schema restricted to some fields, for repairing just those"""
+    return {
+        "type": "object",
+        "properties": {field: ANALYSIS_SCHEMA["properties"][field] for field in fields},
+        "required": list(fields)
+    }
+
+class IncrementalJSONParser:
+    """
+    Tracks a streamed JSON object so generation can stop once it is complete
+
+    Text before the opening brace is skipped. Braces and brackets inside
+    strings (including escaped quotes) are ignored, so the object is
+    complete exactly when its closing brace arrives.
+    """
+
+    def __init__(self):
+        self._parts: List[str] = []
+        self._depth = 0
+        self._started = False
+        self._in_string = False
+        self._escaped = False
+        self.complete = False
+
+    def feed(self, text: str) -> bool:
+        """
+        Consume the next piece of generated text
+
+        Returns:
+            True once the top-level object has been closed
+        """
+        for char in text:
+            if self.complete:
+                break
+            if not self._started:
+                if char != "{":
+                    continue
+                self._started = True
+            self._parts.append(char)
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 0:
+                    self.complete = True
+        return self.complete
+
+    def document(self) -> str:
+        """The JSON text consumed so far"""
+        return "".join(self._parts)
+
+    def result(self) -> Optional[Dict]:
+        """The parsed object, or None if it is incomplete or invalid"""
+        if not self.complete:
+            return None
+        try:
+            value = json.loads(self.document())
+        except json.JSONDecodeError:
+            return None
+        return value if isinstance(value, dict) else None
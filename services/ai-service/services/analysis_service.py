@@ -1,2 +1,604 @@
 # Analysis service for AI Service
-# This file will contain AI analysis logic and prompt engineering
+# Runs commit analyses against the model and stores their results
+import os
+import time
+import asyncio
+import hashlib
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, or_, text
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.analysis import AIAnalysis
+from services.analysis_cache import AnalysisCache, cache_key
+from services.diff_analysis import DiffAnalyzer, diff_fingerprint
+from services.ollama_client import OllamaClient, PROMPT_TEMPLATE_VERSION
+from services.model_router import ModelRouter, analysis_confidence
+from services.rules import RuleClassifier, RULES_MODEL, RULES_VERSION, changed_lines
+from services.single_flight import SingleFlight
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Commits with more changed lines than this are never batched with others
+ANALYSIS_BATCH_MAX_LINES = int(os.getenv("ANALYSIS_BATCH_MAX_LINES", "100"))
+# Generations one analyze_many call may have waiting on the model at once
+ANALYZE_BATCH_CONCURRENCY = int(os.getenv("ANALYZE_BATCH_CONCURRENCY", "4"))
+# Seconds between attempts to claim a commit another replica is analyzing
+ANALYSIS_CLAIM_POLL_INTERVAL = float(os.getenv("ANALYSIS_CLAIM_POLL_INTERVAL", "0.5"))
+
+def advisory_lock_id(*parts: str) -> int:
+    """Signed 64-bit Postgres advisory lock id derived from parts"""
+    digest = hashlib.sha256("\0".join(parts).encode("utf-8")).digest()
+    return int.from_bytes(digest[:8], "big", signed=True)
+
+class AnalysisService:
+    """
+    Analyzes commits and persists the results, reusing analyses of identical prompts
+
+    Generations are single-flight: concurrent requests for the same prompt
+    in this process share one model call. analyze_and_store skips commits
+    already stored and claims the commit and prompt version with a Postgres
+    advisory lock before generating, so replicas generate it once; the claim
+    is held on a dedicated autocommit connection, so no transaction stays
+    open while the model runs. Rows are written under a lock on the same
+    (commit, model used, prompt version) the unique index covers. Commits
+    the rule classifier
+    can decide are answered without the model (model_used "rules"), and with
+    a router the rest go through its model tiers. With a diff analyzer,
+    commits whose diffs do not fit the prompt are analyzed from per-chunk
+    summaries of the diff (map-reduce).
+    """
+
+    def __init__(self, ollama_client: OllamaClient, cache: Optional[AnalysisCache] = None,
+                 rules: Optional[RuleClassifier] = None, router: Optional[ModelRouter] = None,
+                 batch_max_lines: int = ANALYSIS_BATCH_MAX_LINES, diff_analyzer: Optional[DiffAnalyzer] = None):
+        self.ollama_client = ollama_client
+        self.cache = cache
+        self.rules = rules
+        self.router = router
+        self.diff_analyzer = diff_analyzer
+        self.batch_max_lines = batch_max_lines
+        self.flights = SingleFlight()
+
+    @property
+    def model_key(self) -> str:
+        """What produces model analyses: the routing policy, or the current model"""
+        return self.router.name if self.router is not None else self.ollama_client.model
+
+    @property
+    def models(self) -> List[str]:
+        """Models whose stored analyses satisfy a request"""
+        return list(self.router.tiers) if self.router is not None else [self.ollama_client.model]
+
+    async def analyze_commit(self, commit_message: str, files_changed: Optional[List[Dict]] = None,
+                             author: Optional[str] = None) -> Dict:
+        """
+        Analyze a commit
+
+        Args:
+            commit_message: The commit message
+            files_changed: List of files changed in the commit
+            author: Commit author, used to recognize bot commits
+
+        Returns:
+            Analysis results dictionary (analysis, processing_time_ms, model_used, cache_hit)
+        """
+        start_time = time.perf_counter()
+        answered, key, prompt = await self._answer_without_model(commit_message, files_changed, author, start_time)
+        if answered is not None:
+            return answered
+        return await self._generate_commit(
+            key, prompt, changed_lines(files_changed), self._diff(commit_message, files_changed)
+        )
+
+    async def analyze_many(self, commits: List[Dict],
+                           concurrency: int = ANALYZE_BATCH_CONCURRENCY) -> AsyncIterator[Tuple[int, Union[Dict, Exception]]]:
+        """
+        Analyze many commits, yielding each result as soon as it is ready
+
+        Rule-based and cached answers are yielded first, without waiting for
+        any generation. The remaining commits are generated at most
+        `concurrency` at a time, so one bulk caller cannot fill the model
+        client's queue ahead of everyone else; identical prompts share a
+        generation. Closing the iterator cancels the outstanding work.
+
+        Args:
+            commits: Dicts with message, files_changed and author
+            concurrency: Generations this call may have outstanding at once
+
+        Yields:
+            (index in commits, analyze_commit's result or the exception it raised)
+        """
+        pending = []
+        for index, commit in enumerate(commits):
+            files_changed = commit.get("files_changed") or []
+            try:
+                answered, key, prompt = await self._answer_without_model(
+                    commit.get("message", ""), files_changed, commit.get("author"), time.perf_counter()
+                )
+            except Exception as e:
+                yield index, e
+                continue
+            if answered is not None:
+                yield index, answered
+            else:
+                pending.append((
+                    index, key, prompt, changed_lines(files_changed),
+                    self._diff(commit.get("message", ""), files_changed)
+                ))
+
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+
+        async def run(index: int, key: str, prompt: str, lines: int,
+                      diff: Optional[Tuple[str, List[Dict]]]) -> Tuple[int, Union[Dict, Exception]]:
+            async with semaphore:
+                try:
+                    return index, await self._generate_commit(key, prompt, lines, diff)
+                except Exception as e:
+                    return index, e
+
+        tasks = [asyncio.ensure_future(run(*item)) for item in pending]
+        try:
+            for finished in asyncio.as_completed(tasks):
+                yield await finished
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _answer_without_model(self, commit_message: str, files_changed: Optional[List[Dict]],
+                                    author: Optional[str], start_time: float) -> Tuple[Optional[Dict], str, str]:
+        """Rule-based or cached result of a commit, if any, and the cache key and prompt to generate it"""
+        ruled = self._classify(commit_message, files_changed, author, start_time)
+        if ruled is not None:
+            return ruled, "", ""
+
+        prompt, key = self._prompt_key(commit_message, files_changed)
+        cached = await self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            logger.info(f"Analysis cache hit for commit: {commit_message[:50]}")
+            return {
+                "analysis": cached["analysis"],
+                # Time spent serving this request, not the original generation
+                "processing_time_ms": int((time.perf_counter() - start_time) * 1000),
+                "model_used": cached["model"],
+                "cache_hit": True
+            }, key, prompt
+        return None, key, prompt
+
+    def _prompt_key(self, commit_message: str, files_changed: Optional[List[Dict]]) -> Tuple[str, str]:
+        """Analysis prompt of a commit and its cache key"""
+        prompt = self.ollama_client.create_analysis_prompt(commit_message, files_changed)
+        if self._diff(commit_message, files_changed) is None:
+            return prompt, cache_key(self.model_key, PROMPT_TEMPLATE_VERSION, prompt)
+        # The prompt only lists the files; the diff it is analyzed with must be part of the key
+        keyed = f"{prompt}\0diff:{diff_fingerprint(files_changed)}"
+        return prompt, cache_key(self.model_key, PROMPT_TEMPLATE_VERSION, keyed)
+
+    def _diff(self, commit_message: str, files_changed: Optional[List[Dict]]) -> Optional[Tuple[str, List[Dict]]]:
+        """The commit to summarize by map-reduce, if its diffs do not fit the prompt"""
+        if self.diff_analyzer is None or not self.diff_analyzer.applies(commit_message, files_changed):
+            return None
+        return commit_message, files_changed
+
+    async def _generate_commit(self, key: str, prompt: str, lines: int,
+                               diff: Optional[Tuple[str, List[Dict]]] = None) -> Dict:
+        if self.cache is None:
+            result, _ = await self.flights.do(key, lambda: self._run_prompt(prompt, lines, diff))
+        else:
+            result, _ = await self.flights.do(key, lambda: self._generate(key, prompt, lines, diff))
+        return {**result, "cache_hit": False}
+
+    async def stream_commit(self, commit_message: str, files_changed: Optional[List[Dict]] = None,
+                            author: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Analyze a commit, yielding model tokens as they are generated
+
+        Args:
+            commit_message: The commit message
+            files_changed: List of files changed in the commit
+            author: Commit author, used to recognize bot commits
+
+        Yields:
+            {"type": "token", "text": ...} events, then one {"type": "result", ...}
+            event shaped like analyze_commit's result. A cached or rule-based
+            analysis is returned as a single result event.
+        """
+        start_time = time.perf_counter()
+        ruled = self._classify(commit_message, files_changed, author, start_time)
+        if ruled is not None:
+            yield {"type": "result", **ruled}
+            return
+
+        prompt, key = self._prompt_key(commit_message, files_changed)
+        cached = await self.cache.get(key) if self.cache is not None else None
+        if cached is not None:
+            yield {
+                "type": "result",
+                "analysis": cached["analysis"],
+                "processing_time_ms": int((time.perf_counter() - start_time) * 1000),
+                "model_used": cached["model"],
+                "cache_hit": True
+            }
+            return
+
+        # Streams are not coalesced: each caller watches its own generation
+        map_reduce = None
+        diff = self._diff(commit_message, files_changed)
+        if diff is not None:
+            prompt, map_reduce = await self.diff_analyzer.reduce_prompt(*diff, model=self._map_model)
+        if self.router is not None:
+            events = self.router.stream(self.ollama_client, prompt, changed_lines(files_changed))
+        else:
+            events = self.ollama_client.stream_analysis(prompt)
+        async for event in events:
+            if event["type"] == "result":
+                if map_reduce is not None:
+                    event = self._with_map_reduce(event, map_reduce)
+                if self.cache is not None and "parse_error" not in event["analysis"]:
+                    await self.cache.put(key, event["model_used"], PROMPT_TEMPLATE_VERSION, event)
+                event = {**event, "cache_hit": False}
+            yield event
+
+    def _classify(self, commit_message: str, files_changed: Optional[List[Dict]], author: Optional[str],
+                  start_time: float) -> Optional[Dict]:
+        """Rule-based result for a trivially classifiable commit, or None"""
+        if self.rules is None:
+            return None
+        analysis = self.rules.classify(commit_message, files_changed, author)
+        if analysis is None:
+            return None
+        logger.info(f"Classified commit by rules: {commit_message[:50]}")
+        return {
+            "analysis": analysis,
+            "processing_time_ms": int((time.perf_counter() - start_time) * 1000),
+            "model_used": RULES_MODEL,
+            "prompt_version": RULES_VERSION,
+            "cache_hit": False
+        }
+
+    @property
+    def _map_model(self) -> str:
+        """Model summarizing diff chunks: the smallest tier with a router"""
+        return self.router.tiers[0] if self.router is not None else self.ollama_client.model
+
+    @staticmethod
+    def _with_map_reduce(result: Dict, map_reduce: Dict) -> Dict:
+        """Account the map step in a reduce step's result"""
+        return {
+            **result,
+            "processing_time_ms": result["processing_time_ms"] + map_reduce["map_ms"],
+            "routing": {**(result.get("routing") or {}), "map_reduce": map_reduce}
+        }
+
+    async def _run_prompt(self, prompt: str, lines: int, diff: Optional[Tuple[str, List[Dict]]] = None) -> Dict:
+        map_reduce = None
+        if diff is not None:
+            prompt, map_reduce = await self.diff_analyzer.reduce_prompt(*diff, model=self._map_model)
+        if self.router is not None:
+            result = await self.router.analyze(self.ollama_client, prompt, lines)
+        else:
+            result = await self.ollama_client.analyze_prompt(prompt)
+        return result if map_reduce is None else self._with_map_reduce(result, map_reduce)
+
+    async def _generate(self, key: str, prompt: str, lines: int,
+                        diff: Optional[Tuple[str, List[Dict]]] = None) -> Dict:
+        result = await self._run_prompt(prompt, lines, diff)
+        # Unparseable answers are not worth repeating
+        if "parse_error" not in result["analysis"]:
+            await self.cache.put(key, result["model_used"], PROMPT_TEMPLATE_VERSION, result)
+        return result
+
+    async def analyze_and_store(self, session_factory: Callable[[], Session], commit_hash: str,
+                                commit_message: str, files_changed: Optional[List[Dict]] = None,
+                                author: Optional[str] = None) -> Tuple[Dict, bool]:
+        """
+        Analyze a commit and store the result, at most once per model and prompt version
+
+        Args:
+            session_factory: Creates the database session holding the lock
+            commit_hash: Commit to analyze
+            commit_message: The commit message
+            files_changed: List of files changed in the commit
+            author: Commit author, used to recognize bot commits
+
+        Returns:
+            (analysis dict, created) where created is False if an existing
+            analysis was returned instead of a new one
+        """
+        ruled = self._classify(commit_message, files_changed, author, time.perf_counter())
+        return await self._store_commit(session_factory, commit_hash, commit_message, files_changed, ruled)
+
+    async def _store_commit(self, session_factory: Callable[[], Session], commit_hash: str,
+                            commit_message: str, files_changed: Optional[List[Dict]],
+                            ruled: Optional[Dict]) -> Tuple[Dict, bool]:
+        if ruled is not None:
+            model, models, version = RULES_MODEL, [RULES_MODEL], RULES_VERSION
+        else:
+            model, models, version = self.model_key, self.models, PROMPT_TEMPLATE_VERSION
+
+        async def generate() -> Dict:
+            return ruled if ruled is not None else await self.analyze_commit(commit_message, files_changed)
+
+        key = ("store", commit_hash, model, version)
+        (analysis, created), shared = await self.flights.do(
+            key, lambda: self._analyze_and_store(session_factory, commit_hash, models, version, generate)
+        )
+        # Only the caller that ran the generation reports the row as new
+        return analysis, created and not shared
+
+    async def analyze_and_store_batch(
+            self, session_factory: Callable[[], Session], commits: List[Tuple[str, Dict]]
+    ) -> List[Union[Tuple[Dict, bool], Exception]]:
+        """
+        Analyze and store several commits, sharing one generation among the small ones
+
+        Commits decided by rules, already stored, cached, larger than
+        batch_max_lines or needing map-reduce go through analyze_and_store
+        as usual. The rest are
+        analyzed together in one prompt (with a router, by its smallest
+        tier); any whose entry is missing, invalid or would be escalated is
+        analyzed again on its own.
+
+        Args:
+            session_factory: Creates database sessions
+            commits: (commit_hash, commit_data) pairs; commit_data holds
+                message, files_changed and author
+
+        Returns:
+            Per commit, in order: (analysis dict, created) as analyze_and_store
+            returns it, or the exception its analysis raised
+        """
+        singles: List[Tuple[int, Optional[Dict]]] = []
+        candidates: List[Tuple[int, str]] = []
+        for index, (commit_hash, commit_data) in enumerate(commits):
+            files_changed = commit_data.get("files_changed") or []
+            ruled = self._classify(
+                commit_data.get("message", ""), files_changed, commit_data.get("author"), time.perf_counter()
+            )
+            if ruled is not None or changed_lines(files_changed) > self.batch_max_lines \
+                    or self._diff(commit_data.get("message", ""), files_changed) is not None:
+                singles.append((index, ruled))
+            else:
+                prompt = self.ollama_client.create_analysis_prompt(commit_data.get("message", ""), files_changed)
+                candidates.append((index, prompt))
+
+        # Stored or cached commits cost nothing on their own; only batch real generations
+        stored = await run_in_threadpool(
+            self._stored_hashes, session_factory, [commits[index][0] for index, _ in candidates]
+        )
+        batch: List[Tuple[int, str]] = []
+        for index, prompt in candidates:
+            key = cache_key(self.model_key, PROMPT_TEMPLATE_VERSION, prompt)
+            if commits[index][0] in stored or (self.cache is not None and await self.cache.get(key) is not None):
+                singles.append((index, None))
+            else:
+                batch.append((index, prompt))
+
+        batched: Dict[int, Dict] = {}
+        if len(batch) > 1:
+            model = self.router.tiers[0] if self.router is not None else self.ollama_client.model
+            try:
+                answers = await self.ollama_client.analyze_batch([prompt for _, prompt in batch], model)
+            except Exception as e:
+                logger.warning(f"Batch analysis of {len(batch)} commits failed, analyzing them one by one: {e}")
+                answers = [None] * len(batch)
+            for (index, prompt), answer in zip(batch, answers):
+                if answer is None or (
+                    self.router is not None and self.router.escalation_reason(answer, analysis_confidence(answer))
+                ):
+                    singles.append((index, None))
+                    continue
+                answer = {**answer, "routing": {"policy": "batch", "batch_size": answer["batch_size"]}}
+                if self.cache is not None:
+                    await self.cache.put(
+                        cache_key(self.model_key, PROMPT_TEMPLATE_VERSION, prompt),
+                        answer["model_used"], PROMPT_TEMPLATE_VERSION, answer
+                    )
+                batched[index] = answer
+        else:
+            singles.extend((index, None) for index, _ in batch)
+
+        async def run(index: int, ruled: Optional[Dict]) -> Tuple[Dict, bool]:
+            commit_hash, commit_data = commits[index]
+            if index not in batched:
+                return await self._store_commit(
+                    session_factory, commit_hash, commit_data.get("message", ""),
+                    commit_data.get("files_changed") or [], ruled
+                )
+
+            async def generate() -> Dict:
+                return batched[index]
+
+            key = ("store", commit_hash, self.model_key, PROMPT_TEMPLATE_VERSION)
+            (analysis, created), shared = await self.flights.do(key, lambda: self._analyze_and_store(
+                session_factory, commit_hash, self.models, PROMPT_TEMPLATE_VERSION, generate
+            ))
+            return analysis, created and not shared
+
+        # One at a time, so a worker still runs at most one generation (a fallback) at once
+        results: List[Union[Tuple[Dict, bool], Exception]] = [None] * len(commits)
+        for index, ruled in sorted([(index, None) for index in batched] + singles, key=lambda item: item[0]):
+            try:
+                results[index] = await run(index, ruled)
+            except Exception as e:
+                results[index] = e
+        return results
+
+    def _stored_hashes(self, session_factory: Callable[[], Session], commit_hashes: List[str]) -> set:
+        """Commits among commit_hashes that already have a model analysis for the current prompt version"""
+        if not commit_hashes:
+            return set()
+        db = session_factory()
+        try:
+            rows = db.query(AIAnalysis.commit_hash).filter(
+                AIAnalysis.commit_hash.in_(commit_hashes),
+                AIAnalysis.model_used.in_(self.models),
+                AIAnalysis.prompt_version == PROMPT_TEMPLATE_VERSION
+            ).all()
+            return {row[0] for row in rows}
+        finally:
+            db.close()
+
+    async def _analyze_and_store(self, session_factory: Callable[[], Session], commit_hash: str,
+                                 models: List[str], version: str,
+                                 generate: Callable[[], Awaitable[Dict]]) -> Tuple[Dict, bool]:
+        # No session is held while generating, which can take minutes
+        existing = await run_in_threadpool(self._existing_analysis, session_factory, commit_hash, models, version)
+        if existing is not None:
+            return existing, False
+
+        async with self._claim(session_factory, commit_hash, version):
+            # Another replica may have stored the commit while this one waited for the claim
+            existing = await run_in_threadpool(self._existing_analysis, session_factory, commit_hash, models, version)
+            if existing is not None:
+                return existing, False
+
+            result = await generate()
+            return await self._store_result(session_factory, commit_hash, models, version, result)
+
+    async def _store_result(self, session_factory: Callable[[], Session], commit_hash: str, models: List[str],
+                            version: str, result: Dict) -> Tuple[Dict, bool]:
+        model_used = result["model_used"]
+        stored_version = result.get("prompt_version", version)
+        db = session_factory()
+        try:
+            # Writers that do not claim (or lost their claim) may have stored the commit meanwhile
+            await run_in_threadpool(self._lock_analysis, db, commit_hash, model_used, stored_version)
+            existing = await run_in_threadpool(self._find_analysis, db, commit_hash, models, version)
+            if existing is not None:
+                await run_in_threadpool(db.rollback)
+                return existing, False
+            try:
+                analysis = await run_in_threadpool(self.store_analysis, db, commit_hash, result)
+            except IntegrityError:
+                # Stored by a writer that does not take the lock
+                await run_in_threadpool(db.rollback)
+                existing = await run_in_threadpool(
+                    self._find_analysis, db, commit_hash, [model_used], stored_version
+                )
+                if existing is None:
+                    raise
+                return existing, False
+            return analysis.to_dict(), True
+        finally:
+            # Closing rolls back any open transaction, releasing the lock on failure too
+            db.close()
+
+    def _existing_analysis(self, session_factory: Callable[[], Session], commit_hash: str, models: List[str],
+                           version: str) -> Optional[Dict]:
+        db = session_factory()
+        try:
+            return self._find_analysis(db, commit_hash, models, version)
+        finally:
+            db.close()
+
+    @asynccontextmanager
+    async def _claim(self, session_factory: Callable[[], Session], commit_hash: str, version: str):
+        """
+        Hold a session-level advisory lock on a commit and prompt version while generating
+
+        The lock lives on its own autocommit connection, so it spans the
+        generation without an open transaction, and waiters poll for it
+        rather than tie up a thread.
+        """
+        db = session_factory()
+        try:
+            bind = db.get_bind()
+        finally:
+            db.close()
+        # Advisory locks are Postgres only; elsewhere only this process's single-flight applies
+        if not self._claims_supported(bind):
+            yield
+            return
+
+        lock_id = advisory_lock_id("claim", commit_hash, version)
+        connection = await run_in_threadpool(self._claim_connection, bind)
+        try:
+            while not await run_in_threadpool(self._try_claim, connection, lock_id):
+                await asyncio.sleep(ANALYSIS_CLAIM_POLL_INTERVAL)
+            try:
+                yield
+            finally:
+                await run_in_threadpool(self._release_claim, connection, lock_id)
+        finally:
+            await run_in_threadpool(connection.close)
+
+    def _claims_supported(self, bind) -> bool:
+        return bind.dialect.name == "postgresql"
+
+    def _claim_connection(self, bind):
+        return bind.connect().execution_options(isolation_level="AUTOCOMMIT")
+
+    def _try_claim(self, connection, lock_id: int) -> bool:
+        return bool(connection.execute(text("SELECT pg_try_advisory_lock(:lock_id)"), {"lock_id": lock_id}).scalar())
+
+    def _release_claim(self, connection, lock_id: int):
+        try:
+            connection.execute(text("SELECT pg_advisory_unlock(:lock_id)"), {"lock_id": lock_id})
+        except Exception as e:
+            # A pooled connection must not keep the lock: drop it instead of returning it
+            logger.warning(f"Failed to release analysis claim, discarding its connection: {e}")
+            connection.invalidate()
+
+    def _lock_analysis(self, db: Session, commit_hash: str, model_used: str, version: str):
+        # Advisory locks are Postgres only; elsewhere the unique constraint still holds
+        if db.get_bind().dialect.name != "postgresql":
+            return
+        lock_id = advisory_lock_id(commit_hash, model_used, version)
+        db.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": lock_id})
+
+    def _find_analysis(self, db: Session, commit_hash: str, models: List[str], version: str) -> Optional[Dict]:
+        analysis = db.query(AIAnalysis).filter(
+            AIAnalysis.commit_hash == commit_hash,
+            AIAnalysis.model_used.in_(models),
+            AIAnalysis.prompt_version == version
+        ).first()
+        return analysis.to_dict() if analysis else None
+
+    def get_analysis(self, db: Session, commit_hash: str) -> Optional[AIAnalysis]:
+        """Get the newest analysis of a commit by the current models and prompt version, if any"""
+        return db.query(AIAnalysis).filter(
+            AIAnalysis.commit_hash == commit_hash,
+            or_(
+                and_(AIAnalysis.model_used.in_(self.models), AIAnalysis.prompt_version == PROMPT_TEMPLATE_VERSION),
+                and_(AIAnalysis.model_used == RULES_MODEL, AIAnalysis.prompt_version == RULES_VERSION)
+            )
+        ).order_by(AIAnalysis.created_at.desc(), AIAnalysis.id.desc()).first()
+
+    def store_analysis(self, db: Session, commit_hash: str, analysis_result: Dict) -> AIAnalysis:
+        """
+        Store an analysis result
+
+        Args:
+            db: Database session
+            commit_hash: Analyzed commit
+            analysis_result: Result returned by analyze_commit
+
+        Returns:
+            The stored AIAnalysis row
+        """
+        new_analysis = AIAnalysis(
+            commit_hash=commit_hash,
+            analysis_type="commit_analysis",
+            analysis_data=analysis_result["analysis"],
+            model_used=analysis_result["model_used"],
+            prompt_version=analysis_result.get("prompt_version", PROMPT_TEMPLATE_VERSION),
+            processing_time_ms=analysis_result["processing_time_ms"],
+            routing=analysis_result.get("routing")
+        )
+
+        db.add(new_analysis)
+        db.commit()
+        db.refresh(new_analysis)
+
+        logger.info(f"Analysis created and stored for commit: {commit_hash}")
+        return new_analysis
@@ -0,0 +1,183 @@
+# Adaptive concurrency limiter for AI Service
+# Finds how many generations Ollama can run at once by watching their latency
+import asyncio
+import os
+import logging
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Limiter settings
+OLLAMA_CONCURRENCY_INITIAL = int(os.getenv("OLLAMA_CONCURRENCY_INITIAL", "4"))
+OLLAMA_CONCURRENCY_MIN = int(os.getenv("OLLAMA_CONCURRENCY_MIN", "1"))
+OLLAMA_CONCURRENCY_MAX = int(os.getenv("OLLAMA_CONCURRENCY_MAX", "8"))  # Keep at or below OLLAMA_MAX_CONNECTIONS
+# A generation is a congestion signal when its latency exceeds the baseline by this factor
+OLLAMA_LATENCY_TOLERANCE = float(os.getenv("OLLAMA_LATENCY_TOLERANCE", "2.0"))
+# Multiplicative decrease applied to the limit on congestion
+OLLAMA_CONCURRENCY_BACKOFF = float(os.getenv("OLLAMA_CONCURRENCY_BACKOFF", "0.75"))
+# How fast a baseline follows latencies above it (so a model that slows down for good re-baselines)
+BASELINE_DRIFT = 0.01
+# Smallest prompt-size bucket, in estimated tokens; buckets double from here
+WORKLOAD_MIN_TOKENS = 256
+
+def workload(model: str, prompt_tokens: int) -> str:
+    """
+    Name of the baseline a generation's latency is compared with
+
+    Time to first token grows with the model's size and the prompt's length,
+    so each model and prompt-size bucket (powers of two) has its own.
+    """
+    bucket = WORKLOAD_MIN_TOKENS
+    while bucket < prompt_tokens:
+        bucket *= 2
+    return f"{model}/{bucket}"
+
+class Permit:
+    """A granted concurrency slot; report the request's latency or overload through it"""
+
+    def __init__(self, limiter: "AdaptiveConcurrencyLimiter", workload: str = ""):
+        self.limiter = limiter
+        self.workload = workload
+        self.epoch = limiter.epoch
+        self.saturated = limiter.in_flight >= int(limiter.limit) or bool(limiter._waiters)
+        self.reported = False
+
+    def record(self, latency_ms: Optional[float]):
+        """Report the latency the limiter adapts to (time to first token)"""
+        if latency_ms is None or self.reported:
+            return
+        self.reported = True
+        self.limiter._on_sample(self, latency_ms)
+
+    def overload(self):
+        """Report a request that timed out or was rejected by the model server"""
+        if self.reported:
+            return
+        self.reported = True
+        self.limiter._on_overload(self)
+
+class AdaptiveConcurrencyLimiter:
+    """
+    AIMD limit on concurrent generations
+
+    The lowest latency seen for a workload (model and prompt size) is its
+    baseline on an unloaded server. While requests keep the limit saturated
+    and their latency stays within tolerance of their workload's baseline, the limit grows by one per limit's worth of
+    requests. A latency above tolerance, a timeout or a 5xx cuts the limit
+    by the backoff factor, at most once per generation of in-flight
+    requests, so one burst of slow responses does not collapse it to the
+    minimum. Requests over the limit wait in FIFO order.
+    """
+
+    def __init__(self, initial_limit: int = OLLAMA_CONCURRENCY_INITIAL,
+                 min_limit: int = OLLAMA_CONCURRENCY_MIN,
+                 max_limit: int = OLLAMA_CONCURRENCY_MAX,
+                 tolerance: float = OLLAMA_LATENCY_TOLERANCE,
+                 backoff: float = OLLAMA_CONCURRENCY_BACKOFF):
+        if min_limit < 1 or max_limit < min_limit:
+            raise ValueError("Concurrency limits must satisfy 1 <= min_limit <= max_limit")
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.limit = float(max(min_limit, min(max_limit, initial_limit)))
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.baselines: Dict[str, float] = {}
+        self.in_flight = 0
+        self.epoch = 0
+        self.increases = 0
+        self.decreases = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+
+    @property
+    def queued(self) -> int:
+        return sum(1 for waiter in self._waiters if not waiter.done())
+
+    @asynccontextmanager
+    async def slot(self, workload: str = "") -> AsyncIterator[Permit]:
+        """Wait for a slot under the current limit and hold it for the block"""
+        await self._acquire()
+        try:
+            yield Permit(self, workload)
+        finally:
+            self._release()
+
+    def status(self) -> Dict:
+        """Current limit, load and baseline, for health reporting"""
+        return {
+            "limit": int(self.limit),
+            "in_flight": self.in_flight,
+            "queued": self.queued,
+            "baselines_ms": {name: round(baseline, 1) for name, baseline in sorted(self.baselines.items())},
+            "increases": self.increases,
+            "decreases": self.decreases
+        }
+
+    async def _acquire(self):
+        if self.in_flight < int(self.limit) and not self._waiters:
+            self.in_flight += 1
+            return
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                # The slot was granted just as the caller gave up
+                self._release()
+            else:
+                self._waiters.remove(waiter)
+            raise
+
+    def _release(self):
+        self.in_flight -= 1
+        self._wake()
+
+    def _wake(self):
+        # Waiters are granted their slot here, so in_flight never overshoots the limit
+        while self._waiters and self.in_flight < int(self.limit):
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _on_sample(self, permit: Permit, latency_ms: float):
+        baseline = self.baselines.get(permit.workload)
+        if baseline is None or latency_ms < baseline:
+            baseline = latency_ms
+        else:
+            baseline += BASELINE_DRIFT * (latency_ms - baseline)
+        self.baselines[permit.workload] = baseline
+
+        if latency_ms > baseline * self.tolerance:
+            self._decrease(
+                permit, f"latency {latency_ms:.0f}ms over baseline {baseline:.0f}ms of {permit.workload or 'requests'}"
+            )
+        elif permit.saturated and self.limit < self.max_limit:
+            # Additive increase: about +1 once every request in a full window succeeded
+            previous = int(self.limit)
+            self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            if int(self.limit) > previous:
+                self.increases += 1
+                self._wake()
+
+    def _on_overload(self, permit: Permit):
+        self._decrease(permit, "request timed out or was rejected")
+
+    def _decrease(self, permit: Permit, reason: str):
+        # Requests started before the last decrease saw the old load; ignore them
+        if permit.epoch != self.epoch:
+            return
+        self.epoch += 1
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        if int(self.limit) < previous:
+            self.decreases += 1
+            logger.info(f"Lowering Ollama concurrency from {previous} to {int(self.limit)}: {reason}")
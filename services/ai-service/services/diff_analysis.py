@@ -0,0 +1,319 @@
+# Map-reduce diff analysis for AI Service
+# Summarizes diffs too large for one prompt chunk by chunk, for the final analysis to reduce
+import os
+import time
+import asyncio
+import hashlib
+import logging
+import threading
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from dotenv import load_dotenv
+
+from services.analysis_cache import AnalysisCache, cache_key
+from services.analysis_schema import IncrementalJSONParser
+from services.ollama_client import ANALYSIS_OPTIONS, OLLAMA_FORMAT, OllamaClient
+from services.prompt_builder import CHARS_PER_TOKEN, PromptBuilder, churn, estimate_tokens
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Map-reduce settings
+DIFF_CHUNK_TOKENS = int(os.getenv("DIFF_CHUNK_TOKENS", "1024"))  # Estimated tokens of diff per map prompt
+DIFF_MAP_CONCURRENCY = int(os.getenv("DIFF_MAP_CONCURRENCY", "4"))  # Chunks of one commit summarized at once
+DIFF_MAX_CHUNKS = int(os.getenv("DIFF_MAX_CHUNKS", "32"))  # Larger diffs summarize only their biggest files
+DIFF_SUMMARY_MAX_TOKENS = int(os.getenv("DIFF_SUMMARY_MAX_TOKENS", "200"))  # Token cap per chunk summary
+
+# Bump whenever CHUNK_SYSTEM_PROMPT or chunking changes, so cached chunk summaries are not reused
+CHUNK_PROMPT_VERSION = "chunk-1"
+# Rounds of summarizing summaries before the rest are cut to fit
+MAX_REDUCE_ROUNDS = 4
+# Stands in for a part of the diff no model could summarize
+UNSUMMARIZED = "(this part of the diff could not be summarized)"
+
+CHUNK_SYSTEM_PROMPT = """You are an expert code reviewer. You are given one part of a larger commit diff, or summaries of consecutive parts of it. Summarize what it changes.
+
+Provide the summary in the following JSON format:
+{
+    "summary": "One or two sentences on what this part of the diff does",
+    "key_changes": ["Notable changes in this part"],
+    "potential_risks": ["Risks introduced by this part, if any"]
+}
+
+Only describe what you are given. Be concise.
+"""
+
+CHUNK_SUMMARY_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "summary": {"type": "string"},
+        "key_changes": {"type": "array", "items": {"type": "string"}},
+        "potential_risks": {"type": "array", "items": {"type": "string"}}
+    },
+    "required": ["summary", "key_changes", "potential_risks"]
+}
+
+def has_patches(files_changed: Optional[List[Dict]]) -> bool:
+    return any(f.get("patch") for f in files_changed or [])
+
+def diff_fingerprint(files_changed: Optional[List[Dict]]) -> str:
+    """Digest of a commit's diffs, for cache keys of analyses that read them"""
+    digest = hashlib.sha256()
+    for file_info in files_changed or []:
+        if file_info.get("patch"):
+            digest.update(f"{file_info.get('filename', '')}\0{file_info['patch']}\0".encode("utf-8"))
+    return digest.hexdigest()
+
+def split_hunks(patch: str) -> List[str]:
+    """Split a unified diff into hunks, each starting at its @@ header"""
+    hunks: List[str] = []
+    for line in patch.splitlines(keepends=True):
+        if line.startswith("@@") or not hunks:
+            hunks.append(line)
+        else:
+            hunks[-1] += line
+    return [hunk if hunk.endswith("\n") else hunk + "\n" for hunk in hunks]
+
+def split_oversized(hunk: str, max_tokens: int) -> List[str]:
+    """Split a hunk larger than max_tokens on line boundaries, repeating its @@ header"""
+    if estimate_tokens(hunk) <= max_tokens:
+        return [hunk]
+    max_chars = int(max_tokens * CHARS_PER_TOKEN)
+    lines = hunk.splitlines(keepends=True)
+    header = lines[0] if lines[0].startswith("@@") else ""
+    pieces: List[str] = []
+    current = header
+    for line in lines[1:] if header else lines:
+        # Minified files can have single lines longer than a chunk
+        line = line if len(line) <= max_chars // 2 else line[:max_chars // 2] + "...\n"
+        if current != header and estimate_tokens(current + line) > max_tokens:
+            pieces.append(current)
+            current = header
+        current += line
+    if current != header:
+        pieces.append(current)
+    return pieces
+
+def chunk_diff(files_changed: List[Dict], max_tokens: int) -> List[str]:
+    """
+    Pack a commit's diffs into chunks of at most max_tokens
+
+    Chunks are hunk-aligned: a hunk is only split when it alone exceeds the
+    limit. Small files share a chunk; every file's hunks are introduced by
+    its name. Files with the most churn come first.
+    """
+    ranked = sorted(
+        (f for f in files_changed if f.get("patch")), key=lambda f: (-churn(f), f.get("filename", ""))
+    )
+    chunks: List[str] = []
+    current = ""
+    current_file: Optional[str] = None
+    for file_info in ranked:
+        filename = file_info.get("filename", "unknown")
+        header = f"--- {filename} ({file_info.get('status', 'modified')})\n"
+        for hunk in split_hunks(file_info["patch"]):
+            for piece in split_oversized(hunk, max_tokens - estimate_tokens(header)):
+                block = piece if current and current_file == filename else header + piece
+                if current and estimate_tokens(current + block) > max_tokens:
+                    chunks.append(current)
+                    current = ""
+                    block = header + piece
+                current += block
+                current_file = filename
+    if current:
+        chunks.append(current)
+    return chunks
+
+def format_summary(summary: Dict) -> str:
+    """One line of prompt text for a chunk summary"""
+    text = str(summary.get("summary", "")).strip()
+    if summary.get("key_changes"):
+        text += f" Changes: {'; '.join(str(change) for change in summary['key_changes'])}."
+    if summary.get("potential_risks"):
+        text += f" Risks: {'; '.join(str(risk) for risk in summary['potential_risks'])}."
+    return " ".join(text.split())
+
+class DiffAnalyzer:
+    """
+    Map-reduce analysis of diffs too large for one prompt
+
+    The map step splits the diffs into hunk-aligned chunks and summarizes
+    them concurrently; the generations spread over the Ollama backends
+    under the client's adaptive concurrency limit. Chunk summaries are
+    cached by content, so a re-analysis (another model tier, a new prompt
+    version of the final analysis, a retried job) only pays for new chunks.
+    If the summaries do not fit the reduce prompt they are summarized again
+    in groups. A chunk the requested model cannot summarize is retried with
+    the current model and otherwise left as a placeholder. The reduce step
+    is the regular analysis prompt with the summaries in place of the diff,
+    so its answer follows the analysis schema like any other.
+    """
+
+    def __init__(self, ollama_client: OllamaClient, cache: Optional[AnalysisCache] = None,
+                 chunk_tokens: int = DIFF_CHUNK_TOKENS, concurrency: int = DIFF_MAP_CONCURRENCY,
+                 max_chunks: int = DIFF_MAX_CHUNKS):
+        self.ollama_client = ollama_client
+        self.cache = cache
+        self.chunk_tokens = chunk_tokens
+        self.concurrency = concurrency
+        self.max_chunks = max_chunks
+        self.commits = 0
+        self.chunks = 0
+        self.cached_chunks = 0
+        self._lock = threading.Lock()
+
+    def applies(self, commit_message: str, files_changed: Optional[List[Dict]]) -> bool:
+        """Whether a commit has diffs the regular prompt cannot hold"""
+        return has_patches(files_changed) and not self.ollama_client.prompt_builder.includes_diff(
+            commit_message, files_changed
+        )
+
+    async def reduce_prompt(self, commit_message: str, files_changed: List[Dict],
+                            model: Optional[str] = None) -> Tuple[str, Dict]:
+        """
+        Summarize a commit's diffs and build the analysis prompt around the summaries
+
+        Args:
+            commit_message: The commit message
+            files_changed: Changed files, with their "patch"
+            model: Model for the chunk summaries (default: the current model)
+
+        Returns:
+            (prompt, stats) where stats counts the chunks, cached chunks,
+            chunks left out, reduce rounds and map time
+        """
+        start_time = time.perf_counter()
+        model = self._map_model(model)
+        chunks = chunk_diff(files_changed, self.chunk_tokens)
+        skipped = max(0, len(chunks) - self.max_chunks)
+        chunks = chunks[:self.max_chunks]
+
+        semaphore = asyncio.Semaphore(max(1, self.concurrency))
+
+        async def summarize(chunk: str) -> Tuple[str, bool]:
+            async with semaphore:
+                return await self._summarize(chunk, model)
+
+        mapped = await asyncio.gather(*(summarize(chunk) for chunk in chunks))
+        summaries = [summary for summary, _ in mapped]
+        cached = sum(1 for _, hit in mapped if hit)
+
+        # Half of the budget for the file listing, half for the summaries
+        max_tokens = self.ollama_client.prompt_builder.max_tokens
+        summary_budget = max_tokens // 2
+        summaries, rounds = await self._collapse(summaries, summary_budget, model, semaphore)
+
+        stripped = [{key: value for key, value in f.items() if key != "patch"} for f in files_changed]
+        prompt = PromptBuilder(max_tokens - summary_budget).build(commit_message, stripped)
+        prompt += "\nSummaries of the diff, part by part:\n"
+        prompt += "".join(f"- Part {number}: {summary}\n" for number, summary in enumerate(summaries, start=1))
+        if skipped:
+            prompt += f"- {skipped} more parts of the diff (smaller files) were not summarized\n"
+
+        with self._lock:
+            self.commits += 1
+            self.chunks += len(chunks)
+            self.cached_chunks += cached
+        stats = {
+            "chunks": len(chunks),
+            "cached_chunks": cached,
+            "skipped_chunks": skipped,
+            "reduce_rounds": rounds,
+            "map_ms": int((time.perf_counter() - start_time) * 1000)
+        }
+        logger.info(f"Summarized diff in {len(chunks)} chunks ({cached} cached) in {stats['map_ms']}ms")
+        return prompt, stats
+
+    def stats(self) -> Dict:
+        """Commits and chunks summarized, for health reporting"""
+        return {
+            "commits": self.commits,
+            "chunks": self.chunks,
+            "cached_chunks": self.cached_chunks,
+            "chunk_tokens": self.chunk_tokens
+        }
+
+    async def _collapse(self, summaries: List[str], budget: int, model: str,
+                        semaphore: asyncio.Semaphore) -> Tuple[List[str], int]:
+        """Summarize groups of summaries until they fit the budget"""
+        rounds = 0
+        while len(summaries) > 1 and rounds < MAX_REDUCE_ROUNDS \
+                and estimate_tokens("".join(f"- Part 00: {s}\n" for s in summaries)) > budget:
+            groups: List[str] = []
+            for summary in summaries:
+                line = f"- {summary}\n"
+                if groups and estimate_tokens(groups[-1] + line) <= self.chunk_tokens \
+                        and groups[-1].count("\n") < len(summaries) // 2 + 1:
+                    groups[-1] += line
+                else:
+                    groups.append(line)
+            if len(groups) == len(summaries):
+                break
+
+            async def summarize(group: str) -> str:
+                async with semaphore:
+                    summary, _ = await self._summarize("Summaries of consecutive parts of the diff:\n" + group, model)
+                    return summary
+
+            summaries = list(await asyncio.gather(*(summarize(group) for group in groups)))
+            rounds += 1
+
+        # Still too long: share the budget equally
+        if estimate_tokens("".join(summaries)) > budget:
+            share = int(budget / len(summaries) * CHARS_PER_TOKEN)
+            summaries = [s if len(s) <= share else s[:max(share - 3, 0)] + "..." for s in summaries]
+        return summaries, rounds
+
+    def _map_model(self, model: Optional[str]) -> str:
+        """The requested chunk model, or the current model if no backend is known to have it"""
+        backends = self.ollama_client.pool.backends
+        if model and model != self.ollama_client.model and any(b.models_checked_at is not None for b in backends) \
+                and not any(b.has_model(model) for b in backends):
+            logger.warning(f"Model {model} is not on any Ollama backend, summarizing with {self.ollama_client.model}")
+            return self.ollama_client.model
+        return model or self.ollama_client.model
+
+    async def _summarize(self, chunk: str, model: str) -> Tuple[str, bool]:
+        """Summary of one chunk, and whether it came from the cache"""
+        models = [model] if model == self.ollama_client.model else [model, self.ollama_client.model]
+        for candidate in models:
+            try:
+                return await self._summarize_with(chunk, candidate)
+            except (httpx.HTTPError, RuntimeError) as e:
+                logger.warning(f"Failed to summarize diff chunk with {candidate}: {e}")
+        # One missing part should not fail the whole analysis
+        return UNSUMMARIZED, False
+
+    async def _summarize_with(self, chunk: str, model: str) -> Tuple[str, bool]:
+        key = cache_key(model, CHUNK_PROMPT_VERSION, chunk)
+        if self.cache is not None:
+            cached = await self.cache.get(key)
+            if cached is not None:
+                return format_summary(cached["analysis"]), True
+
+        start_time = time.perf_counter()
+        parser = IncrementalJSONParser()
+        result = await self.ollama_client.generate(
+            chunk,
+            model,
+            options={**ANALYSIS_OPTIONS, "num_predict": DIFF_SUMMARY_MAX_TOKENS},
+            format=CHUNK_SUMMARY_SCHEMA if OLLAMA_FORMAT == "schema" else self.ollama_client.response_format(),
+            stop=parser.feed,
+            system=CHUNK_SYSTEM_PROMPT
+        )
+
+        summary = parser.result()
+        if summary is None or not isinstance(summary.get("summary"), str):
+            text = " ".join(result.get("response", "").split())
+            return text[:500] or UNSUMMARIZED, False
+
+        if self.cache is not None:
+            await self.cache.put(key, model, CHUNK_PROMPT_VERSION, {
+                "analysis": summary,
+                "processing_time_ms": int((time.perf_counter() - start_time) * 1000)
+            })
+        return format_summary(summary), False
@@ -0,0 +1,49 @@
+# Client disconnect handling for AI Service
+# Cancels work whose HTTP client has gone away, so abandoned generations stop
+import asyncio
+import logging
+from typing import Awaitable, TypeVar
+
+from starlette.requests import Request
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# How often to check whether the HTTP client is still connected
+DISCONNECT_POLL_INTERVAL = 0.5
+
+T = TypeVar("T")
+
+class ClientDisconnected(Exception):
+    """Raised when the HTTP client disconnected before the work finished"""
+
+async def cancel_on_disconnect(request: Request, work: Awaitable[T],
+                               poll_interval: float = DISCONNECT_POLL_INTERVAL) -> T:
+    """
+    Await work, cancelling it if the HTTP client disconnects first
+
+    Args:
+        request: The incoming request whose connection is watched
+        work: Coroutine to run (e.g. an Ollama generation)
+        poll_interval: Seconds between disconnect checks
+
+    Returns:
+        The result of work
+
+    Raises:
+        ClientDisconnected: If the client went away and work was cancelled
+    """
+    task = asyncio.ensure_future(work)
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=poll_interval)
+            if done:
+                return task.result()
+            if await request.is_disconnected():
+                task.cancel()
+                logger.info(f"Client disconnected from {request.url.path}, cancelled its work")
+                raise ClientDisconnected(request.url.path)
+    except asyncio.CancelledError:
+        # The handler itself was cancelled: do not leave the work running
+        task.cancel()
+        raise
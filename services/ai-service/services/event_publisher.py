@@ -0,0 +1,35 @@
+# Event publisher for AI Service
+# Pushes newly stored analyses to the live commit feed hosted by GitHub Service
+import httpx
+import os
+import logging
+from typing import Dict
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+GITHUB_SERVICE_URL = os.getenv("GITHUB_SERVICE_URL", "http://github-service:8001")
+# The feed lives in one github-service process; with replicas, publish to the one the gateway pins it to
+GITHUB_FEED_URL = os.getenv("GITHUB_FEED_URL", GITHUB_SERVICE_URL)
+
+async def publish_analysis_event(analysis: Dict) -> None:
+    """
+    Publish a stored analysis to the live commit feed
+
+    Delivery is best effort: the analysis is already persisted, so a feed
+    outage must never fail the request that created it.
+    """
+    try:
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.post(
+                f"{GITHUB_FEED_URL}/events",
+                json={"type": "analysis", "data": analysis}
+            )
+            response.raise_for_status()
+            
+    except httpx.HTTPError as e:
+        logger.warning(f"Failed to publish analysis event for {analysis.get('commit_hash')}: {e}")
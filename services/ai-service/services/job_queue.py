@@ -0,0 +1,582 @@
+# Analysis job queue for AI Service
+# Persists analysis jobs in Postgres and drains them with a pool of async workers
+import asyncio
+import os
+import socket
+import logging
+import threading
+from collections import deque
+from contextlib import asynccontextmanager
+from datetime import datetime, timedelta, timezone
+from typing import AsyncIterator, Callable, Dict, List, Optional, Sequence
+
+from dotenv import load_dotenv
+from sqlalchemy import and_, func, or_
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.analysis_job import AnalysisJob
+from services.analysis_service import AnalysisService
+from services.event_publisher import publish_analysis_event
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Queue settings
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))  # Match the model server's parallelism
+ANALYSIS_POLL_INTERVAL = float(os.getenv("ANALYSIS_POLL_INTERVAL", "1.0"))
+ANALYSIS_LEASE_SECONDS = float(os.getenv("ANALYSIS_LEASE_SECONDS", "300"))
+ANALYSIS_MAX_ATTEMPTS = int(os.getenv("ANALYSIS_MAX_ATTEMPTS", "3"))
+# Backfill jobs a worker leases together and analyzes in one generation (1 disables batching)
+ANALYSIS_BATCH_SIZE = int(os.getenv("ANALYSIS_BATCH_SIZE", "4"))
+
+# Priority lanes: interactive requests for a commit someone is looking at,
+# and backfill of commits nobody has asked about yet
+INTERACTIVE = "interactive"
+BACKFILL = "backfill"
+LANES = (INTERACTIVE, BACKFILL)
+
+# Jobs a worker may still pick up or is processing
+ACTIVE_STATUSES = ("queued", "running")
+
+def parse_lane_weights(value: str) -> Dict[str, float]:
+    """Parse "interactive=4,backfill=1" into lane weights (unknown lanes ignored)"""
+    weights = {INTERACTIVE: 4.0, BACKFILL: 1.0}
+    for item in value.split(","):
+        lane, _, weight = item.partition("=")
+        if lane.strip() in weights and weight.strip():
+            weights[lane.strip()] = max(float(weight), 0.01)
+    return weights
+
+# Share of workers' job picks each lane gets while both have work
+ANALYSIS_LANE_WEIGHTS = parse_lane_weights(os.getenv("ANALYSIS_LANE_WEIGHTS", "interactive=4,backfill=1"))
+
+def utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+def enqueue_job(db: Session, commit_hash: str, commit_data: Dict, priority: str = INTERACTIVE) -> AnalysisJob:
+    """
+    Queue an analysis for a commit
+
+    A commit that already has a queued or running job gets that job back
+    instead of a second one; an interactive request promotes a queued
+    backfill job to the interactive lane.
+    """
+    existing = active_job(db, commit_hash)
+    if existing:
+        if priority == INTERACTIVE:
+            promote_job(db, existing)
+        return existing
+
+    job = AnalysisJob(
+        commit_hash=commit_hash,
+        commit_data=commit_data,
+        status="queued",
+        priority=priority,
+        attempts=0,
+        queued_at=utcnow()
+    )
+    db.add(job)
+    try:
+        db.commit()
+    except IntegrityError:
+        # Another request queued the commit between the lookup and the insert
+        db.rollback()
+        existing = active_job(db, commit_hash)
+        if existing is None:
+            raise
+        if priority == INTERACTIVE:
+            promote_job(db, existing)
+        return existing
+    db.refresh(job)
+    logger.info(f"Queued {priority} analysis job {job.id} for commit: {commit_hash}")
+    return job
+
+def active_job(db: Session, commit_hash: str) -> Optional[AnalysisJob]:
+    """The queued or running job of a commit, if any"""
+    return db.query(AnalysisJob).filter(
+        AnalysisJob.commit_hash == commit_hash,
+        AnalysisJob.status.in_(ACTIVE_STATUSES)
+    ).first()
+
+def promote_job(db: Session, job: AnalysisJob) -> bool:
+    """Move a queued backfill job to the interactive lane"""
+    if job.status != "queued" or job.priority == INTERACTIVE:
+        return False
+    job.priority = INTERACTIVE
+    job.queued_at = utcnow()
+    db.commit()
+    logger.info(f"Promoted analysis job {job.id} for {job.commit_hash} to the interactive lane")
+    return True
+
+def promote_commit(db: Session, commit_hash: str) -> Optional[AnalysisJob]:
+    """Promote the queued job for a commit someone is waiting on, if there is one"""
+    job = db.query(AnalysisJob).filter(
+        AnalysisJob.commit_hash == commit_hash,
+        AnalysisJob.status.in_(ACTIVE_STATUSES)
+    ).first()
+    if job:
+        promote_job(db, job)
+    return job
+
+def lease_job(db: Session, worker_id: str, lanes: Sequence[str] = LANES,
+              lease_seconds: float = ANALYSIS_LEASE_SECONDS,
+              max_attempts: int = ANALYSIS_MAX_ATTEMPTS) -> Optional[AnalysisJob]:
+    """
+    Lease the oldest available job, trying lanes in the given order
+
+    Rows are locked with FOR UPDATE SKIP LOCKED, so concurrent workers (in this
+    or any other replica) never lease the same job. Running jobs whose lease
+    expired, e.g. because their worker died, become available again until
+    they have used max_attempts; after that they are failed, so a job that
+    kills its worker every time is not re-leased forever.
+
+    Returns:
+        The leased job, or None if every lane is empty
+    """
+    now = utcnow()
+    fail_exhausted_jobs(db, now, max_attempts)
+    job = None
+    for lane in lanes:
+        job = db.query(AnalysisJob).filter(
+            AnalysisJob.priority == lane,
+            or_(
+                AnalysisJob.status == "queued",
+                and_(
+                    AnalysisJob.status == "running",
+                    AnalysisJob.lease_expires_at < now,
+                    AnalysisJob.attempts < max_attempts
+                )
+            )
+        ).order_by(AnalysisJob.queued_at, AnalysisJob.id).with_for_update(skip_locked=True).first()
+        if job is not None:
+            break
+
+    if job is None:
+        # Still commits the failures recorded above
+        db.commit()
+        return None
+
+    job.status = "running"
+    job.attempts = (job.attempts or 0) + 1
+    job.lease_owner = worker_id
+    job.lease_expires_at = now + timedelta(seconds=lease_seconds)
+    job.started_at = now
+    db.commit()
+    return job
+
+def fail_exhausted_jobs(db: Session, now: datetime, max_attempts: int = ANALYSIS_MAX_ATTEMPTS) -> int:
+    """
+    Fail running jobs whose lease expired after their last allowed attempt
+
+    Added to the caller's transaction.
+
+    Returns:
+        Number of jobs failed
+    """
+    jobs = db.query(AnalysisJob).filter(
+        AnalysisJob.status == "running",
+        AnalysisJob.lease_expires_at < now,
+        AnalysisJob.attempts >= max_attempts
+    ).with_for_update(skip_locked=True).all()
+    for job in jobs:
+        job.status = "failed"
+        job.error = f"Exceeded {max_attempts} attempts after lease expiry"
+        job.lease_owner = None
+        job.lease_expires_at = None
+        job.finished_at = now
+    if jobs:
+        logger.warning(f"Failed {len(jobs)} analysis jobs whose workers never reported back")
+    return len(jobs)
+
+def renew_leases(db: Session, job_ids: Sequence[int], worker_id: str,
+                 lease_seconds: float = ANALYSIS_LEASE_SECONDS) -> int:
+    """
+    Extend the leases a worker still holds
+
+    Returns:
+        Number of jobs whose lease was extended; jobs another worker took
+        over after the lease expired are left alone
+    """
+    renewed = db.query(AnalysisJob).filter(
+        AnalysisJob.id.in_(job_ids),
+        AnalysisJob.status == "running",
+        AnalysisJob.lease_owner == worker_id
+    ).update({AnalysisJob.lease_expires_at: utcnow() + timedelta(seconds=lease_seconds)}, synchronize_session=False)
+    db.commit()
+    return renewed
+
+def leased_job(db: Session, job_id: int, worker_id: str) -> Optional[AnalysisJob]:
+    """A running job, if worker_id still holds its lease"""
+    return db.query(AnalysisJob).filter(
+        AnalysisJob.id == job_id,
+        AnalysisJob.status == "running",
+        AnalysisJob.lease_owner == worker_id
+    ).with_for_update().first()
+
+def complete_job(db: Session, job: AnalysisJob, analysis_id: int):
+    """Mark a job as completed"""
+    job.status = "completed"
+    job.analysis_id = analysis_id
+    job.error = None
+    job.lease_owner = None
+    job.lease_expires_at = None
+    job.finished_at = utcnow()
+    db.commit()
+
+def fail_job(db: Session, job: AnalysisJob, error: str, max_attempts: int = ANALYSIS_MAX_ATTEMPTS):
+    """Record a failed attempt, re-queueing the job until it runs out of attempts"""
+    job.error = error
+    job.lease_owner = None
+    job.lease_expires_at = None
+    if (job.attempts or 0) < max_attempts:
+        job.status = "queued"
+        job.queued_at = utcnow()
+    else:
+        job.status = "failed"
+        job.finished_at = utcnow()
+    db.commit()
+
+def release_job(db: Session, job_id: int, worker_id: str):
+    """Put a job this worker is abandoning back in the queue without counting the attempt"""
+    job = leased_job(db, job_id, worker_id)
+    if job:
+        job.status = "queued"
+        job.attempts = max(0, (job.attempts or 0) - 1)
+        job.lease_owner = None
+        job.lease_expires_at = None
+        db.commit()
+
+def queue_depths(db: Session) -> Dict[str, Dict[str, int]]:
+    """Count queued and running jobs per lane"""
+    depths = {lane: {"queued": 0, "running": 0} for lane in LANES}
+    rows = db.query(AnalysisJob.priority, AnalysisJob.status, func.count(AnalysisJob.id)).filter(
+        AnalysisJob.status.in_(ACTIVE_STATUSES)
+    ).group_by(AnalysisJob.priority, AnalysisJob.status).all()
+    for lane, status, count in rows:
+        depths.setdefault(lane, {"queued": 0, "running": 0})[status] = count
+    return depths
+
+class LaneScheduler:
+    """
+    Weighted fair choice between lanes (stride scheduling)
+
+    Each lease is charged to its lane as 1/weight; the lane with the lowest
+    charge is tried first. With weights 4:1 interactive work gets four picks
+    for every backfill pick while both lanes have jobs, and an idle lane's
+    share goes to the other instead of being wasted. A lane found empty is
+    caught up to the lane that was served, so it cannot bank credit while
+    idle and then starve the other lane when work arrives.
+    """
+
+    def __init__(self, weights: Dict[str, float]):
+        self.weights = weights
+        self.passes = {lane: 0.0 for lane in weights}
+        self._lock = threading.Lock()
+
+    def order(self) -> List[str]:
+        """Lanes in the order they should be tried for the next lease"""
+        with self._lock:
+            return sorted(self.passes, key=lambda lane: (self.passes[lane], -self.weights[lane]))
+
+    def record(self, lane: str, skipped: Sequence[str] = ()):
+        """
+        Charge a lease to its lane
+
+        Args:
+            lane: Lane the job was leased from
+            skipped: Lanes tried first and found empty
+        """
+        with self._lock:
+            if lane not in self.passes:
+                return
+            for idle in skipped:
+                if idle in self.passes:
+                    self.passes[idle] = max(self.passes[idle], self.passes[lane])
+            self.passes[lane] += 1.0 / self.weights[lane]
+
+            # Only differences matter; keep the numbers small
+            floor = min(self.passes.values())
+            for name in self.passes:
+                self.passes[name] -= floor
+
+class LaneMetrics:
+    """Rolling queue wait times per lane"""
+
+    def __init__(self, window_size: int = 500):
+        self.waits = {lane: deque(maxlen=window_size) for lane in LANES}
+        self.leased = {lane: 0 for lane in LANES}
+        self._lock = threading.Lock()
+
+    def record_wait(self, lane: str, seconds: float):
+        with self._lock:
+            self.waits.setdefault(lane, deque(maxlen=500)).append(seconds)
+            self.leased[lane] = self.leased.get(lane, 0) + 1
+
+    def snapshot(self) -> Dict[str, Dict]:
+        """Lease counts and wait-time percentiles (ms) per lane"""
+        with self._lock:
+            return {
+                lane: {
+                    "leased": self.leased.get(lane, 0),
+                    "wait_p50_ms": self._percentile_ms(samples, 50),
+                    "wait_p95_ms": self._percentile_ms(samples, 95),
+                    "wait_max_ms": int(max(samples) * 1000) if samples else None
+                }
+                for lane, samples in self.waits.items()
+            }
+
+    @staticmethod
+    def _percentile_ms(samples, percentile: float) -> Optional[int]:
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * percentile / 100))
+        return int(ordered[index] * 1000)
+
+class AnalysisWorkerPool:
+    """
+    Pool of async workers draining the analysis job queue
+
+    Each worker leases one job at a time, so at most `size` generations run
+    against the model server from this process. Workers wake up immediately
+    when a job is queued locally and poll for jobs queued by other replicas.
+    Lanes are shared between the workers by weight (per process). A worker
+    that leases a backfill job also leases up to batch_size - 1 more and
+    analyzes them together; interactive jobs are never held up by batching.
+    Leases are renewed while their jobs run, and a worker only records the
+    outcome of jobs it still holds the lease of.
+    """
+
+    def __init__(self, analysis_service: AnalysisService, session_factory: Callable[[], Session],
+                 size: int = ANALYSIS_WORKERS, poll_interval: float = ANALYSIS_POLL_INTERVAL,
+                 lane_weights: Optional[Dict[str, float]] = None, batch_size: int = ANALYSIS_BATCH_SIZE,
+                 lease_seconds: float = ANALYSIS_LEASE_SECONDS):
+        self.analysis_service = analysis_service
+        self.session_factory = session_factory
+        self.size = size
+        self.lease_seconds = lease_seconds
+        self.batch_size = max(1, batch_size)
+        self.poll_interval = poll_interval
+        self.scheduler = LaneScheduler(lane_weights or ANALYSIS_LANE_WEIGHTS)
+        self.metrics = LaneMetrics()
+        self.worker_prefix = f"{socket.gethostname()}-{os.getpid()}"
+        self._tasks: List[asyncio.Task] = []
+        self._wakeup: Optional[asyncio.Event] = None
+
+    def start(self):
+        """Start the workers"""
+        if self._tasks:
+            return
+        self._wakeup = asyncio.Event()
+        self._tasks = [
+            asyncio.create_task(self._worker(f"{self.worker_prefix}-{index}"))
+            for index in range(self.size)
+        ]
+        logger.info(f"Started {self.size} analysis workers")
+
+    async def stop(self):
+        """Stop the workers; jobs they were running go back to the queue"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def notify(self):
+        """Wake an idle worker after a job was queued"""
+        if self._wakeup is not None:
+            self._wakeup.set()
+
+    def status(self) -> Dict:
+        """Pool configuration, for health reporting"""
+        return {"workers": len(self._tasks), "size": self.size, "batch_size": self.batch_size}
+
+    def lane_metrics(self, db: Session) -> Dict[str, Dict]:
+        """Queue depth, lease counts and wait times per lane"""
+        depths = queue_depths(db)
+        waits = self.metrics.snapshot()
+        return {
+            lane: {
+                "weight": self.scheduler.weights.get(lane),
+                **depths.get(lane, {"queued": 0, "running": 0}),
+                **waits.get(lane, {})
+            }
+            for lane in LANES
+        }
+
+    async def _worker(self, worker_id: str):
+        while True:
+            try:
+                processed = await self.run_once(worker_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Keep the worker alive through database hiccups
+                logger.error(f"Analysis worker {worker_id} error: {e}")
+                processed = False
+
+            if not processed:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def run_once(self, worker_id: str) -> bool:
+        """
+        Lease and process one job
+
+        Returns:
+            True if a job was processed, False if the queue was empty
+        """
+        leased = await run_in_threadpool(self._lease, worker_id)
+        if leased is None:
+            return False
+
+        job_id, commit_hash, commit_data, lane = leased
+        if lane == BACKFILL and self.batch_size > 1:
+            batch = [(job_id, commit_hash, commit_data)]
+            batch += await run_in_threadpool(self._lease_more, worker_id, BACKFILL, self.batch_size - 1)
+            if len(batch) > 1:
+                await self._run_batch(worker_id, batch)
+                return True
+
+        try:
+            # Stores the analysis, or returns the one another worker or replica produced
+            async with self._renewing(worker_id, [job_id]):
+                analysis, created = await self.analysis_service.analyze_and_store(
+                    self.session_factory, commit_hash,
+                    commit_data.get("message", ""), commit_data.get("files_changed", []),
+                    author=commit_data.get("author")
+                )
+        except asyncio.CancelledError:
+            await run_in_threadpool(self._release, job_id, worker_id)
+            raise
+        except Exception as e:
+            logger.error(f"Analysis job {job_id} for {commit_hash} failed: {e}")
+            await run_in_threadpool(self._fail, job_id, worker_id, str(e))
+            return True
+
+        await run_in_threadpool(self._complete, job_id, worker_id, analysis["id"])
+        if created:
+            await publish_analysis_event(analysis)
+        return True
+
+    async def _run_batch(self, worker_id: str, batch: List[tuple]):
+        """Process leased jobs with one shared generation"""
+        try:
+            async with self._renewing(worker_id, [job_id for job_id, _, _ in batch]):
+                outcomes = await self.analysis_service.analyze_and_store_batch(
+                    self.session_factory, [(commit_hash, commit_data) for _, commit_hash, commit_data in batch]
+                )
+        except asyncio.CancelledError:
+            for job_id, _, _ in batch:
+                await run_in_threadpool(self._release, job_id, worker_id)
+            raise
+        except Exception as e:
+            logger.error(f"Batch of {len(batch)} analysis jobs failed: {e}")
+            outcomes = [e] * len(batch)
+
+        for (job_id, commit_hash, _), outcome in zip(batch, outcomes):
+            if isinstance(outcome, Exception):
+                logger.error(f"Analysis job {job_id} for {commit_hash} failed: {outcome}")
+                await run_in_threadpool(self._fail, job_id, worker_id, str(outcome))
+                continue
+            analysis, created = outcome
+            await run_in_threadpool(self._complete, job_id, worker_id, analysis["id"])
+            if created:
+                await publish_analysis_event(analysis)
+
+    def _lease(self, worker_id: str):
+        db = self.session_factory()
+        try:
+            order = self.scheduler.order()
+            job = lease_job(db, worker_id, order, self.lease_seconds)
+            if job is None:
+                return None
+            skipped = order[:order.index(job.priority)] if job.priority in order else []
+            self.scheduler.record(job.priority, skipped)
+            if job.queued_at is not None:
+                self.metrics.record_wait(job.priority, (job.started_at - job.queued_at).total_seconds())
+            return job.id, job.commit_hash, job.commit_data or {}, job.priority
+        finally:
+            db.close()
+
+    def _lease_more(self, worker_id: str, lane: str, count: int) -> List[tuple]:
+        """Lease up to count more jobs from one lane to batch with a job already leased"""
+        db = self.session_factory()
+        try:
+            leased = []
+            for _ in range(count):
+                job = lease_job(db, worker_id, [lane], self.lease_seconds)
+                if job is None:
+                    break
+                if job.queued_at is not None:
+                    self.metrics.record_wait(job.priority, (job.started_at - job.queued_at).total_seconds())
+                leased.append((job.id, job.commit_hash, job.commit_data or {}))
+            return leased
+        finally:
+            db.close()
+
+    @asynccontextmanager
+    async def _renewing(self, worker_id: str, job_ids: List[int]) -> AsyncIterator[None]:
+        """Keep renewing the leases of jobs while the block runs"""
+
+        async def renew():
+            while True:
+                await asyncio.sleep(self.lease_seconds / 3)
+                try:
+                    await run_in_threadpool(self._renew, job_ids, worker_id)
+                except Exception as e:
+                    logger.warning(f"Failed to renew leases of analysis jobs {job_ids}: {e}")
+
+        task = asyncio.create_task(renew())
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _renew(self, job_ids: List[int], worker_id: str):
+        db = self.session_factory()
+        try:
+            if renew_leases(db, job_ids, worker_id, self.lease_seconds) < len(job_ids):
+                logger.warning(f"Worker {worker_id} lost the lease of some of analysis jobs {job_ids}")
+        finally:
+            db.close()
+
+    def _complete(self, job_id: int, worker_id: str, analysis_id: int):
+        db = self.session_factory()
+        try:
+            job = leased_job(db, job_id, worker_id)
+            if job is None:
+                # The lease expired and another worker took the job over; its outcome stands
+                logger.warning(f"Worker {worker_id} no longer holds analysis job {job_id}, not completing it")
+                db.rollback()
+                return
+            complete_job(db, job, analysis_id)
+        finally:
+            db.close()
+
+    def _fail(self, job_id: int, worker_id: str, error: str):
+        db = self.session_factory()
+        try:
+            job = leased_job(db, job_id, worker_id)
+            if job is None:
+                logger.warning(f"Worker {worker_id} no longer holds analysis job {job_id}, not failing it")
+                db.rollback()
+                return
+            fail_job(db, job, error)
+        finally:
+            db.close()
+
+    def _release(self, job_id: int, worker_id: str):
+        db = self.session_factory()
+        try:
+            release_job(db, job_id, worker_id)
+        finally:
+            db.close()
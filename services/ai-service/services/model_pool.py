@@ -0,0 +1,151 @@
+# Model warm pool for AI Service
+# Keeps the configured models resident in Ollama so requests never pay the load cost
+import asyncio
+import os
+import re
+import logging
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from services.ollama_client import OllamaClient
+from services.ollama_pool import model_names
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Warm pool settings
+# Comma-separated models to keep loaded; defaults to the models analyses use
+OLLAMA_WARM_MODELS = os.getenv("OLLAMA_WARM_MODELS", "")
+# Seconds between residency checks
+MODEL_REFRESH_INTERVAL = float(os.getenv("MODEL_REFRESH_INTERVAL", "60.0"))
+
+def parse_expiry(value: Optional[str]) -> Optional[datetime]:
+    """Parse an /api/ps expires_at timestamp (RFC 3339, possibly with nanoseconds)"""
+    if not value:
+        return None
+    try:
+        # Python parses at most microseconds
+        value = re.sub(r"\.(\d{6})\d+", r".\1", value)
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+
+class ModelWarmPool:
+    """
+    Preloads models and keeps them resident
+
+    A background task loads every configured model with the client's
+    keep_alive as soon as it starts (without holding up startup: avoiding
+    cold starts is best effort), then checks Ollama's running models every
+    refresh_interval and reloads any model that was evicted or whose
+    keep-alive expires before the next check, so the load happens here
+    rather than in front of a request. Residency is tracked per Ollama
+    backend, so a model evicted from one server is reloaded only there;
+    backends whose model list shows they have not pulled a model are
+    reported as missing it rather than retried every cycle.
+    """
+
+    def __init__(self, ollama_client: OllamaClient, models: List[str],
+                 refresh_interval: float = MODEL_REFRESH_INTERVAL):
+        self.ollama_client = ollama_client
+        self.models = models
+        self.refresh_interval = refresh_interval
+        self.resident: List[Dict] = []
+        self.loads = 0
+        self.load_failures = 0
+        self.missing: Dict[str, List[str]] = {}
+        self.last_refresh: Optional[datetime] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Preload the models and keep refreshing them in the background"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Stop refreshing (models stay loaded until their keep-alive expires)"""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    async def refresh(self) -> List[str]:
+        """
+        Load every configured model that is not resident or is about to expire
+
+        Returns:
+            The models that were (re)loaded
+        """
+        try:
+            self.resident = await self.ollama_client.running_models()
+        except (httpx.HTTPError, ValueError) as e:
+            logger.warning(f"Failed to list running models: {e}")
+            self.resident = []
+
+        # Expiry timestamp per backend and resident model (None if Ollama keeps it forever)
+        horizon = datetime.now(timezone.utc).timestamp() + self.refresh_interval
+        resident = {}
+        for model in self.resident:
+            expiry = parse_expiry(model.get("expires_at"))
+            resident[(model.get("backend"), model["name"])] = expiry.timestamp() if expiry else None
+
+        loaded = []
+        missing = {}
+        for model in self.models:
+            # Ollama reports untagged models with their implicit ":latest" tag
+            names = model_names(model)
+            cold = []
+            for backend in self.ollama_client.pool.backends:
+                if backend.models_checked_at is not None and not backend.has_model(model):
+                    missing.setdefault(model, []).append(backend.url)
+                    continue
+                expiries = [resident[(backend.url, name)] for name in names if (backend.url, name) in resident]
+                if not any(expiry is None or expiry > horizon for expiry in expiries):
+                    cold.append(backend.url)
+            if not cold:
+                continue
+            if await self.ollama_client.preload(model, backends=cold):
+                self.loads += 1
+                loaded.append(model)
+            else:
+                self.load_failures += 1
+        self.missing = missing
+
+        if loaded:
+            try:
+                self.resident = await self.ollama_client.running_models()
+            except (httpx.HTTPError, ValueError):
+                pass
+        self.last_refresh = datetime.now(timezone.utc)
+        return loaded
+
+    def status(self) -> Dict:
+        """Configured and resident models, for health reporting"""
+        return {
+            "models": list(self.models),
+            "resident": sorted({model["name"] for model in self.resident}),
+            "keep_alive": self.ollama_client.keep_alive,
+            "loads": self.loads,
+            "load_failures": self.load_failures,
+            "missing": self.missing,
+            "last_refresh": self.last_refresh.isoformat() if self.last_refresh else None
+        }
+
+    async def _run(self):
+        while True:
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.error(f"Model warm pool refresh failed: {e}")
+            await asyncio.sleep(self.refresh_interval)
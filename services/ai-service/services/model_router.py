@@ -0,0 +1,185 @@
+# Model router for AI Service
+# Sends commits to a small model first and escalates to larger ones when needed
+import os
+import time
+import logging
+import threading
+from typing import AsyncIterator, Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.analysis_schema import ANALYSIS_SCHEMA
+from services.ollama_client import OllamaClient
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Routing settings
+# Comma-separated models from smallest to largest; fewer than two disables routing
+OLLAMA_MODEL_TIERS = os.getenv("OLLAMA_MODEL_TIERS", "")
+# Diffs with at least this many changed lines start at the largest model
+ROUTING_LARGE_DIFF_LINES = int(os.getenv("ROUTING_LARGE_DIFF_LINES", "400"))
+# Answers scoring below this are escalated to the next tier
+ROUTING_MIN_CONFIDENCE = float(os.getenv("ROUTING_MIN_CONFIDENCE", "0.6"))
+
+# Fields constrained to an enum, where "unknown" means the model could not decide
+ENUM_FIELDS = [field for field, spec in ANALYSIS_SCHEMA["properties"].items() if "enum" in spec]
+
+def parse_model_tiers(value: Optional[str]) -> List[str]:
+    """Parse a comma-separated model list, smallest first"""
+    return [model.strip() for model in (value or "").split(",") if model.strip()]
+
+def analysis_confidence(result: Dict) -> float:
+    """
+    Score how much an analysis can be trusted, from 0 to 1
+
+    Ollama exposes no token probabilities, so the score is derived from the
+    answer itself: unparseable output scores 0, and every field that needed
+    repair, every undecided enum field and an empty summary lower it.
+    """
+    analysis = result.get("analysis", {})
+    if "parse_error" in analysis:
+        return 0.0
+
+    score = 1.0
+    score -= 0.25 * len(result.get("repaired_fields", []))
+    score -= 0.15 * sum(1 for field in ENUM_FIELDS if analysis.get(field) == "unknown")
+    if len(str(analysis.get("summary", "")).strip()) < 10:
+        score -= 0.25
+    return round(max(0.0, min(1.0, score)), 2)
+
+class ModelRouter:
+    """
+    Tiered routing of analyses across models
+
+    Each commit goes to the smallest model first, or straight to the largest
+    for large diffs. An answer that fails to parse, needed repairs or scores
+    below the confidence threshold is escalated to the next tier. Every
+    decision is returned under "routing" so it can be stored with the
+    analysis.
+    """
+
+    def __init__(self, tiers: List[str], large_diff_lines: int = ROUTING_LARGE_DIFF_LINES,
+                 min_confidence: float = ROUTING_MIN_CONFIDENCE):
+        if not tiers:
+            raise ValueError("At least one model tier is required")
+        self.tiers = tiers
+        self.large_diff_lines = large_diff_lines
+        self.min_confidence = min_confidence
+        self.served = {model: 0 for model in tiers}
+        self.escalations: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_env(cls) -> Optional["ModelRouter"]:
+        """Router configured by OLLAMA_MODEL_TIERS, or None if routing is off"""
+        tiers = parse_model_tiers(OLLAMA_MODEL_TIERS)
+        return cls(tiers) if len(tiers) > 1 else None
+
+    @property
+    def name(self) -> str:
+        """Identity of the routing policy, used in place of a model name for caching"""
+        return ">".join(self.tiers)
+
+    def start_tier(self, changed_lines: int) -> int:
+        """Index of the first tier to try"""
+        return len(self.tiers) - 1 if changed_lines >= self.large_diff_lines else 0
+
+    def escalation_reason(self, result: Dict, confidence: float) -> Optional[str]:
+        """Why an answer should go to the next tier, or None to accept it"""
+        if "parse_error" in result["analysis"]:
+            return "parse_failure"
+        if result.get("repaired_fields"):
+            return "validation_failure"
+        if confidence < self.min_confidence:
+            return "low_confidence"
+        return None
+
+    async def analyze(self, ollama_client: OllamaClient, prompt: str, changed_lines: int = 0) -> Dict:
+        """
+        Run an analysis prompt through the tiers
+
+        Returns:
+            The accepted tier's result, with total processing_time_ms and a
+            "routing" record of every tier tried
+        """
+        start_time = time.perf_counter()
+        first = self.start_tier(changed_lines)
+        decisions = []
+        result: Dict = {}
+        for index in range(first, len(self.tiers)):
+            model = self.tiers[index]
+            result = await ollama_client.analyze_prompt(prompt, model)
+            reason = self._decide(decisions, index, result)
+            if reason is None:
+                break
+
+        return self._finish(result, first, decisions, start_time)
+
+    async def stream(self, ollama_client: OllamaClient, prompt: str, changed_lines: int = 0) -> AsyncIterator[Dict]:
+        """
+        Stream an analysis prompt through the tiers
+
+        Yields:
+            Token events of each tier tried, an {"type": "escalate"} event
+            before moving to the next tier, and one final result event
+        """
+        start_time = time.perf_counter()
+        first = self.start_tier(changed_lines)
+        decisions = []
+        result: Dict = {}
+        for index in range(first, len(self.tiers)):
+            model = self.tiers[index]
+            async for event in ollama_client.stream_analysis(prompt, model):
+                if event["type"] == "result":
+                    result = {key: value for key, value in event.items() if key != "type"}
+                else:
+                    yield event
+            reason = self._decide(decisions, index, result)
+            if reason is None:
+                break
+            yield {"type": "escalate", "from": model, "to": self.tiers[index + 1], "reason": reason}
+
+        yield {"type": "result", **self._finish(result, first, decisions, start_time)}
+
+    def stats(self) -> Dict:
+        """Analyses served per tier and escalations by reason, for health reporting"""
+        with self._lock:
+            return {
+                "tiers": list(self.tiers),
+                "served": dict(self.served),
+                "escalations": dict(self.escalations)
+            }
+
+    def _decide(self, decisions: List[Dict], index: int, result: Dict) -> Optional[str]:
+        """Record a tier's answer; returns the escalation reason if the next tier should run"""
+        confidence = analysis_confidence(result)
+        last = index == len(self.tiers) - 1
+        reason = None if last else self.escalation_reason(result, confidence)
+        decisions.append({
+            "model": self.tiers[index],
+            "latency_ms": result.get("processing_time_ms"),
+            "confidence": confidence,
+            "escalation": reason
+        })
+        if reason is not None:
+            logger.info(f"Escalating analysis from {self.tiers[index]} to {self.tiers[index + 1]}: {reason}")
+            with self._lock:
+                self.escalations[reason] = self.escalations.get(reason, 0) + 1
+        return reason
+
+    def _finish(self, result: Dict, first: int, decisions: List[Dict], start_time: float) -> Dict:
+        with self._lock:
+            self.served[result["model_used"]] = self.served.get(result["model_used"], 0) + 1
+        return {
+            **result,
+            "processing_time_ms": int((time.perf_counter() - start_time) * 1000),
+            "routing": {
+                "policy": self.name,
+                "start": "large_diff" if first > 0 else "smallest",
+                "tiers": decisions
+            }
+        }
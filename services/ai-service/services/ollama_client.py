@@ -1,10 +1,20 @@
-import requests
+import asyncio
+import httpx
 import json
 import time
 import os
+import threading
+from collections import deque
 from dotenv import load_dotenv
 import logging
-from typing import Dict, Optional
+from typing import AsyncIterator, Callable, Dict, List, Optional, Union
+
+from services.analysis_schema import (
+    ANALYSIS_SCHEMA, BATCH_ANALYSIS_SCHEMA, IncrementalJSONParser, field_default, field_schema, validate_analysis
+)
+from services.concurrency_limiter import AdaptiveConcurrencyLimiter, workload
+from services.prompt_builder import PromptBuilder, estimate_tokens
+from services.ollama_pool import OllamaBackend, OllamaBackendPool, model_names, parse_backend_urls
 
 # Load environment variables
 load_dotenv()
@@ -12,28 +22,418 @@ load_dotenv()
 # Set up logging
 logger = logging.getLogger(__name__)
 
+# Connection settings
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", "60.0"))
+OLLAMA_CONNECT_TIMEOUT = float(os.getenv("OLLAMA_CONNECT_TIMEOUT", "5.0"))
+OLLAMA_MAX_CONNECTIONS = int(os.getenv("OLLAMA_MAX_CONNECTIONS", "10"))
+OLLAMA_KEEPALIVE_EXPIRY = float(os.getenv("OLLAMA_KEEPALIVE_EXPIRY", "60.0"))
+
+# How long Ollama keeps a model in memory after a request (duration string or seconds; -1 = forever)
+OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+# Loading a model from disk can take much longer than a generation timeout
+OLLAMA_LOAD_TIMEOUT = float(os.getenv("OLLAMA_LOAD_TIMEOUT", "300.0"))
+
+# Constrained output: "schema" sends ANALYSIS_SCHEMA, "json" any JSON object, "none" free text
+OLLAMA_FORMAT = os.getenv("OLLAMA_FORMAT", "schema").lower()
+# After stopping a generation early, how long to wait for Ollama's final chunk and its timings
+OLLAMA_STOP_DRAIN_TIMEOUT = float(os.getenv("OLLAMA_STOP_DRAIN_TIMEOUT", "0.05"))
+# Token cap for the pass that regenerates invalid fields
+OLLAMA_REPAIR_MAX_TOKENS = int(os.getenv("OLLAMA_REPAIR_MAX_TOKENS", "256"))
+
+# Bump whenever ANALYSIS_SYSTEM_PROMPT, create_analysis_prompt or the response parsing changes, so
+# cached analyses produced by the old template are not reused
+PROMPT_TEMPLATE_VERSION = "4"
+
+# Fixed instructions sent as the system prompt of every analysis. Keeping them
+# byte-identical and ahead of the commit lets Ollama reuse their evaluated
+# prefix instead of re-evaluating it per request.
+ANALYSIS_SYSTEM_PROMPT = """You are an expert code reviewer and commit analyst. Analyze the commit you are given and provide insights.
+
+Provide the analysis in the following JSON format:
+{
+    "commit_type": "feature|bugfix|refactor|docs|test|chore",
+    "impact": "high|medium|low",
+    "summary": "Brief summary of what this commit does",
+    "key_changes": ["List of key changes made"],
+    "potential_risks": ["Any potential risks or issues"],
+    "recommendations": ["Any recommendations for review or follow-up"],
+    "complexity": "simple|moderate|complex"
+}
+
+Focus on being concise and practical. If you cannot determine something, use "unknown".
+"""
+
+# Instructions for analyzing several commits in one generation (see analyze_batch)
+BATCH_SYSTEM_PROMPT = """You are an expert code reviewer and commit analyst. You are given several numbered commits. Analyze each commit on its own and provide insights.
+
+Provide the analyses in the following JSON format, with one entry per commit in the order given:
+{
+    "analyses": [
+        {
+            "commit": 1,
+            "commit_type": "feature|bugfix|refactor|docs|test|chore",
+            "impact": "high|medium|low",
+            "summary": "Brief summary of what this commit does",
+            "key_changes": ["List of key changes made"],
+            "potential_risks": ["Any potential risks or issues"],
+            "recommendations": ["Any recommendations for review or follow-up"],
+            "complexity": "simple|moderate|complex"
+        }
+    ]
+}
+
+Focus on being concise and practical. If you cannot determine something, use "unknown".
+"""
+
+# Final-chunk counters kept when a generation is stopped early
+PROMPT_STATS = ("prompt_eval_count", "prompt_eval_duration", "load_duration", "total_duration")
+
+# Sampling options for analyses
+ANALYSIS_OPTIONS = {
+    "temperature": 0.1,  # Low temperature for consistent results
+    "top_p": 0.9
+}
+
+class GenerationMetrics:
+    """Rolling time-to-first-token and decode speed of recent generations"""
+
+    def __init__(self, window_size: int = 500):
+        self.ttft_ms = deque(maxlen=window_size)
+        self.tokens_per_second = deque(maxlen=window_size)
+        self.prompt_eval_ms = deque(maxlen=window_size)
+        self.prompt_tokens = deque(maxlen=window_size)
+        self.generations = 0
+        self.parse_outcomes = {"valid": 0, "repaired": 0, "failed": 0}
+        # Per model and mode ("single" or "batch"): [commits analyzed, seconds spent]
+        self.throughput: Dict[str, Dict[str, List[float]]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, ttft_ms: Optional[int], tokens_per_second: Optional[float],
+               prompt_eval_ms: Optional[float] = None, prompt_tokens: Optional[int] = None):
+        with self._lock:
+            self.generations += 1
+            if ttft_ms is not None:
+                self.ttft_ms.append(ttft_ms)
+            if tokens_per_second is not None:
+                self.tokens_per_second.append(tokens_per_second)
+            if prompt_eval_ms is not None:
+                self.prompt_eval_ms.append(prompt_eval_ms)
+            if prompt_tokens is not None:
+                self.prompt_tokens.append(prompt_tokens)
+
+    def record_parse(self, outcome: str):
+        """Count an analysis as valid, repaired or failed (unparseable)"""
+        with self._lock:
+            self.parse_outcomes[outcome] = self.parse_outcomes.get(outcome, 0) + 1
+
+    def record_throughput(self, mode: str, model: str, seconds: float, commits: int):
+        """Count commits analyzed by single or batched generations and the time they took"""
+        with self._lock:
+            totals = self.throughput.setdefault(model, {}).setdefault(mode, [0, 0.0])
+            totals[0] += commits
+            totals[1] += seconds
+
+    def throughput_snapshot(self) -> Dict[str, Dict]:
+        """Commits per generation-second per model, single versus batched, and the batching gain"""
+        with self._lock:
+            report = {}
+            for model, modes in self.throughput.items():
+                rates = {
+                    mode: round(commits / seconds, 3) if seconds else None
+                    for mode, (commits, seconds) in modes.items()
+                }
+                single, batch = rates.get("single"), rates.get("batch")
+                report[model] = {
+                    "single_commits": int(modes.get("single", [0])[0]),
+                    "batched_commits": int(modes.get("batch", [0])[0]),
+                    "single_commits_per_second": single,
+                    "batched_commits_per_second": batch,
+                    "batch_gain": round(batch / single, 2) if single and batch else None
+                }
+            return report
+
+    def snapshot(self) -> Dict:
+        """Generation count with TTFT and tokens/s percentiles, for health reporting"""
+        throughput = self.throughput_snapshot()
+        with self._lock:
+            return {
+                "generations": self.generations,
+                "parse_outcomes": dict(self.parse_outcomes),
+                "ttft_p50_ms": self._percentile(self.ttft_ms, 50),
+                "ttft_p95_ms": self._percentile(self.ttft_ms, 95),
+                "tokens_per_second_p50": self._percentile(self.tokens_per_second, 50),
+                # Tokens Ollama had to evaluate: drops when the system prefix is reused
+                "prompt_eval_p50_ms": self._percentile(self.prompt_eval_ms, 50),
+                "prompt_tokens_p50": self._percentile(self.prompt_tokens, 50),
+                "throughput": throughput
+            }
+
+    @staticmethod
+    def _percentile(samples, percentile: float):
+        if not samples:
+            return None
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * percentile / 100))]
+
 class OllamaClient:
-    """Client for interacting with Ollama API"""
+    """
+    Async client for interacting with Ollama API
+
+    Requests share one keep-alive connection pool. Generations are streamed
+    from Ollama, so cancelling the awaiting task closes the connection and
+    Ollama stops generating for it.
+
+    With several servers in OLLAMA_URLS, each generation goes to the backend
+    with the shortest expected wait among those that have the model (per
+    their /api/tags), and fails over to the next one if a backend errors
+    before streaming anything.
+
+    Concurrent generations are capped by an adaptive limiter that raises the
+    cap while time to first token stays flat and lowers it when it climbs.
+    """
     
     def __init__(self):
         self.base_url = os.getenv("OLLAMA_URL", "http://ollama:11434")
+        self.pool = OllamaBackendPool(parse_backend_urls(os.getenv("OLLAMA_URLS"), self.base_url))
         self.model = "codellama"  # Default model
+        self.keep_alive = OLLAMA_KEEP_ALIVE
+        self._client: Optional[httpx.AsyncClient] = None
+        self.metrics = GenerationMetrics()
+        self.limiter = AdaptiveConcurrencyLimiter()
+        self.prompt_builder = PromptBuilder()
+    
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive connection pool to the Ollama backends"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(OLLAMA_TIMEOUT, connect=OLLAMA_CONNECT_TIMEOUT),
+                limits=httpx.Limits(
+                    max_connections=OLLAMA_MAX_CONNECTIONS,
+                    max_keepalive_connections=OLLAMA_MAX_CONNECTIONS,
+                    keepalive_expiry=OLLAMA_KEEPALIVE_EXPIRY
+                )
+            )
+        return self._client
+    
+    async def aclose(self):
+        """Close the connection pool"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
         
-    def test_connection(self) -> bool:
-        """Test connection to Ollama"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
+    async def test_connection(self) -> bool:
+        """Test connection to Ollama (at least one backend must answer)"""
+        reachable = False
+        for backend in self.pool.backends:
+            try:
+                models = await self.refresh_models(backend)
+                logger.info(f"Ollama connection to {backend.url} successful. Available models: {sorted(models)}")
+                reachable = True
+            except httpx.HTTPError as e:
+                logger.error(f"Ollama connection to {backend.url} failed: {e}")
+        return reachable
+    
+    async def refresh_models(self, backend: OllamaBackend) -> List[str]:
+        """Fetch the models installed on a backend (/api/tags)"""
+        response = await self.client.get(f"{backend.url}/api/tags")
+        response.raise_for_status()
+        models = [model["name"] for model in response.json().get("models", [])]
+        self.pool.record_models(backend, models)
+        return models
+    
+    async def _choose_backend(self, model: str, tried: List[OllamaBackend]) -> Optional[OllamaBackend]:
+        """Least-loaded untried backend that has the model, refreshing stale model lists first"""
+        stale = [b for b in self.pool.backends if b not in tried and b.available and b.models_stale()]
+        for backend in stale:
+            try:
+                await self.refresh_models(backend)
+            except httpx.HTTPError as e:
+                self.pool.record_failure(backend, e)
+        
+        backend = self.pool.choose(model, tried)
+        if backend is None and all(b.models_checked_at is None for b in self.pool.backends):
+            # No backend could list its models: try one anyway and let the request fail over
+            backend = self.pool.choose(None, tried)
+        return backend
+    
+    async def generate_stream(self, prompt: str, model: Optional[str] = None, options: Optional[Dict] = None,
+                              format: Optional[Union[str, Dict]] = None,
+                              stop: Optional[Callable[[str], bool]] = None,
+                              system: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Run a generation, yielding Ollama's chunks as they arrive
+        
+        Args:
+            prompt: Prompt to send
+            model: Model to use (default: the current model)
+            options: Ollama generation options
+            format: Ollama output constraint ("json" or a JSON schema)
+            stop: Called with each piece of text; returning True ends the
+                generation early (the connection is closed so Ollama stops)
+            system: System prompt, evaluated ahead of the prompt
             
-            models = response.json().get("models", [])
-            logger.info(f"Ollama connection successful. Available models: {[m['name'] for m in models]}")
-            return True
+        Yields:
+            Ollama chunks; the final one ("done": true) also carries ttft_ms,
+            tokens_per_second and prompt_eval_ms
+        """
+        payload = {
+            "model": model or self.model,
+            "prompt": prompt,
+            "stream": True,
+            "keep_alive": self.keep_alive
+        }
+        if options:
+            payload["options"] = options
+        if format:
+            payload["format"] = format
+        if system:
+            payload["system"] = system
+        
+        # Latency is judged against generations of the same model and prompt size
+        prompt_tokens = estimate_tokens(prompt) + (estimate_tokens(system) if system else 0)
+        async with self.limiter.slot(workload(payload["model"], prompt_tokens)) as permit:
+            tried: List[OllamaBackend] = []
+            last_error: Optional[Exception] = None
+            while True:
+                backend = await self._choose_backend(payload["model"], tried)
+                if backend is None:
+                    if last_error is not None:
+                        raise last_error
+                    raise RuntimeError(f"Model {payload['model']} is not available on any Ollama backend")
+                tried.append(backend)
+                
+                started = False
+                self.pool.acquire(backend)
+                try:
+                    async for chunk in self._generate_on(backend, payload, stop):
+                        started = True
+                        if chunk.get("done"):
+                            permit.record(chunk["ttft_ms"])
+                        yield chunk
+                    return
+                except (httpx.TransportError, httpx.HTTPStatusError) as e:
+                    if isinstance(e, httpx.TimeoutException) or (
+                        isinstance(e, httpx.HTTPStatusError) and e.response.status_code >= 500
+                    ):
+                        permit.overload()
+                    # Tokens already reached the caller: a retry elsewhere would repeat them
+                    if started:
+                        raise
+                    if isinstance(e, httpx.HTTPStatusError) and e.response.status_code == 404:
+                        # The model was removed since the last /api/tags
+                        self.pool.record_models(backend, backend.models - model_names(payload["model"]))
+                    elif isinstance(e, httpx.HTTPStatusError) and e.response.status_code < 500:
+                        raise
+                    else:
+                        self.pool.record_failure(backend, e)
+                    last_error = e
+                finally:
+                    self.pool.release(backend)
+    
+    async def _generate_on(self, backend: OllamaBackend, payload: Dict,
+                           stop: Optional[Callable[[str], bool]]) -> AsyncIterator[Dict]:
+        """Stream one generation from one backend"""
+        start_time = time.perf_counter()
+        first_token_at: Optional[float] = None
+        token_chunks = 0
+        # Leaving this block early (e.g. on cancellation) closes the connection,
+        # which tells Ollama to stop generating
+        async with self.client.stream("POST", f"{backend.url}/api/generate", json=payload) as response:
+            response.raise_for_status()
+            lines = response.aiter_lines()
+            async for line in lines:
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("error"):
+                    raise RuntimeError(f"Ollama error: {chunk['error']}")
+                if chunk.get("response"):
+                    token_chunks += 1
+                    if first_token_at is None:
+                        first_token_at = time.perf_counter()
+                    if not chunk.get("done") and stop is not None and stop(chunk["response"]):
+                        yield chunk
+                        chunk = await self._stopped_final(lines, token_chunks)
+                if chunk.get("done"):
+                    ttft_ms = int((first_token_at - start_time) * 1000) if first_token_at is not None else None
+                    chunk["ttft_ms"] = ttft_ms
+                    chunk["tokens_per_second"] = self._tokens_per_second(chunk, token_chunks, first_token_at)
+                    chunk["prompt_eval_ms"] = (
+                        round(chunk["prompt_eval_duration"] / 1e6, 1) if chunk.get("prompt_eval_duration") else None
+                    )
+                    chunk["backend"] = backend.url
+                    self.metrics.record(
+                        ttft_ms, chunk["tokens_per_second"], chunk["prompt_eval_ms"], chunk.get("prompt_eval_count")
+                    )
+                    self.pool.record_speed(backend, chunk["tokens_per_second"])
+                yield chunk
+                if chunk.get("done"):
+                    return
+    
+    @staticmethod
+    async def _stopped_final(lines: AsyncIterator[str], token_chunks: int) -> Dict:
+        """
+        Final chunk for a generation stopped before Ollama finished it
+        
+        Ollama's own final chunk usually follows the end of a JSON object
+        immediately, so it is awaited briefly for its prompt timings; the
+        tokens in between are discarded.
+        """
+        final = {"response": "", "done": True, "done_reason": "stopped", "eval_count": token_chunks}
+        deadline = time.perf_counter() + OLLAMA_STOP_DRAIN_TIMEOUT
+        try:
+            while deadline > time.perf_counter():
+                line = await asyncio.wait_for(lines.__anext__(), timeout=deadline - time.perf_counter())
+                if not line:
+                    continue
+                chunk = json.loads(line)
+                if chunk.get("done"):
+                    final.update({key: chunk[key] for key in PROMPT_STATS if key in chunk})
+                    break
+        except (asyncio.TimeoutError, StopAsyncIteration):
+            pass
+        return final
+    
+    @staticmethod
+    def _tokens_per_second(final: Dict, token_chunks: int, first_token_at: Optional[float]) -> Optional[float]:
+        # Prefer Ollama's own decode counters; fall back to wall clock per streamed chunk
+        if final.get("eval_count") and final.get("eval_duration"):
+            return round(final["eval_count"] / (final["eval_duration"] / 1e9), 2)
+        if first_token_at is None:
+            return None
+        elapsed = time.perf_counter() - first_token_at
+        return round(token_chunks / elapsed, 2) if elapsed > 0 else None
+    
+    async def generate(self, prompt: str, model: Optional[str] = None, options: Optional[Dict] = None,
+                       format: Optional[Union[str, Dict]] = None,
+                       stop: Optional[Callable[[str], bool]] = None,
+                       system: Optional[str] = None) -> Dict:
+        """
+        Run a generation and collect the streamed response
+        
+        Args:
+            prompt: Prompt to send
+            model: Model to use (default: the current model)
+            options: Ollama generation options
+            format: Ollama output constraint ("json" or a JSON schema)
+            stop: Called with each piece of text; returning True ends the generation
+            system: System prompt, evaluated ahead of the prompt
             
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Ollama connection failed: {e}")
-            return False
+        Returns:
+            The final Ollama chunk (timing and token counts) with the full "response" text
+        """
+        parts = []
+        final: Dict = {}
+        async for chunk in self.generate_stream(prompt, model, options, format, stop, system):
+            parts.append(chunk.get("response", ""))
+            if chunk.get("done"):
+                final = chunk
+        
+        final["response"] = "".join(parts)
+        return final
     
-    def analyze_commit(self, commit_message: str, files_changed: list = None) -> Dict:
+    async def analyze_commit(self, commit_message: str, files_changed: list = None) -> Dict:
         """
         Analyze a commit using Ollama
         
@@ -41,163 +441,357 @@ class OllamaClient:
             commit_message: The commit message
             files_changed: List of files changed in the commit
             
+        Returns:
+            Analysis results dictionary
+        """
+        logger.info(f"Analyzing commit with Ollama: {commit_message[:50]}...")
+        
+        # Create prompt for analysis
+        prompt = self.create_analysis_prompt(commit_message, files_changed)
+        return await self.analyze_prompt(prompt)
+    
+    async def analyze_prompt(self, prompt: str, model: Optional[str] = None) -> Dict:
+        """
+        Run an analysis prompt and parse the model's answer
+        
+        Args:
+            prompt: Fully rendered analysis prompt
+            model: Model to use (default: the current model)
+            
         Returns:
             Analysis results dictionary
         """
         try:
             start_time = time.time()
             
-            # Create prompt for analysis
-            prompt = self._create_analysis_prompt(commit_message, files_changed)
-            
-            # Make request to Ollama
-            url = f"{self.base_url}/api/generate"
-            payload = {
-                "model": self.model,
-                "prompt": prompt,
-                "stream": False,
-                "options": {
-                    "temperature": 0.1,  # Low temperature for consistent results
-                    "top_p": 0.9
-                }
-            }
-            
-            logger.info(f"Analyzing commit with Ollama: {commit_message[:50]}...")
-            
-            response = requests.post(url, json=payload, timeout=60)
-            response.raise_for_status()
-            
-            result = response.json()
-            response_text = result.get("response", "")
+            # Stop as soon as the JSON object is closed instead of waiting for end of generation
+            model = model or self.model
+            parser = IncrementalJSONParser()
+            result = await self.generate(
+                prompt, model, options=ANALYSIS_OPTIONS, format=self.response_format(), stop=parser.feed,
+                system=ANALYSIS_SYSTEM_PROMPT
+            )
+            return await self._analysis_result(prompt, model, result.get("response", ""), result, start_time)
             
-            # Calculate processing time
-            processing_time_ms = int((time.time() - start_time) * 1000)
-            
-            # Parse the response
-            analysis = self._parse_analysis_response(response_text)
-            
-            logger.info(f"Analysis completed in {processing_time_ms}ms")
-            
-            return {
-                "analysis": analysis,
-                "processing_time_ms": processing_time_ms,
-                "model_used": self.model,
-                "raw_response": response_text
-            }
-            
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPError as e:
             logger.error(f"Failed to analyze commit with Ollama: {e}")
             raise
         except Exception as e:
             logger.error(f"Unexpected error during analysis: {e}")
             raise
     
-    def _create_analysis_prompt(self, commit_message: str, files_changed: list = None) -> str:
-        """Create a prompt for commit analysis"""
+    async def stream_analysis(self, prompt: str, model: Optional[str] = None) -> AsyncIterator[Dict]:
+        """
+        Run an analysis prompt, yielding tokens as the model produces them
         
-        prompt = f"""
-You are an expert code reviewer and commit analyst. Analyze the following commit and provide insights.
-
-Commit Message: {commit_message}
-
-"""
+        Args:
+            prompt: Fully rendered analysis prompt
+            model: Model to use (default: the current model)
+            
+        Yields:
+            {"type": "token", "text": ...} events, then one {"type": "result", ...}
+            event with the parsed analysis in the shape analyze_prompt returns
+        """
+        start_time = time.time()
+        model = model or self.model
+        parts = []
+        parser = IncrementalJSONParser()
+        async for chunk in self.generate_stream(
+            prompt, model, options=ANALYSIS_OPTIONS, format=self.response_format(), stop=parser.feed,
+            system=ANALYSIS_SYSTEM_PROMPT
+        ):
+            text = chunk.get("response", "")
+            if text:
+                parts.append(text)
+                yield {"type": "token", "text": text}
+            if chunk.get("done"):
+                result = await self._analysis_result(prompt, model, "".join(parts), chunk, start_time)
+                yield {"type": "result", **result}
+    
+    def response_format(self) -> Optional[Union[str, Dict]]:
+        """Output constraint sent with analysis prompts (see OLLAMA_FORMAT)"""
+        if OLLAMA_FORMAT == "schema":
+            return ANALYSIS_SCHEMA
+        if OLLAMA_FORMAT == "json":
+            return "json"
+        return None
+    
+    async def _analysis_result(self, prompt: str, model: str, response_text: str, final: Dict,
+                               start_time: float) -> Dict:
+        """Parse a finished generation into an analysis result, repairing invalid fields"""
+        analysis = self._parse_analysis_response(response_text)
         
-        if files_changed:
-            prompt += "Files Changed:\n"
-            for file_info in files_changed:
-                prompt += f"- {file_info.get('filename', 'unknown')} ({file_info.get('status', 'unknown')})\n"
-                if file_info.get('additions'):
-                    prompt += f"  +{file_info.get('additions')} lines added\n"
-                if file_info.get('deletions'):
-                    prompt += f"  -{file_info.get('deletions')} lines deleted\n"
+        errors: Dict[str, str] = {}
+        if "parse_error" in analysis:
+            self.metrics.record_parse("failed")
+        else:
+            errors = validate_analysis(analysis)
+            if errors:
+                analysis = await self._repair_analysis(prompt, model, analysis, errors)
+                self.metrics.record_parse("repaired")
+            else:
+                self.metrics.record_parse("valid")
         
-        prompt += """
-
-Please provide analysis in the following JSON format:
-{
-    "commit_type": "feature|bugfix|refactor|docs|test|chore",
-    "impact": "high|medium|low",
-    "summary": "Brief summary of what this commit does",
-    "key_changes": ["List of key changes made"],
-    "potential_risks": ["Any potential risks or issues"],
-    "recommendations": ["Any recommendations for review or follow-up"],
-    "complexity": "simple|moderate|complex"
-}
-
-Focus on being concise and practical. If you cannot determine something, use "unknown".
-"""
+        # Calculate processing time
+        processing_time_ms = int((time.time() - start_time) * 1000)
+        self.metrics.record_throughput("single", model, processing_time_ms / 1000, 1)
+        
+        logger.info(
+            f"Analysis completed in {processing_time_ms}ms "
+            f"(first token {final.get('ttft_ms')}ms, {final.get('tokens_per_second')} tokens/s, "
+            f"{final.get('eval_count')} tokens)"
+        )
+        
+        result = {
+            "analysis": analysis,
+            "processing_time_ms": processing_time_ms,
+            "model_used": model,
+            "raw_response": response_text,
+            "ttft_ms": final.get("ttft_ms"),
+            "tokens_per_second": final.get("tokens_per_second"),
+            "tokens_generated": final.get("eval_count"),
+            "prompt_eval_ms": final.get("prompt_eval_ms"),
+            "prompt_tokens": final.get("prompt_eval_count")
+        }
+        if errors:
+            result["repaired_fields"] = sorted(errors)
+            result["validation_errors"] = errors
+        return result
+    
+    async def analyze_batch(self, prompts: List[str], model: Optional[str] = None) -> List[Optional[Dict]]:
+        """
+        Analyze several commits in one generation
         
-        return prompt
+        The instructions are paid for once per batch instead of once per
+        commit. Entries the model skipped, duplicated or got wrong are not
+        repaired; they come back as None so the caller can analyze those
+        commits on their own.
+        
+        Args:
+            prompts: Per-commit prompts from create_analysis_prompt
+            model: Model to use (default: the current model)
+            
+        Returns:
+            One analysis result (shaped like analyze_prompt's) or None per prompt
+        """
+        start_time = time.time()
+        model = model or self.model
+        parser = IncrementalJSONParser()
+        result = await self.generate(
+            self.create_batch_prompt(prompts), model, options=ANALYSIS_OPTIONS,
+            format=self.batch_response_format(), stop=parser.feed, system=BATCH_SYSTEM_PROMPT
+        )
+        elapsed_ms = int((time.time() - start_time) * 1000)
+        
+        document = parser.result() or {}
+        entries = document.get("analyses") if isinstance(document.get("analyses"), list) else []
+        by_commit: Dict[int, Dict] = {}
+        for entry in entries:
+            if isinstance(entry, dict) and isinstance(entry.get("commit"), int):
+                by_commit.setdefault(entry["commit"], entry)
+        
+        results: List[Optional[Dict]] = []
+        for number in range(1, len(prompts) + 1):
+            entry = by_commit.get(number)
+            analysis = {field: entry[field] for field in ANALYSIS_SCHEMA["properties"] if field in entry} \
+                if entry is not None else {}
+            if entry is None or validate_analysis(analysis):
+                self.metrics.record_parse("failed")
+                results.append(None)
+                continue
+            self.metrics.record_parse("valid")
+            results.append({
+                "analysis": analysis,
+                # The batch's time shared equally by its commits
+                "processing_time_ms": elapsed_ms // len(prompts),
+                "model_used": model,
+                "batch_size": len(prompts),
+                "ttft_ms": result.get("ttft_ms"),
+                "tokens_per_second": result.get("tokens_per_second"),
+                "prompt_eval_ms": result.get("prompt_eval_ms")
+            })
+        
+        analyzed = sum(1 for item in results if item is not None)
+        self.metrics.record_throughput("batch", model, elapsed_ms / 1000, analyzed)
+        logger.info(
+            f"Batch analysis of {len(prompts)} commits completed in {elapsed_ms}ms "
+            f"({analyzed} valid, {result.get('eval_count')} tokens)"
+        )
+        return results
+    
+    def create_batch_prompt(self, prompts: List[str]) -> str:
+        """Number per-commit prompts into one batch prompt"""
+        return "\n".join(f"### Commit {number}\n{prompt}" for number, prompt in enumerate(prompts, start=1))
+    
+    def batch_response_format(self) -> Optional[Union[str, Dict]]:
+        """Output constraint sent with batch prompts (see OLLAMA_FORMAT)"""
+        if OLLAMA_FORMAT == "schema":
+            return BATCH_ANALYSIS_SCHEMA
+        if OLLAMA_FORMAT == "json":
+            return "json"
+        return None
+    
+    async def _repair_analysis(self, prompt: str, model: str, analysis: Dict, errors: Dict[str, str]) -> Dict:
+        """
+        Regenerate only the invalid fields of an analysis
+        
+        The valid fields are kept as they are; the model is asked for just the
+        broken ones, constrained to their part of the schema. Fields that are
+        still invalid afterwards get their default value.
+        """
+        fields = sorted(errors)
+        logger.info(f"Repairing analysis fields: {', '.join(f'{f} ({errors[f]})' for f in fields)}")
+        
+        valid = {field: value for field, value in analysis.items() if field not in errors}
+        repair_prompt = (
+            f"{prompt}\n"
+            f"Part of the analysis is already done:\n{json.dumps(valid, indent=2)}\n\n"
+            f"Respond with a JSON object containing only these fields: {', '.join(fields)}.\n"
+        )
+        
+        repaired: Dict = {}
+        try:
+            parser = IncrementalJSONParser()
+            result = await self.generate(
+                repair_prompt,
+                model,
+                options={**ANALYSIS_OPTIONS, "num_predict": OLLAMA_REPAIR_MAX_TOKENS},
+                format=field_schema(fields) if OLLAMA_FORMAT == "schema" else self.response_format(),
+                stop=parser.feed,
+                system=ANALYSIS_SYSTEM_PROMPT
+            )
+            parser = IncrementalJSONParser()
+            parser.feed(result.get("response", ""))
+            repaired = parser.result() or {}
+        except (httpx.HTTPError, RuntimeError) as e:
+            # The repair is optional: keep the parsed answer, with defaults for the invalid fields
+            logger.warning(f"Analysis repair failed: {e}")
+        
+        fixed = dict(analysis)
+        for field in fields:
+            candidate = {**fixed, field: repaired.get(field)}
+            fixed[field] = repaired[field] if field in repaired and field not in validate_analysis(candidate) \
+                else field_default(field)
+        return fixed
+    
+    def create_analysis_prompt(self, commit_message: str, files_changed: list = None) -> str:
+        """
+        Create the per-commit part of an analysis prompt
+        
+        The instructions and output format are in ANALYSIS_SYSTEM_PROMPT, so
+        this only describes the commit, within the prompt builder's token
+        budget.
+        """
+        return self.prompt_builder.build(commit_message, files_changed)
     
     def _parse_analysis_response(self, response_text: str) -> Dict:
         """Parse the analysis response from Ollama"""
-        try:
-            # Try to extract JSON from the response
-            # Look for JSON-like content between curly braces
-            start_idx = response_text.find('{')
-            end_idx = response_text.rfind('}') + 1
-            
-            if start_idx != -1 and end_idx != 0:
-                json_str = response_text[start_idx:end_idx]
-                analysis = json.loads(json_str)
-            else:
-                # If no JSON found, create a basic analysis
-                analysis = {
-                    "commit_type": "unknown",
-                    "impact": "unknown",
-                    "summary": response_text.strip(),
-                    "key_changes": [],
-                    "potential_risks": [],
-                    "recommendations": [],
-                    "complexity": "unknown"
-                }
-            
+        # The first complete JSON object in the response; anything after it is ignored
+        parser = IncrementalJSONParser()
+        parser.feed(response_text)
+        analysis = parser.result()
+        if analysis is not None:
             return analysis
-            
-        except json.JSONDecodeError as e:
-            logger.warning(f"Failed to parse JSON response: {e}")
-            # Return basic analysis if JSON parsing fails
-            return {
-                "commit_type": "unknown",
-                "impact": "unknown",
-                "summary": response_text.strip(),
-                "key_changes": [],
-                "potential_risks": [],
-                "recommendations": [],
-                "complexity": "unknown",
-                "parse_error": str(e)
-            }
+        
+        error = "incomplete JSON object" if not parser.complete else "invalid JSON object"
+        if not parser.document():
+            error = "no JSON object in response"
+        logger.warning(f"Failed to parse JSON response: {error}")
+        # Return basic analysis if JSON parsing fails
+        return {
+            "commit_type": "unknown",
+            "impact": "unknown",
+            "summary": response_text.strip(),
+            "key_changes": [],
+            "potential_risks": [],
+            "recommendations": [],
+            "complexity": "unknown",
+            "parse_error": error
+        }
     
-    def get_available_models(self) -> list:
-        """Get list of available models"""
-        try:
-            response = requests.get(f"{self.base_url}/api/tags")
-            response.raise_for_status()
-            
-            models = response.json().get("models", [])
-            return [model["name"] for model in models]
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to get available models: {e}")
-            return []
+    async def get_available_models(self) -> list:
+        """Get list of available models (installed on any backend)"""
+        models = set()
+        for backend in self.pool.backends:
+            try:
+                models.update(await self.refresh_models(backend))
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to get available models from {backend.url}: {e}")
+        return sorted(models)
     
-    def load_model(self, model_name: str) -> bool:
-        """Load a specific model"""
-        try:
-            url = f"{self.base_url}/api/generate"
-            payload = {
-                "model": model_name,
-                "prompt": "test",
-                "stream": False
-            }
-            
-            response = requests.post(url, json=payload, timeout=30)
-            response.raise_for_status()
-            
-            logger.info(f"Successfully loaded model: {model_name}")
-            self.model = model_name
-            return True
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Failed to load model {model_name}: {e}")
+    async def preload(self, model_name: str, keep_alive: Optional[str] = None,
+                      backends: Optional[List[str]] = None) -> bool:
+        """
+        Load a model into memory without generating anything
+        
+        Ollama loads the model for a generate request without a prompt and
+        keeps it resident for keep_alive. The model is loaded on every backend
+        that has it (or on the given backend URLs).
+        
+        Returns:
+            True if the model was loaded on at least one backend
+        """
+        targets = [
+            backend for backend in self.pool.backends
+            if (backends is None or backend.url in backends)
+            and (backend.models_checked_at is None or backend.has_model(model_name))
+        ]
+        payload = {
+            "model": model_name,
+            "keep_alive": keep_alive or self.keep_alive
+        }
+        
+        loaded = False
+        for backend in targets:
+            try:
+                response = await self.client.post(
+                    f"{backend.url}/api/generate", json=payload, timeout=OLLAMA_LOAD_TIMEOUT
+                )
+                response.raise_for_status()
+                logger.info(f"Model resident on {backend.url}: {model_name}")
+                loaded = True
+                
+            except httpx.HTTPError as e:
+                logger.error(f"Failed to load model {model_name} on {backend.url}: {e}")
+        return loaded
+    
+    async def running_models(self) -> List[Dict]:
+        """
+        Models currently loaded by each backend (/api/ps), with their expiry and memory use
+        
+        Backends that cannot be reached are skipped.
+        
+        Raises:
+            httpx.HTTPError: If no backend could be reached
+        """
+        running = []
+        error = None
+        answered = False
+        for backend in self.pool.backends:
+            try:
+                response = await self.client.get(f"{backend.url}/api/ps")
+                response.raise_for_status()
+            except httpx.HTTPError as e:
+                logger.warning(f"Failed to list running models on {backend.url}: {e}")
+                error = e
+                continue
+            answered = True
+            running.extend(
+                {
+                    "name": model["name"],
+                    "backend": backend.url,
+                    "expires_at": model.get("expires_at"),
+                    "size_vram": model.get("size_vram")
+                }
+                for model in response.json().get("models", [])
+            )
+        if not answered and error is not None:
+            raise error
+        return running
+    
+    async def load_model(self, model_name: str) -> bool:
+        """Load a specific model and make it the current model"""
+        if not await self.preload(model_name):
             return False
+        self.model = model_name
+        return True
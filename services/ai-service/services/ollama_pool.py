@@ -0,0 +1,142 @@
+# Ollama backend pool for AI Service
+# Spreads generations over several model servers by expected wait, with failover
+import os
+import time
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Set
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Pool settings
+OLLAMA_BACKEND_COOLDOWN = float(os.getenv("OLLAMA_BACKEND_COOLDOWN", "10.0"))  # Seconds a failed backend is avoided
+OLLAMA_TAGS_TTL = float(os.getenv("OLLAMA_TAGS_TTL", "60.0"))  # Seconds a backend's model list is trusted
+SPEED_SMOOTHING = 0.3  # Weight of the newest tokens/s sample
+
+def parse_backend_urls(urls: Optional[str], default_url: str) -> List[str]:
+    """Parse a comma-separated list of Ollama URLs, falling back to a single URL"""
+    parsed = [url.strip().rstrip("/") for url in (urls or "").split(",") if url.strip()]
+    return parsed or [default_url.rstrip("/")]
+
+def model_names(model: str) -> Set[str]:
+    """Names a model may be listed under (Ollama adds ":latest" to untagged models)"""
+    return {model, model if ":" in model else f"{model}:latest"}
+
+class OllamaBackend:
+    """One Ollama server with its load, speed, health and installed models"""
+
+    def __init__(self, url: str):
+        self.url = url
+        self.outstanding = 0
+        self.tokens_per_second: Optional[float] = None
+        self.models: Set[str] = set()
+        self.models_checked_at: Optional[float] = None
+        self.unavailable_until = 0.0
+        self.requests = 0
+        self.failures = 0
+
+    @property
+    def available(self) -> bool:
+        return time.monotonic() >= self.unavailable_until
+
+    def has_model(self, model: str) -> bool:
+        return bool(self.models & model_names(model))
+
+    def models_stale(self) -> bool:
+        return self.models_checked_at is None or time.monotonic() - self.models_checked_at > OLLAMA_TAGS_TTL
+
+    def expected_wait(self, default_speed: float) -> float:
+        """Relative time a new request would wait: queued work over decode speed"""
+        return (self.outstanding + 1) / (self.tokens_per_second or default_speed)
+
+    def status(self) -> Dict:
+        return {
+            "url": self.url,
+            "available": self.available,
+            "outstanding": self.outstanding,
+            "tokens_per_second": self.tokens_per_second,
+            "models": sorted(self.models),
+            "requests": self.requests,
+            "failures": self.failures
+        }
+
+class OllamaBackendPool:
+    """
+    Least-expected-wait dispatch over Ollama backends
+
+    A backend's expected wait is its outstanding requests divided by its
+    observed decode speed (smoothed tokens/s), so faster servers take a
+    proportionally larger share. Backends that recently failed are skipped
+    for a cooldown period unless nothing else is left.
+    """
+
+    def __init__(self, urls: List[str]):
+        self.backends = [OllamaBackend(url) for url in urls]
+        self._lock = threading.Lock()
+
+    def choose(self, model: Optional[str] = None, exclude: Iterable[OllamaBackend] = ()) -> Optional[OllamaBackend]:
+        """
+        Pick the backend with the shortest expected wait
+
+        Args:
+            model: Only consider backends known to have this model, if any do
+            exclude: Backends already tried for this request
+
+        Returns:
+            The chosen backend, or None if every backend was excluded
+        """
+        excluded = set(id(backend) for backend in exclude)
+        candidates = [backend for backend in self.backends if id(backend) not in excluded]
+        if model:
+            candidates = [backend for backend in candidates if backend.has_model(model)]
+        if not candidates:
+            return None
+
+        available = [backend for backend in candidates if backend.available] or candidates
+        speeds = [backend.tokens_per_second for backend in self.backends if backend.tokens_per_second]
+        # Unmeasured backends are assumed to be as fast as the average measured one
+        default_speed = sum(speeds) / len(speeds) if speeds else 1.0
+        return min(available, key=lambda backend: (backend.expected_wait(default_speed), backend.outstanding))
+
+    def acquire(self, backend: OllamaBackend):
+        with self._lock:
+            backend.outstanding += 1
+            backend.requests += 1
+
+    def release(self, backend: OllamaBackend):
+        with self._lock:
+            backend.outstanding -= 1
+
+    def record_speed(self, backend: OllamaBackend, tokens_per_second: Optional[float]):
+        """Fold a generation's decode speed into the backend's average"""
+        if not tokens_per_second:
+            return
+        with self._lock:
+            if backend.tokens_per_second is None:
+                backend.tokens_per_second = tokens_per_second
+            else:
+                backend.tokens_per_second = round(
+                    SPEED_SMOOTHING * tokens_per_second + (1 - SPEED_SMOOTHING) * backend.tokens_per_second, 2
+                )
+
+    def record_failure(self, backend: OllamaBackend, error: Exception):
+        """Avoid a backend for the cooldown period"""
+        with self._lock:
+            backend.failures += 1
+            backend.unavailable_until = time.monotonic() + OLLAMA_BACKEND_COOLDOWN
+        logger.warning(f"Ollama backend {backend.url} failed, avoiding it for {OLLAMA_BACKEND_COOLDOWN}s: {error}")
+
+    def record_models(self, backend: OllamaBackend, models: Iterable[str]):
+        with self._lock:
+            backend.models = set(models)
+            backend.models_checked_at = time.monotonic()
+
+    def status(self) -> List[Dict]:
+        """Per-backend load and health, for health reporting"""
+        return [backend.status() for backend in self.backends]
@@ -0,0 +1,192 @@
+# Prompt builder for AI Service
+# Keeps per-commit analysis prompts under a token budget, however many files a commit touches
+import os
+import math
+import logging
+import posixpath
+import threading
+from typing import Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Largest per-commit prompt in estimated tokens (the system prompt and the answer need room too)
+PROMPT_MAX_TOKENS = int(os.getenv("PROMPT_MAX_TOKENS", "1536"))
+# Share of the budget the commit message may take before it is cut
+MESSAGE_SHARE = 0.5
+# Share of the budget kept for the grouped summary of files not listed one by one
+TAIL_SHARE = 0.25
+# Characters per token assumed by the estimator; code and paths tokenize denser than prose
+CHARS_PER_TOKEN = 3.5
+
+def estimate_tokens(text: str) -> int:
+    """Estimate the tokens a model needs for text, without loading a tokenizer"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+def churn(file_info: Dict) -> int:
+    """Lines added and deleted in a changed file"""
+    return (file_info.get("additions") or 0) + (file_info.get("deletions") or 0)
+
+def file_entry(file_info: Dict) -> str:
+    """Prompt lines describing one changed file"""
+    entry = f"- {file_info.get('filename', 'unknown')} ({file_info.get('status', 'unknown')})\n"
+    if file_info.get("additions"):
+        entry += f"  +{file_info.get('additions')} lines added\n"
+    if file_info.get("deletions"):
+        entry += f"  -{file_info.get('deletions')} lines deleted\n"
+    return entry
+
+def file_patch(file_info: Dict) -> str:
+    """Prompt lines carrying one file's unified diff, or "" if GitHub sent none"""
+    if not file_info.get("patch"):
+        return ""
+    return f"--- {file_info.get('filename', 'unknown')}\n{file_info['patch'].rstrip()}\n"
+
+def file_group(file_info: Dict) -> Tuple[str, str]:
+    """(directory, extension) a changed file is summarized under"""
+    filename = file_info.get("filename", "unknown")
+    directory = posixpath.dirname(filename) or "."
+    extension = posixpath.splitext(filename)[1] or "(no extension)"
+    return directory, extension
+
+class PromptBuilder:
+    """
+    Budgeted per-commit prompt construction
+
+    A commit whose full file listing fits in max_tokens gets exactly that
+    listing, followed by the files' diffs if those fit as well (larger diffs
+    are left to map-reduce analysis, see DiffAnalyzer). Larger commits list
+    their files by churn, largest first, until the budget minus a reserve is
+    used; the remaining files are summarized per directory and extension
+    (largest groups first), and whatever still does not fit is folded into a
+    single closing line. The prompt size, and with it prompt evaluation
+    time, is bounded whatever the commit size.
+    """
+
+    def __init__(self, max_tokens: int = PROMPT_MAX_TOKENS):
+        self.max_tokens = max_tokens
+        self.built = 0
+        self.truncated = 0
+        self._lock = threading.Lock()
+
+    def build(self, commit_message: str, files_changed: Optional[List[Dict]] = None) -> str:
+        """
+        Create the per-commit part of an analysis prompt
+
+        Args:
+            commit_message: The commit message
+            files_changed: List of files changed in the commit
+
+        Returns:
+            Prompt text of at most max_tokens estimated tokens
+        """
+        prompt, _, truncated = self._compose(commit_message, files_changed or [])
+        with self._lock:
+            self.built += 1
+            if truncated:
+                self.truncated += 1
+        return prompt
+
+    def includes_diff(self, commit_message: str, files_changed: Optional[List[Dict]] = None) -> bool:
+        """Whether build() puts the commit's diffs in the prompt (False if there are none)"""
+        return self._compose(commit_message, files_changed or [])[1]
+
+    def _compose(self, commit_message: str, files_changed: List[Dict]) -> Tuple[str, bool, bool]:
+        """(prompt, diffs included, anything cut)"""
+        header = self._message(commit_message)
+        prompt = header
+        if files_changed:
+            prompt += "\nFiles Changed:\n" + "".join(file_entry(f) for f in files_changed)
+
+        cut = header != f"Commit Message: {commit_message}\n"
+        if estimate_tokens(prompt) > self.max_tokens:
+            return self._budgeted(header, files_changed), False, True
+
+        diff = "".join(file_patch(f) for f in files_changed)
+        if diff and estimate_tokens(prompt + "\nDiff:\n" + diff) <= self.max_tokens:
+            return prompt + "\nDiff:\n" + diff, True, cut
+        return prompt, False, cut
+
+    def stats(self) -> Dict:
+        """Budget and how many prompts had to be cut, for health reporting"""
+        return {"max_tokens": self.max_tokens, "built": self.built, "truncated": self.truncated}
+
+    def _message(self, commit_message: str) -> str:
+        header = f"Commit Message: {commit_message}\n"
+        limit = int(self.max_tokens * MESSAGE_SHARE)
+        if estimate_tokens(header) <= limit:
+            return header
+        # The subject line and as much of the body as fits
+        marker = "\n[message truncated]\n"
+        keep = int((limit - estimate_tokens("Commit Message: " + marker)) * CHARS_PER_TOKEN)
+        return f"Commit Message: {commit_message[:max(keep, 0)].rstrip()}{marker}"
+
+    def _budgeted(self, header: str, files_changed: List[Dict]) -> str:
+        ranked = sorted(files_changed, key=lambda f: (-churn(f), f.get("filename", "")))
+        additions = sum(f.get("additions") or 0 for f in files_changed)
+        deletions = sum(f.get("deletions") or 0 for f in files_changed)
+        prompt = header + (
+            f"\nFiles Changed ({len(files_changed)} files, +{additions} -{deletions}; "
+            f"largest changes first):\n"
+        )
+        remaining = self.max_tokens - estimate_tokens(prompt)
+
+        # Individual files, leaving a reserve for the summary of the rest
+        listed = 0
+        file_budget = remaining - int(remaining * TAIL_SHARE)
+        for file_info in ranked:
+            cost = estimate_tokens(file_entry(file_info))
+            if cost > file_budget:
+                break
+            prompt += file_entry(file_info)
+            file_budget -= cost
+            remaining -= cost
+            listed += 1
+
+        tail = ranked[listed:]
+        if not tail:
+            return prompt
+
+        groups: Dict[Tuple[str, str], Dict[str, int]] = {}
+        for file_info in tail:
+            group = groups.setdefault(file_group(file_info), {"files": 0, "additions": 0, "deletions": 0})
+            group["files"] += 1
+            group["additions"] += file_info.get("additions") or 0
+            group["deletions"] += file_info.get("deletions") or 0
+        ordered = sorted(
+            groups.items(),
+            key=lambda item: (-(item[1]["additions"] + item[1]["deletions"]), -item[1]["files"], item[0])
+        )
+
+        # The closing line is always written, so keep room for its longest form
+        closing_reserve = estimate_tokens(
+            f"- {len(tail)} more files in {len(ordered)} other groups, +{additions} -{deletions}\n"
+        )
+        remaining -= closing_reserve
+        summarized = 0
+        for (directory, extension), group in ordered:
+            line = (
+                f"- {directory}/ *{extension}: {group['files']} files, "
+                f"+{group['additions']} -{group['deletions']}\n"
+            )
+            if summarized == 0:
+                line = "Other files by directory and type:\n" + line
+            cost = estimate_tokens(line)
+            if cost > remaining:
+                break
+            prompt += line
+            remaining -= cost
+            summarized += 1
+
+        rest = [group for _, group in ordered[summarized:]]
+        if rest:
+            prompt += (
+                f"- {sum(g['files'] for g in rest)} more files in {len(rest)} other groups, "
+                f"+{sum(g['additions'] for g in rest)} -{sum(g['deletions'] for g in rest)}\n"
+            )
+        return prompt
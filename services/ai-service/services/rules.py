@@ -0,0 +1,149 @@
+# Rule-based commit classifier for AI Service
+# Fills in the analysis schema without a model call for trivially classifiable commits
+import os
+import re
+import logging
+import threading
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rule settings
+RULES_ENABLED = os.getenv("RULES_ENABLED", "true").lower() == "true"
+# Features, fixes and refactors are only classified by rules below this many changed lines
+RULES_MAX_CHANGED_LINES = int(os.getenv("RULES_MAX_CHANGED_LINES", "50"))
+
+# Recorded as model_used for rule-based analyses
+RULES_MODEL = "rules"
+# Stored as the prompt version of rule-based analyses; bump when the rules change
+RULES_VERSION = "1"
+
+# type(scope)!: subject
+CONVENTIONAL_COMMIT = re.compile(r"^(?P<type>[a-zA-Z]+)(?:\((?P<scope>[^)]*)\))?(?P<breaking>!)?:\s*(?P<subject>.+)")
+MERGE_COMMIT = re.compile(r"^Merge (pull request|branch|remote-tracking branch|tag) ")
+BOT_AUTHOR = re.compile(r"\[bot\]|dependabot|renovate|github-actions", re.IGNORECASE)
+DEPENDENCY_BUMP = re.compile(r"^(Bump|Update) \S+ (from|to) ", re.IGNORECASE)
+
+# Conventional commit types whose classification does not depend on the diff
+ALWAYS_TRIVIAL_TYPES = {
+    "docs": "docs",
+    "test": "test",
+    "tests": "test",
+    "chore": "chore",
+    "build": "chore",
+    "ci": "chore",
+    "style": "chore"
+}
+# Conventional commit types classified by rules only for small diffs
+SMALL_DIFF_TYPES = {
+    "feat": "feature",
+    "feature": "feature",
+    "fix": "bugfix",
+    "bugfix": "bugfix",
+    "refactor": "refactor"
+}
+
+def changed_lines(files_changed: Optional[List[Dict]]) -> int:
+    """Total lines added and deleted across the changed files"""
+    return sum((f.get("additions") or 0) + (f.get("deletions") or 0) for f in files_changed or [])
+
+class RuleClassifier:
+    """
+    Deterministic pre-classifier run before the model
+
+    Merge commits, bot commits and conventional-commit prefixes decide the
+    commit type. A result is returned only when that decision is
+    unambiguous; everything else (breaking changes, unknown prefixes, large
+    features and fixes) returns None and goes to the model.
+    """
+
+    def __init__(self, enabled: bool = RULES_ENABLED, max_changed_lines: int = RULES_MAX_CHANGED_LINES):
+        self.enabled = enabled
+        self.max_changed_lines = max_changed_lines
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def classify(self, commit_message: str, files_changed: Optional[List[Dict]] = None,
+                 author: Optional[str] = None) -> Optional[Dict]:
+        """
+        Classify a commit by rules
+
+        Args:
+            commit_message: The commit message
+            files_changed: List of files changed in the commit
+            author: Commit author name or login, if known
+
+        Returns:
+            An analysis matching the analysis schema, or None if the commit
+            needs the model
+        """
+        if not self.enabled:
+            return None
+
+        analysis = self._classify(commit_message or "", files_changed or [], author or "")
+        with self._lock:
+            if analysis is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return analysis
+
+    def stats(self) -> Dict:
+        """Rule hit/miss counters, for health reporting"""
+        return {"enabled": self.enabled, "hits": self.hits, "misses": self.misses}
+
+    def _classify(self, commit_message: str, files_changed: List[Dict], author: str) -> Optional[Dict]:
+        subject = commit_message.strip().splitlines()[0].strip() if commit_message.strip() else ""
+        if not subject:
+            return None
+        lines = changed_lines(files_changed)
+
+        if MERGE_COMMIT.match(subject):
+            return self._analysis("chore", subject, files_changed, lines, "Merge commit")
+
+        if BOT_AUTHOR.search(author) or DEPENDENCY_BUMP.match(subject):
+            return self._analysis("chore", subject, files_changed, lines, "Automated dependency or bot commit")
+
+        match = CONVENTIONAL_COMMIT.match(subject)
+        if not match or match.group("breaking"):
+            return None
+        prefix = match.group("type").lower()
+        if prefix in ALWAYS_TRIVIAL_TYPES:
+            return self._analysis(ALWAYS_TRIVIAL_TYPES[prefix], match.group("subject"), files_changed, lines)
+        if prefix in SMALL_DIFF_TYPES and files_changed and lines <= self.max_changed_lines:
+            return self._analysis(SMALL_DIFF_TYPES[prefix], match.group("subject"), files_changed, lines)
+        return None
+
+    def _analysis(self, commit_type: str, subject: str, files_changed: List[Dict], lines: int,
+                  note: Optional[str] = None) -> Dict:
+        key_changes = [
+            f"{f.get('status', 'modified')} {f.get('filename', 'unknown')}" for f in files_changed[:5]
+        ]
+        if len(files_changed) > 5:
+            key_changes.append(f"{len(files_changed) - 5} more files")
+        if note:
+            key_changes.insert(0, note)
+
+        if lines <= self.max_changed_lines:
+            complexity = "simple"
+        elif lines <= self.max_changed_lines * 10:
+            complexity = "moderate"
+        else:
+            complexity = "complex"
+
+        return {
+            "commit_type": commit_type,
+            "impact": "low" if complexity == "simple" else "medium",
+            "summary": subject[:1].upper() + subject[1:],
+            "key_changes": key_changes,
+            "potential_risks": [],
+            "recommendations": [],
+            "complexity": complexity
+        }
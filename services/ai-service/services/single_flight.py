@@ -0,0 +1,70 @@
+# Single-flight coalescing for AI Service
+# Concurrent callers asking for the same key share one execution of the work
+import asyncio
+import logging
+from typing import Awaitable, Callable, Dict, Generic, Hashable, Tuple, TypeVar
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class _Flight(Generic[T]):
+    """One in-progress execution and the number of callers waiting on it"""
+
+    def __init__(self, task: "asyncio.Future[T]"):
+        self.task = task
+        self.waiters = 0
+
+class SingleFlight:
+    """
+    Runs at most one execution of the work per key at a time in this process
+
+    The first caller for a key starts the work; callers arriving while it
+    runs await the same task and receive its result (or exception). The
+    work is cancelled only when every waiter has gone away, so one client
+    disconnecting does not fail the others.
+    """
+
+    def __init__(self):
+        self._flights: Dict[Hashable, _Flight] = {}
+
+    def in_flight(self) -> int:
+        """Number of keys currently executing"""
+        return len(self._flights)
+
+    async def do(self, key: Hashable, work: Callable[[], Awaitable[T]]) -> Tuple[T, bool]:
+        """
+        Run work for key, or join the execution already running for it
+
+        Args:
+            key: Identity of the work
+            work: Zero-argument callable returning the coroutine to run
+
+        Returns:
+            (result, shared) where shared is True for callers that joined
+            an execution started by another caller
+        """
+        flight = self._flights.get(key)
+        shared = flight is not None
+        if flight is None:
+            flight = _Flight(asyncio.ensure_future(work()))
+            self._flights[key] = flight
+            flight.task.add_done_callback(lambda _: self._forget(key, flight))
+        else:
+            logger.debug(f"Joined in-flight work for {key}")
+
+        flight.waiters += 1
+        try:
+            return await asyncio.shield(flight.task), shared
+        except asyncio.CancelledError:
+            if flight.waiters == 1 and not flight.task.done():
+                flight.task.cancel()
+            raise
+        finally:
+            flight.waiters -= 1
+
+    def _forget(self, key: Hashable, flight: _Flight):
+        # A new flight may already have replaced a cancelled one
+        if self._flights.get(key) is flight:
+            del self._flights[key]
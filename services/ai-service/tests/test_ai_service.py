@@ -1,6 +1,8 @@
+import json
 import pytest
 from unittest.mock import patch, Mock
 from models.analysis import AIAnalysis
+from services.ollama_client import PROMPT_TEMPLATE_VERSION
 
 class TestAIService:
     """Test cases for AI service endpoints."""
@@ -91,6 +93,7 @@ class TestAIService:
             analysis_type=sample_analysis_data["analysis_type"],
             analysis_data=sample_analysis_data["analysis_data"],
             model_used=sample_analysis_data["model_used"],
+            prompt_version=PROMPT_TEMPLATE_VERSION,
             processing_time_ms=sample_analysis_data["processing_time_ms"]
         )
         db_session.add(analysis)
@@ -238,3 +241,31 @@ class TestAIService:
                 if response.status_code == 200:
                     data = response.json()
                     assert "analysis" in data
+    
+    def test_analyze_batch_requires_commits(self, client):
+        """Test batch analysis rejects an empty batch."""
+        response = client.post("/analyze/batch", json={"commits": []})
+        
+        assert response.status_code == 400
+    
+    def test_analyze_batch_streams_results(self, client):
+        """Test batch analysis streams one NDJSON line per commit and a summary."""
+        async def analyze_many(commits):
+            yield 1, RuntimeError("model crashed")
+            yield 0, {"analysis": {"summary": "First"}, "processing_time_ms": 5,
+                      "model_used": "codellama", "cache_hit": True}
+        
+        with patch('services.analysis_service.AnalysisService.analyze_many', side_effect=analyze_many):
+            response = client.post("/analyze/batch", json={"commits": [
+                {"commit_hash": "a1", "message": "First"},
+                {"commit_hash": "b2", "message": "Second"},
+                {"commit_hash": "c3"}
+            ]})
+        
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        lines = [json.loads(line) for line in response.text.splitlines()]
+        assert lines[0] == {"index": 2, "commit_hash": "c3", "error": "Commit message is required"}
+        assert lines[1]["commit_hash"] == "b2" and lines[1]["error"] == "model crashed"
+        assert lines[2]["commit_hash"] == "a1" and lines[2]["analysis"] == {"summary": "First"}
+        assert lines[3] == {"done": True, "total": 3, "failed": 2}
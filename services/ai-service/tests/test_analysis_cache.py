@@ -0,0 +1,155 @@
+import asyncio
+from models.analysis_cache import AnalysisCacheEntry
+from services.analysis_cache import AnalysisCache, cache_key
+from services.analysis_service import AnalysisService
+from services.ollama_client import OllamaClient
+from tests.conftest import TestingSessionLocal
+
+class FakeOllamaClient(OllamaClient):
+    """Ollama client that counts generations instead of calling a model."""
+
+    def __init__(self):
+        super().__init__()
+        self.generations = 0
+
+    async def analyze_prompt(self, prompt, model=None):
+        self.generations += 1
+        return {
+            "analysis": {"commit_type": "bugfix", "summary": "Fixes a crash"},
+            "processing_time_ms": 1200,
+            "model_used": model or self.model,
+            "raw_response": "{}"
+        }
+
+class TestAnalysisCache:
+    """Test cases for the content-addressed analysis cache."""
+
+    def test_cache_key_depends_on_model_version_and_prompt(self):
+        """Test every part of the content address changes the key."""
+        base = cache_key("codellama", "1", "prompt")
+        assert base == cache_key("codellama", "1", "prompt")
+        assert base != cache_key("llama3", "1", "prompt")
+        assert base != cache_key("codellama", "2", "prompt")
+        assert base != cache_key("codellama", "1", "other prompt")
+
+    def test_identical_commits_generate_once(self, db_session):
+        """Test a repeated prompt is served from the cache and reports the hit."""
+        ollama = FakeOllamaClient()
+        service = AnalysisService(ollama, AnalysisCache(TestingSessionLocal))
+
+        async def scenario():
+            first = await service.analyze_commit("Fix crash on empty list")
+            second = await service.analyze_commit("Fix crash on empty list")
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert ollama.generations == 1
+        assert first["cache_hit"] is False
+        assert second["cache_hit"] is True
+        assert second["analysis"] == first["analysis"]
+
+    def test_entries_persist_across_processes(self, db_session):
+        """Test a fresh in-process cache falls back to the database."""
+        ollama = FakeOllamaClient()
+        asyncio.run(AnalysisService(ollama, AnalysisCache(TestingSessionLocal)).analyze_commit("Fix crash"))
+
+        # A new cache has an empty LRU, like another replica or a restart
+        result = asyncio.run(AnalysisService(ollama, AnalysisCache(TestingSessionLocal)).analyze_commit("Fix crash"))
+        assert result["cache_hit"] is True
+        assert ollama.generations == 1
+        assert db_session.query(AnalysisCacheEntry).one().hit_count == 1
+
+    def test_lru_is_bounded(self, db_session):
+        """Test the in-process cache evicts the least recently used entries."""
+        cache = AnalysisCache(TestingSessionLocal, max_entries=2)
+        cache.put_local("a", {"analysis": {}})
+        cache.put_local("b", {"analysis": {}})
+        cache.get_local("a")
+        cache.put_local("c", {"analysis": {}})
+
+        assert cache.get_local("a") is not None
+        assert cache.get_local("b") is None
+        assert cache.get_local("c") is not None
+
+    def test_stream_served_from_cache(self, db_session):
+        """Test a streamed analysis of a cached prompt is a single result event."""
+        ollama = FakeOllamaClient()
+        service = AnalysisService(ollama, AnalysisCache(TestingSessionLocal))
+
+        async def scenario():
+            await service.analyze_commit("Fix crash")
+            return [event async for event in service.stream_commit("Fix crash")]
+
+        events = asyncio.run(scenario())
+        assert len(events) == 1
+        assert events[0]["type"] == "result"
+        assert events[0]["cache_hit"] is True
+        assert ollama.generations == 1
+
+class GatedOllamaClient(OllamaClient):
+    """Ollama client whose generations wait until released, tracking their concurrency."""
+
+    def __init__(self):
+        super().__init__()
+        self.release = None
+        self.active = 0
+        self.max_active = 0
+
+    async def analyze_prompt(self, prompt, model=None):
+        self.active += 1
+        self.max_active = max(self.max_active, self.active)
+        try:
+            await self.release.wait()
+            if "Explode" in prompt:
+                raise RuntimeError("model crashed")
+            return {"analysis": {"summary": prompt.strip()}, "processing_time_ms": 5, "model_used": self.model}
+        finally:
+            self.active -= 1
+
+class TestAnalyzeMany:
+    """Test cases for analyzing many commits with results streamed as they finish."""
+
+    def test_cached_results_do_not_wait_for_generations(self, db_session):
+        """Test cache hits are yielded before generations finish and failures stay per item."""
+        ollama = GatedOllamaClient()
+        service = AnalysisService(ollama, AnalysisCache(TestingSessionLocal))
+        commits = [{"message": f"Change {n}"} for n in range(5)] + [{"message": "Explode"}, {"message": "Cached"}]
+
+        async def scenario():
+            ollama.release = asyncio.Event()
+            ollama.release.set()
+            await service.analyze_commit("Cached")
+            ollama.release.clear()
+
+            results = []
+            async for index, result in service.analyze_many(commits, concurrency=2):
+                results.append((index, result))
+                if len(results) == 1:
+                    # Nothing has been generated yet; let the generations queue up first
+                    asyncio.get_running_loop().call_later(0.01, ollama.release.set)
+            return results
+
+        results = asyncio.run(scenario())
+
+        assert results[0][0] == 6 and results[0][1]["cache_hit"] is True
+        assert sorted(index for index, _ in results) == list(range(7))
+        errors = [index for index, result in results if isinstance(result, Exception)]
+        assert errors == [5]
+        assert ollama.max_active == 2
+
+    def test_closing_cancels_outstanding_generations(self, db_session):
+        """Test abandoning the iterator cancels generations still running."""
+        ollama = GatedOllamaClient()
+        service = AnalysisService(ollama, AnalysisCache(TestingSessionLocal))
+
+        async def scenario():
+            ollama.release = asyncio.Event()
+            results = service.analyze_many([{"message": "One"}, {"message": "Two"}])
+            waiting = asyncio.ensure_future(results.__anext__())
+            await asyncio.sleep(0.01)
+            active = ollama.active
+            waiting.cancel()
+            await asyncio.sleep(0.01)
+            return active, ollama.active
+
+        assert asyncio.run(scenario()) == (2, 0)
@@ -0,0 +1,149 @@
+import asyncio
+from contextlib import AsyncExitStack
+import httpx
+import pytest
+from services.concurrency_limiter import AdaptiveConcurrencyLimiter, workload
+from tests.test_ollama_client import make_client, ndjson
+
+async def hold(limiter, started, release):
+    async with limiter.slot() as permit:
+        started.append(permit)
+        await release.wait()
+
+class TestAdaptiveConcurrencyLimiter:
+    """Test cases for the AIMD limit on concurrent generations."""
+
+    def test_requests_over_limit_wait(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+            started, release = [], asyncio.Event()
+            tasks = [asyncio.create_task(hold(limiter, started, release)) for _ in range(3)]
+            await asyncio.sleep(0)
+            status = limiter.status()
+            release.set()
+            await asyncio.gather(*tasks)
+            return status, len(started), limiter.status()
+
+        status, started, after = asyncio.run(scenario())
+
+        assert status["in_flight"] == 2
+        assert status["queued"] == 1
+        assert started == 3
+        assert after["in_flight"] == 0 and after["queued"] == 0
+
+    def test_cancelled_waiter_leaves_queue(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=1)
+            started, release = [], asyncio.Event()
+            holder = asyncio.create_task(hold(limiter, started, release))
+            waiter = asyncio.create_task(hold(limiter, started, release))
+            await asyncio.sleep(0)
+            waiter.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await waiter
+            queued = limiter.queued
+            release.set()
+            await holder
+            return queued, limiter.in_flight
+
+        assert asyncio.run(scenario()) == (0, 0)
+
+    def test_limit_grows_while_latency_is_flat(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4)
+            for _ in range(20):
+                # Fill every slot so growth is warranted
+                async with AsyncExitStack() as stack:
+                    for _ in range(int(limiter.limit)):
+                        permit = await stack.enter_async_context(limiter.slot())
+                    permit.record(100)
+            return limiter
+
+        limiter = asyncio.run(scenario())
+
+        assert int(limiter.limit) == 4
+        assert limiter.increases == 2
+
+    def test_limit_does_not_grow_when_unused(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=2)
+            for _ in range(20):
+                async with limiter.slot() as permit:
+                    permit.record(100)
+            return limiter
+
+        assert int(asyncio.run(scenario()).limit) == 2
+
+    def test_limit_backs_off_when_latency_climbs(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=8, tolerance=2.0, backoff=0.5)
+            async with limiter.slot() as permit:
+                permit.record(100)
+            # A burst of slow responses from requests started together cuts the limit once
+            permits = []
+            for _ in range(3):
+                async with limiter.slot() as permit:
+                    permits.append(permit)
+            for permit in permits:
+                permit.record(500)
+            return limiter
+
+        limiter = asyncio.run(scenario())
+
+        assert int(limiter.limit) == 4
+        assert limiter.decreases == 1
+
+    def test_slower_workloads_have_their_own_baseline(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=4, tolerance=2.0)
+            small, large = workload("tiny", 200), workload("codellama", 3000)
+            for _ in range(20):
+                # A small model on short prompts and a large one on long prompts, saturating the limit
+                async with AsyncExitStack() as stack:
+                    permits = [
+                        await stack.enter_async_context(limiter.slot(small if index % 2 else large))
+                        for index in range(int(limiter.limit))
+                    ]
+                    for permit in permits:
+                        permit.record(100 if permit.workload == small else 2000)
+            return limiter
+
+        limiter = asyncio.run(scenario())
+
+        assert limiter.decreases == 0
+        assert int(limiter.limit) == 4
+        assert set(limiter.status()["baselines_ms"]) == {"tiny/256", "codellama/4096"}
+
+    def test_limit_respects_minimum(self):
+        async def scenario():
+            limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=1, backoff=0.5)
+            for _ in range(5):
+                async with limiter.slot() as permit:
+                    permit.overload()
+            return limiter
+
+        assert int(asyncio.run(scenario()).limit) == 1
+
+    def test_generation_reports_latency(self):
+        def handler(request):
+            return httpx.Response(200, content=ndjson(
+                {"response": "ok", "done": False},
+                {"response": "", "done": True, "eval_count": 1, "eval_duration": 1_000_000}
+            ))
+
+        ollama = make_client(handler)
+        asyncio.run(ollama.generate("hi"))
+
+        status = ollama.limiter.status()
+        assert list(status["baselines_ms"]) == [workload(ollama.model, 1)]
+        assert status["in_flight"] == 0
+
+    def test_server_error_lowers_limit(self):
+        ollama = make_client(lambda request: httpx.Response(503, json={"error": "busy"}))
+        ollama.limiter.limit = 4.0
+
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(ollama.generate("hi"))
+
+        assert ollama.limiter.limit == 3.0
+        assert ollama.limiter.in_flight == 0
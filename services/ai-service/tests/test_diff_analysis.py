@@ -0,0 +1,192 @@
+import asyncio
+import json
+from services.analysis_cache import AnalysisCache
+from services.analysis_service import AnalysisService
+from services.diff_analysis import DiffAnalyzer, chunk_diff, split_hunks
+from services.ollama_client import OllamaClient
+from services.prompt_builder import PromptBuilder, estimate_tokens
+from tests.conftest import TestingSessionLocal
+
+def make_patch(hunks, lines_per_hunk=5):
+    """Unified diff with the given number of hunks."""
+    return "".join(
+        f"@@ -{h * 10},{lines_per_hunk} +{h * 10},{lines_per_hunk} @@\n"
+        + "".join(f"+added line {h}.{n} of the change\n" for n in range(lines_per_hunk))
+        for h in range(hunks)
+    )
+
+def large_commit():
+    return [
+        {"filename": f"src/module{i}.py", "status": "modified", "additions": 40, "deletions": 0,
+         "patch": make_patch(8)}
+        for i in range(4)
+    ]
+
+class FakeOllamaClient(OllamaClient):
+    """Ollama client that summarizes chunks and records the analysis prompt."""
+
+    def __init__(self, fail_on=None, missing_model=None):
+        super().__init__()
+        self.summaries = 0
+        self.prompts = []
+        self.models = []
+        self.fail_on = fail_on
+        self.missing_model = missing_model
+
+    async def generate(self, prompt, model=None, options=None, format=None, stop=None, system=None):
+        self.models.append(model)
+        if model == self.missing_model:
+            raise RuntimeError(f"Model {model} is not available on any Ollama backend")
+        if self.fail_on is not None and self.fail_on in prompt:
+            raise RuntimeError("Ollama error: out of memory")
+        self.summaries += 1
+        response = json.dumps({"summary": f"Part touching {prompt.count('@@ ') // 2} hunks",
+                               "key_changes": ["Adds lines"], "potential_risks": []})
+        if stop is not None:
+            stop(response)
+        return {"done": True, "response": response}
+
+    async def analyze_prompt(self, prompt, model=None):
+        self.prompts.append(prompt)
+        return {
+            "analysis": {"commit_type": "feature", "summary": "Adds modules"},
+            "processing_time_ms": 100,
+            "model_used": model or self.model,
+            "raw_response": "{}"
+        }
+
+class TestChunking:
+    """Test cases for hunk-aligned chunking of diffs."""
+
+    def test_split_hunks(self):
+        """Test a patch is split at its @@ headers."""
+        hunks = split_hunks(make_patch(3))
+        assert len(hunks) == 3
+        assert all(hunk.startswith("@@") for hunk in hunks)
+        assert "".join(hunks) == make_patch(3)
+
+    def test_chunks_are_hunk_aligned_and_bounded(self):
+        """Test chunks stay under the limit without splitting hunks that fit."""
+        chunks = chunk_diff(large_commit(), max_tokens=200)
+        assert len(chunks) > 1
+        assert all(estimate_tokens(chunk) <= 200 for chunk in chunks)
+        # Every hunk survives whole, and every chunk says which file it is from
+        joined = "".join(chunks)
+        assert joined.count("@@ -") == 32
+        assert all(chunk.startswith("--- src/module") for chunk in chunks)
+
+    def test_oversized_hunk_is_split_with_its_header(self):
+        """Test a hunk larger than a chunk is cut on line boundaries."""
+        files = [{"filename": "big.py", "status": "added", "additions": 200, "patch": make_patch(1, 200)}]
+        chunks = chunk_diff(files, max_tokens=300)
+        assert len(chunks) > 1
+        assert all(estimate_tokens(chunk) <= 300 for chunk in chunks)
+        assert all("@@ -0,200 +0,200 @@" in chunk for chunk in chunks)
+
+    def test_small_diff_stays_in_the_prompt(self):
+        """Test the prompt builder includes diffs that fit and leaves out those that do not."""
+        builder = PromptBuilder(max_tokens=1536)
+        small = [{"filename": "a.py", "status": "modified", "additions": 1, "patch": "@@ -1 +1 @@\n+x = 1\n"}]
+        assert builder.includes_diff("Fix", small)
+        assert "+x = 1" in builder.build("Fix", small)
+        assert not builder.includes_diff("Add modules", large_commit())
+        assert "@@" not in builder.build("Add modules", large_commit())
+
+class TestDiffAnalyzer:
+    """Test cases for map-reduce analysis of large diffs."""
+
+    def test_reduce_prompt_carries_chunk_summaries(self, db_session):
+        """Test the reduce prompt lists the files and one summary per chunk."""
+        ollama = FakeOllamaClient()
+        analyzer = DiffAnalyzer(ollama, chunk_tokens=300, concurrency=1)
+
+        prompt, stats = asyncio.run(analyzer.reduce_prompt("Add modules", large_commit()))
+        assert stats["chunks"] == ollama.summaries > 1
+        assert stats["cached_chunks"] == 0
+        assert "src/module0.py" in prompt
+        assert "@@" not in prompt
+        assert prompt.count("- Part ") == stats["chunks"]
+        assert estimate_tokens(prompt) <= ollama.prompt_builder.max_tokens
+
+    def test_chunk_summaries_are_cached(self, db_session):
+        """Test a re-analysis only summarizes chunks it has not seen."""
+        ollama = FakeOllamaClient()
+        analyzer = DiffAnalyzer(ollama, AnalysisCache(TestingSessionLocal), chunk_tokens=300, concurrency=1)
+        files = large_commit()
+
+        _, first = asyncio.run(analyzer.reduce_prompt("Add modules", files))
+        generated = ollama.summaries
+        _, second = asyncio.run(analyzer.reduce_prompt("Add modules, reworded", files))
+        assert ollama.summaries == generated
+        assert second["cached_chunks"] == first["chunks"]
+
+    def test_too_many_chunks_keep_the_largest_files(self, db_session):
+        """Test the chunk count is capped and the rest is mentioned."""
+        ollama = FakeOllamaClient()
+        analyzer = DiffAnalyzer(ollama, chunk_tokens=200, concurrency=1, max_chunks=2)
+
+        prompt, stats = asyncio.run(analyzer.reduce_prompt("Add modules", large_commit()))
+        assert stats["chunks"] == 2
+        assert stats["skipped_chunks"] > 0
+        assert "were not summarized" in prompt
+
+    def test_failed_chunk_does_not_fail_the_analysis(self, db_session):
+        """Test a chunk Ollama errors on is left as a placeholder."""
+        ollama = FakeOllamaClient(fail_on="src/module0.py")
+        analyzer = DiffAnalyzer(ollama, chunk_tokens=300, concurrency=1)
+
+        prompt, stats = asyncio.run(analyzer.reduce_prompt("Add modules", large_commit()))
+        assert "could not be summarized" in prompt
+        assert ollama.summaries == stats["chunks"] - prompt.count("could not be summarized") > 0
+
+    def test_missing_tier_falls_back_to_current_model(self, db_session):
+        """Test chunks are summarized by the current model when the requested one is not pulled."""
+        ollama = FakeOllamaClient(missing_model="tiny:latest")
+        analyzer = DiffAnalyzer(ollama, chunk_tokens=300, concurrency=1)
+
+        prompt, stats = asyncio.run(analyzer.reduce_prompt("Add modules", large_commit(), model="tiny:latest"))
+        assert "could not be summarized" not in prompt
+        assert ollama.summaries == stats["chunks"]
+        assert ollama.models.count(ollama.model) == stats["chunks"]
+
+        # Once the backends' model lists are known, the missing model is not tried at all
+        ollama.pool.record_models(ollama.pool.backends[0], [ollama.model])
+        ollama.models.clear()
+        asyncio.run(analyzer.reduce_prompt("Add modules", large_commit(), model="tiny:latest"))
+        assert "tiny:latest" not in ollama.models
+
+    def test_service_analyzes_large_diffs_by_map_reduce(self, db_session):
+        """Test the analysis service reduces large diffs and records the map step."""
+        ollama = FakeOllamaClient()
+        service = AnalysisService(
+            ollama, AnalysisCache(TestingSessionLocal),
+            diff_analyzer=DiffAnalyzer(ollama, chunk_tokens=300, concurrency=1)
+        )
+
+        async def scenario():
+            first = await service.analyze_commit("Add modules", large_commit())
+            second = await service.analyze_commit("Add modules", large_commit())
+            return first, second
+
+        first, second = asyncio.run(scenario())
+        assert len(ollama.prompts) == 1
+        assert "Summaries of the diff" in ollama.prompts[0]
+        assert first["routing"]["map_reduce"]["chunks"] > 1
+        assert second["cache_hit"] is True
+
+    def test_changed_diff_is_not_served_from_cache(self, db_session):
+        """Test two commits with the same files but different diffs are analyzed separately."""
+        ollama = FakeOllamaClient()
+        service = AnalysisService(
+            ollama, AnalysisCache(TestingSessionLocal),
+            diff_analyzer=DiffAnalyzer(ollama, chunk_tokens=300, concurrency=1)
+        )
+        changed = large_commit()
+        changed[0] = {**changed[0], "patch": make_patch(8).replace("added", "changed")}
+
+        async def scenario():
+            await service.analyze_commit("Add modules", large_commit())
+            return await service.analyze_commit("Add modules", changed)
+
+        assert asyncio.run(scenario())["cache_hit"] is False
+        assert len(ollama.prompts) == 2
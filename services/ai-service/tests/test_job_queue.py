@@ -0,0 +1,307 @@
+import asyncio
+from unittest.mock import patch
+from models.analysis import AIAnalysis
+from models.analysis_job import AnalysisJob
+from services.job_queue import (
+    AnalysisWorkerPool, LaneScheduler, BACKFILL, enqueue_job, lease_job, fail_job, promote_commit, queue_depths,
+    renew_leases
+)
+from services.analysis_service import AnalysisService
+from services.ollama_client import OllamaClient
+from services.rules import RuleClassifier, RULES_MODEL
+from tests.conftest import TestingSessionLocal
+
+COMMIT_DATA = {"message": "Fix crash on empty list", "files_changed": []}
+
+class FakeAnalysisService(AnalysisService):
+    """Analysis service returning a fixed result without calling a model."""
+
+    def __init__(self, error=None, delay=0):
+        super().__init__(OllamaClient())
+        self.error = error
+        self.delay = delay
+        self.calls = 0
+
+    async def analyze_commit(self, commit_message, files_changed=None):
+        self.calls += 1
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return {
+            "analysis": {"commit_type": "bugfix", "summary": commit_message},
+            "processing_time_ms": 10,
+            "model_used": self.ollama_client.model
+        }
+
+class BatchOllamaClient(OllamaClient):
+    """Ollama client answering batches for all but the commits listed in drop."""
+
+    def __init__(self, drop=()):
+        super().__init__()
+        self.drop = drop
+        self.batches = []
+        self.singles = []
+
+    async def analyze_batch(self, prompts, model=None):
+        self.batches.append(prompts)
+        return [
+            None if any(word in prompt for word in self.drop) else {
+                "analysis": {"commit_type": "bugfix", "summary": prompt.strip()},
+                "processing_time_ms": 5,
+                "model_used": model or self.model,
+                "batch_size": len(prompts)
+            }
+            for prompt in prompts
+        ]
+
+    async def analyze_prompt(self, prompt, model=None):
+        self.singles.append(prompt)
+        return {"analysis": {"commit_type": "bugfix", "summary": prompt.strip()},
+                "processing_time_ms": 10, "model_used": model or self.model}
+
+class TestJobQueue:
+    """Test cases for the persisted analysis job queue."""
+
+    def test_enqueue_reuses_active_job(self, db_session):
+        """Test a commit with a queued job is not queued twice."""
+        first = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        second = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        assert first.id == second.id
+        assert db_session.query(AnalysisJob).count() == 1
+
+    def test_lease_takes_oldest_job_once(self, db_session):
+        """Test jobs are leased in order and not handed out twice."""
+        first = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        second = enqueue_job(db_session, "def456", COMMIT_DATA)
+
+        leased = lease_job(db_session, "worker-1")
+        assert leased.id == first.id
+        assert leased.status == "running"
+        assert leased.attempts == 1
+        assert leased.lease_owner == "worker-1"
+
+        assert lease_job(db_session, "worker-2").id == second.id
+        assert lease_job(db_session, "worker-3") is None
+
+    def test_failed_job_requeued_until_attempts_exhausted(self, db_session):
+        """Test failures are retried up to the attempt limit."""
+        enqueue_job(db_session, "abc123", COMMIT_DATA)
+
+        job = lease_job(db_session, "worker-1")
+        fail_job(db_session, job, "model timeout", max_attempts=2)
+        assert job.status == "queued"
+
+        job = lease_job(db_session, "worker-1")
+        fail_job(db_session, job, "model timeout", max_attempts=2)
+        assert job.status == "failed"
+        assert job.error == "model timeout"
+
+    def test_expired_job_failed_after_attempts_exhausted(self, db_session):
+        """Test a job whose worker dies on every attempt is failed instead of re-leased."""
+        enqueue_job(db_session, "abc123", COMMIT_DATA)
+
+        job = lease_job(db_session, "worker-1", lease_seconds=-1, max_attempts=2)
+        assert lease_job(db_session, "worker-2", lease_seconds=-1, max_attempts=2).id == job.id
+
+        assert lease_job(db_session, "worker-3", max_attempts=2) is None
+        db_session.refresh(job)
+        assert job.status == "failed"
+        assert job.attempts == 2
+        assert job.error == "Exceeded 2 attempts after lease expiry"
+        assert job.lease_owner is None
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_worker_processes_job(self, mock_publish, db_session):
+        """Test a worker stores the analysis and completes the job."""
+        job = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        pool = AnalysisWorkerPool(FakeAnalysisService(), TestingSessionLocal, size=1)
+
+        assert asyncio.run(pool.run_once("worker-1")) is True
+        assert asyncio.run(pool.run_once("worker-1")) is False
+
+        db_session.expire_all()
+        job = db_session.query(AnalysisJob).filter(AnalysisJob.id == job.id).first()
+        assert job.status == "completed"
+        analysis = db_session.query(AIAnalysis).filter(AIAnalysis.id == job.analysis_id).first()
+        assert analysis.commit_hash == "abc123"
+        assert mock_publish.call_args.args[0]["commit_hash"] == "abc123"
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_worker_reuses_stored_analysis(self, mock_publish, db_session):
+        """Test a job for an already analyzed commit completes without generating again."""
+        service = FakeAnalysisService()
+        pool = AnalysisWorkerPool(service, TestingSessionLocal, size=1)
+        enqueue_job(db_session, "abc123", COMMIT_DATA)
+        asyncio.run(pool.run_once("worker-1"))
+
+        job = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        asyncio.run(pool.run_once("worker-1"))
+
+        db_session.expire_all()
+        assert service.calls == 1
+        assert db_session.query(AIAnalysis).count() == 1
+        assert db_session.query(AnalysisJob).filter(AnalysisJob.id == job.id).one().status == "completed"
+        assert mock_publish.call_count == 1
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_bot_commit_classified_by_rules(self, mock_publish, db_session):
+        """Test a queued bot commit is answered by the rules, using the author stored with the job."""
+        ollama = BatchOllamaClient()
+        service = AnalysisService(ollama, rules=RuleClassifier(enabled=True))
+        pool = AnalysisWorkerPool(service, TestingSessionLocal, size=1)
+        enqueue_job(db_session, "abc123", {
+            "message": "Update workflow configuration", "files_changed": [], "author": "github-actions[bot]"
+        })
+
+        asyncio.run(pool.run_once("worker-1"))
+
+        assert ollama.singles == [] and ollama.batches == []
+        assert db_session.query(AIAnalysis).one().model_used == RULES_MODEL
+
+    def test_worker_records_failure(self, db_session):
+        """Test a failing analysis is recorded on the job."""
+        job = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        pool = AnalysisWorkerPool(FakeAnalysisService(RuntimeError("Ollama down")), TestingSessionLocal, size=1)
+
+        asyncio.run(pool.run_once("worker-1"))
+
+        db_session.expire_all()
+        job = db_session.query(AnalysisJob).filter(AnalysisJob.id == job.id).first()
+        assert job.status == "queued"
+        assert job.error == "Ollama down"
+
+    def test_outcome_of_lost_lease_is_not_recorded(self, db_session):
+        """Test a worker whose lease was taken over does not overwrite the new owner's job."""
+        job = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        lease_job(db_session, "worker-1", lease_seconds=-1)
+        assert lease_job(db_session, "worker-2").id == job.id
+        pool = AnalysisWorkerPool(FakeAnalysisService(), TestingSessionLocal, size=1)
+
+        pool._complete(job.id, "worker-1", 1)
+        pool._fail(job.id, "worker-1", "late failure")
+        assert renew_leases(db_session, [job.id], "worker-1") == 0
+
+        db_session.expire_all()
+        job = db_session.query(AnalysisJob).filter(AnalysisJob.id == job.id).one()
+        assert job.status == "running"
+        assert job.lease_owner == "worker-2"
+        assert job.error is None
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_lease_renewed_while_analyzing(self, mock_publish, db_session):
+        """Test a job running longer than its lease is not handed to another worker."""
+        job = enqueue_job(db_session, "abc123", COMMIT_DATA)
+        pool = AnalysisWorkerPool(FakeAnalysisService(delay=0.5), TestingSessionLocal, size=1, lease_seconds=0.3)
+
+        async def scenario():
+            worker = asyncio.create_task(pool.run_once("worker-1"))
+            await asyncio.sleep(0.4)
+            db = TestingSessionLocal()
+            try:
+                stolen = lease_job(db, "worker-2")
+            finally:
+                db.close()
+            await worker
+            return stolen
+
+        assert asyncio.run(scenario()) is None
+        db_session.expire_all()
+        assert db_session.query(AnalysisJob).filter(AnalysisJob.id == job.id).one().status == "completed"
+
+class TestBatchedJobs:
+    """Test cases for analyzing backfill jobs in batches."""
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_backfill_jobs_share_one_generation(self, mock_publish, db_session):
+        """Test leased backfill jobs are analyzed together and unparsed ones on their own."""
+        ollama = BatchOllamaClient(drop=("Broken",))
+        pool = AnalysisWorkerPool(AnalysisService(ollama), TestingSessionLocal, size=1, batch_size=3)
+        for commit_hash, message in [("a1", "Fix crash"), ("b2", "Broken thing"), ("c3", "Add cache")]:
+            enqueue_job(db_session, commit_hash, {"message": message, "files_changed": []}, priority=BACKFILL)
+
+        assert asyncio.run(pool.run_once("worker-1")) is True
+
+        db_session.expire_all()
+        assert len(ollama.batches) == 1 and len(ollama.batches[0]) == 3
+        assert ollama.singles == ["Commit Message: Broken thing\n"]
+        assert {job.status for job in db_session.query(AnalysisJob).all()} == {"completed"}
+        analyses = {a.commit_hash: a for a in db_session.query(AIAnalysis).all()}
+        assert analyses["a1"].routing == {"policy": "batch", "batch_size": 3}
+        assert analyses["b2"].routing is None
+        assert mock_publish.call_count == 3
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_stored_commits_not_batched(self, mock_publish, db_session):
+        """Test commits that already have an analysis are not sent to the model again."""
+        ollama = BatchOllamaClient()
+        service = AnalysisService(ollama)
+        pool = AnalysisWorkerPool(service, TestingSessionLocal, size=1, batch_size=3)
+        asyncio.run(service.analyze_and_store(TestingSessionLocal, "a1", "Fix crash"))
+        for commit_hash, message in [("a1", "Fix crash"), ("b2", "Add cache")]:
+            enqueue_job(db_session, commit_hash, {"message": message, "files_changed": []}, priority=BACKFILL)
+
+        asyncio.run(pool.run_once("worker-1"))
+
+        assert ollama.batches == []
+        assert ollama.singles == ["Commit Message: Fix crash\n", "Commit Message: Add cache\n"]
+        assert mock_publish.call_count == 1
+
+    @patch('services.job_queue.publish_analysis_event')
+    def test_interactive_jobs_not_batched(self, mock_publish, db_session):
+        """Test interactive jobs are analyzed one at a time."""
+        ollama = BatchOllamaClient()
+        pool = AnalysisWorkerPool(AnalysisService(ollama), TestingSessionLocal, size=1, batch_size=3)
+        enqueue_job(db_session, "a1", {"message": "Fix crash", "files_changed": []})
+        enqueue_job(db_session, "b2", {"message": "Add cache", "files_changed": []})
+
+        asyncio.run(pool.run_once("worker-1"))
+
+        assert ollama.batches == []
+        assert len(ollama.singles) == 1
+
+class TestPriorityLanes:
+    """Test cases for interactive and backfill lanes."""
+
+    def test_interactive_lane_leased_first(self, db_session):
+        """Test an interactive job jumps ahead of older backfill jobs."""
+        enqueue_job(db_session, "old", COMMIT_DATA, priority="backfill")
+        enqueue_job(db_session, "new", COMMIT_DATA, priority="interactive")
+
+        assert lease_job(db_session, "worker-1", ["interactive", "backfill"]).commit_hash == "new"
+        assert lease_job(db_session, "worker-1", ["interactive", "backfill"]).commit_hash == "old"
+
+    def test_interactive_request_promotes_backfill_job(self, db_session):
+        """Test asking for a commit moves its queued backfill job to the interactive lane."""
+        job = enqueue_job(db_session, "abc123", COMMIT_DATA, priority="backfill")
+        promote_commit(db_session, "abc123")
+        assert job.priority == "interactive"
+
+        depths = queue_depths(db_session)
+        assert depths["interactive"]["queued"] == 1
+        assert depths["backfill"]["queued"] == 0
+
+    def test_scheduler_shares_by_weight(self):
+        """Test busy lanes are served in proportion to their weights."""
+        scheduler = LaneScheduler({"interactive": 4.0, "backfill": 1.0})
+        picks = []
+        for _ in range(50):
+            lane = scheduler.order()[0]
+            scheduler.record(lane)
+            picks.append(lane)
+
+        assert picks.count("interactive") == 40
+        assert picks.count("backfill") == 10
+
+    def test_idle_lane_does_not_bank_credit(self):
+        """Test a lane that was empty does not starve the other when work arrives."""
+        scheduler = LaneScheduler({"interactive": 4.0, "backfill": 1.0})
+        # Only backfill work for a while: interactive is tried first and found empty
+        for _ in range(20):
+            scheduler.record("backfill", skipped=["interactive"])
+
+        picks = []
+        for _ in range(10):
+            lane = scheduler.order()[0]
+            scheduler.record(lane)
+            picks.append(lane)
+        assert "backfill" in picks
@@ -0,0 +1,106 @@
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+import httpx
+from services.model_pool import ModelWarmPool, parse_expiry
+from tests.test_ollama_client import make_client
+
+def ps_response(models):
+    """Body of Ollama's /api/ps listing the given (name, expires_at) pairs."""
+    return {"models": [{"name": name, "expires_at": expires_at, "size_vram": 1024} for name, expires_at in models]}
+
+def expires_in(seconds):
+    return (datetime.now(timezone.utc) + timedelta(seconds=seconds)).isoformat()
+
+class TestModelWarmPool:
+    """Test cases for preloading and keeping models resident."""
+
+    def test_missing_models_preloaded_with_keep_alive(self):
+        """Test models that are not resident are loaded without a prompt."""
+        loads = []
+        def handler(request):
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json=ps_response([("codellama:latest", expires_in(3600))]))
+            payload = json.loads(request.content)
+            loads.append(payload)
+            return httpx.Response(200, json={"model": payload["model"], "done": True})
+
+        ollama = make_client(handler)
+        pool = ModelWarmPool(ollama, ["codellama", "qwen2.5-coder:1.5b"], refresh_interval=60)
+
+        assert asyncio.run(pool.refresh()) == ["qwen2.5-coder:1.5b"]
+        assert loads == [{"model": "qwen2.5-coder:1.5b", "keep_alive": ollama.keep_alive}]
+        assert "prompt" not in loads[0]
+        assert pool.status()["resident"] == ["codellama:latest"]
+
+    def test_expiring_model_refreshed(self):
+        """Test a model whose keep-alive runs out before the next check is reloaded."""
+        loads = []
+        def handler(request):
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json=ps_response([("codellama:latest", expires_in(10))]))
+            loads.append(json.loads(request.content)["model"])
+            return httpx.Response(200, json={"done": True})
+
+        pool = ModelWarmPool(make_client(handler), ["codellama"], refresh_interval=60)
+        asyncio.run(pool.refresh())
+        assert loads == ["codellama"]
+
+    def test_failed_preload_counted(self):
+        """Test load failures are reported instead of raised."""
+        def handler(request):
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": []})
+            return httpx.Response(404, json={"error": "model not found"})
+
+        pool = ModelWarmPool(make_client(handler), ["missing"], refresh_interval=60)
+        assert asyncio.run(pool.refresh()) == []
+        assert pool.status()["load_failures"] == 1
+
+    def test_backend_without_model_is_not_retried(self):
+        """Test a backend that has not pulled a model is reported as missing it, not as a failed load."""
+        def handler(request):
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": []})
+            return httpx.Response(200, json={"done": True})
+
+        ollama = make_client(handler)
+        ollama.pool.record_models(ollama.pool.backends[0], ["codellama:latest"])
+        pool = ModelWarmPool(ollama, ["codellama", "qwen2.5-coder:1.5b"], refresh_interval=60)
+
+        asyncio.run(pool.refresh())
+        asyncio.run(pool.refresh())
+        status = pool.status()
+        assert status["loads"] == 2
+        assert status["load_failures"] == 0
+        assert status["missing"] == {"qwen2.5-coder:1.5b": [ollama.pool.backends[0].url]}
+
+    def test_start_does_not_wait_for_preload(self):
+        """Test starting returns at once and the models load in the background."""
+        loaded = asyncio.Event()
+        async def handler(request):
+            if request.url.path == "/api/ps":
+                return httpx.Response(200, json={"models": []})
+            await loaded.wait()
+            return httpx.Response(200, json={"done": True})
+
+        pool = ModelWarmPool(make_client(handler), ["codellama"], refresh_interval=60)
+
+        async def scenario():
+            pool.start()
+            assert pool.loads == 0
+            loaded.set()
+            for _ in range(100):
+                if pool.loads:
+                    break
+                await asyncio.sleep(0.01)
+            await pool.stop()
+            return pool.loads
+
+        assert asyncio.run(scenario()) == 1
+
+    def test_parse_expiry_handles_nanoseconds(self):
+        """Test Ollama's nanosecond timestamps are parsed."""
+        parsed = parse_expiry("2024-06-01T12:30:00.123456789+02:00")
+        assert parsed == datetime(2024, 6, 1, 10, 30, 0, 123456, tzinfo=timezone.utc)
+        assert parse_expiry("not a date") is None
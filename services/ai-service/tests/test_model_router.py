@@ -0,0 +1,97 @@
+import asyncio
+from models.analysis import AIAnalysis
+from services.analysis_service import AnalysisService
+from services.model_router import ModelRouter, analysis_confidence
+from services.ollama_client import OllamaClient
+from tests.conftest import TestingSessionLocal
+
+CONFIDENT = {
+    "commit_type": "bugfix", "impact": "low", "summary": "Fixes a crash on empty lists",
+    "key_changes": [], "potential_risks": [], "recommendations": [], "complexity": "simple"
+}
+UNSURE = {**CONFIDENT, "commit_type": "unknown", "impact": "unknown", "summary": ""}
+
+class TieredOllamaClient(OllamaClient):
+    """Ollama client answering with a fixed analysis per model."""
+
+    def __init__(self, answers):
+        super().__init__()
+        self.answers = answers
+        self.calls = []
+
+    async def analyze_prompt(self, prompt, model=None):
+        self.calls.append(model)
+        return {"analysis": dict(self.answers[model]), "processing_time_ms": 5, "model_used": model}
+
+    async def stream_analysis(self, prompt, model=None):
+        self.calls.append(model)
+        yield {"type": "token", "text": model}
+        yield {"type": "result", "analysis": dict(self.answers[model]), "processing_time_ms": 5, "model_used": model}
+
+class TestModelRouter:
+    """Test cases for tiered model routing."""
+
+    def test_confident_small_answer_accepted(self):
+        """Test a confident answer from the small model is not escalated."""
+        ollama = TieredOllamaClient({"small": CONFIDENT, "large": CONFIDENT})
+        result = asyncio.run(ModelRouter(["small", "large"]).analyze(ollama, "prompt"))
+
+        assert ollama.calls == ["small"]
+        assert result["model_used"] == "small"
+        assert [tier["model"] for tier in result["routing"]["tiers"]] == ["small"]
+        assert result["routing"]["tiers"][0]["escalation"] is None
+
+    def test_low_confidence_escalates(self):
+        """Test an undecided answer goes to the large model and both tiers are recorded."""
+        ollama = TieredOllamaClient({"small": UNSURE, "large": CONFIDENT})
+        router = ModelRouter(["small", "large"])
+        result = asyncio.run(router.analyze(ollama, "prompt"))
+
+        assert ollama.calls == ["small", "large"]
+        assert result["model_used"] == "large"
+        tiers = result["routing"]["tiers"]
+        assert tiers[0]["escalation"] == "low_confidence"
+        assert tiers[0]["confidence"] < router.min_confidence
+        assert tiers[1]["latency_ms"] == 5
+        assert router.stats()["escalations"] == {"low_confidence": 1}
+
+    def test_repaired_answer_escalates(self):
+        """Test an answer that failed validation is escalated."""
+        router = ModelRouter(["small", "large"])
+        result = {"analysis": CONFIDENT, "repaired_fields": ["impact"]}
+        assert router.escalation_reason(result, analysis_confidence(result)) == "validation_failure"
+
+    def test_large_diff_starts_at_large_model(self):
+        """Test large diffs skip the small model."""
+        ollama = TieredOllamaClient({"small": CONFIDENT, "large": CONFIDENT})
+        result = asyncio.run(ModelRouter(["small", "large"], large_diff_lines=100).analyze(ollama, "prompt", 500))
+
+        assert ollama.calls == ["large"]
+        assert result["routing"]["start"] == "large_diff"
+
+    def test_stream_reports_escalation(self):
+        """Test streamed analyses announce the switch to the next tier."""
+        ollama = TieredOllamaClient({"small": UNSURE, "large": CONFIDENT})
+
+        async def collect():
+            return [event async for event in ModelRouter(["small", "large"]).stream(ollama, "prompt")]
+
+        events = asyncio.run(collect())
+        assert [event["type"] for event in events] == ["token", "escalate", "token", "result"]
+        assert events[1]["reason"] == "low_confidence"
+        assert events[-1]["model_used"] == "large"
+
+    def test_routing_stored_on_analysis(self, db_session):
+        """Test the routing record is stored and any tier's analysis satisfies later requests."""
+        ollama = TieredOllamaClient({"small": UNSURE, "large": CONFIDENT})
+        service = AnalysisService(ollama, router=ModelRouter(["small", "large"]))
+
+        first, created = asyncio.run(service.analyze_and_store(TestingSessionLocal, "abc123", "Rework caching"))
+        _, created_again = asyncio.run(service.analyze_and_store(TestingSessionLocal, "abc123", "Rework caching"))
+
+        assert created is True
+        assert created_again is False
+        stored = db_session.query(AIAnalysis).one()
+        assert stored.model_used == "large"
+        assert [tier["model"] for tier in stored.routing["tiers"]] == ["small", "large"]
+        assert ollama.calls == ["small", "large"]
@@ -0,0 +1,295 @@
+import asyncio
+import json
+import pytest
+import httpx
+from unittest.mock import Mock
+from services.analysis_schema import ANALYSIS_SCHEMA, IncrementalJSONParser, validate_analysis
+from services.ollama_client import OllamaClient, ANALYSIS_SYSTEM_PROMPT
+from services.disconnect import ClientDisconnected, cancel_on_disconnect
+
+def make_client(handler, models=("codellama:latest",)):
+    """Build an OllamaClient whose pool talks to a mock Ollama server with the given models installed."""
+    def route(request):
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": model} for model in models]})
+        return handler(request)
+
+    ollama = OllamaClient()
+    ollama._client = httpx.AsyncClient(transport=httpx.MockTransport(route))
+    return ollama
+
+def ndjson(*chunks):
+    """Encode chunks the way Ollama streams them."""
+    return "".join(json.dumps(chunk) + "\n" for chunk in chunks).encode()
+
+VALID_ANALYSIS = {
+    "commit_type": "bugfix",
+    "impact": "low",
+    "summary": "Fixes a crash on empty lists",
+    "key_changes": ["Guard against empty input"],
+    "potential_risks": [],
+    "recommendations": ["Add a regression test"],
+    "complexity": "simple"
+}
+
+class TestOllamaClient:
+    """Test cases for the async Ollama client."""
+
+    def test_generate_collects_streamed_response(self):
+        """Test streamed chunks are joined and the final stats kept."""
+        def handler(request):
+            assert json.loads(request.content)["stream"] is True
+            return httpx.Response(200, content=ndjson(
+                {"response": '{"commit_type": ', "done": False},
+                {"response": '"feature"}', "done": False},
+                {"response": "", "done": True, "eval_count": 5}
+            ))
+
+        result = asyncio.run(make_client(handler).generate("prompt"))
+        assert result["response"] == '{"commit_type": "feature"}'
+        assert result["eval_count"] == 5
+
+    def test_analyze_commit_parses_analysis(self):
+        """Test commit analysis returns the parsed JSON from the model."""
+        def handler(request):
+            return httpx.Response(200, content=ndjson(
+                {"response": '{"commit_type": "bugfix", "impact": "low"}', "done": True}
+            ))
+
+        result = asyncio.run(make_client(handler).analyze_commit("Fix crash on empty list"))
+        assert result["analysis"]["commit_type"] == "bugfix"
+        assert result["model_used"] == "codellama"
+
+    def test_stream_analysis_yields_tokens_then_result(self):
+        """Test streamed analyses relay each token and end with the parsed result and timings."""
+        body = json.dumps(VALID_ANALYSIS)
+        def handler(request):
+            return httpx.Response(200, content=ndjson(
+                {"response": body[:20], "done": False},
+                {"response": body[20:], "done": False}
+            ))
+
+        ollama = make_client(handler)
+
+        async def collect():
+            return [event async for event in ollama.stream_analysis("prompt")]
+
+        events = asyncio.run(collect())
+        assert "".join(event["text"] for event in events[:-1]) == body
+        result = events[-1]
+        assert result["type"] == "result"
+        assert result["analysis"] == VALID_ANALYSIS
+        assert result["ttft_ms"] is not None
+        assert result["tokens_per_second"] is not None
+        assert ollama.metrics.snapshot()["generations"] == 1
+
+    def test_tokens_per_second_from_ollama_counters(self):
+        """Test decode speed comes from eval_count/eval_duration when Ollama reports them."""
+        def handler(request):
+            return httpx.Response(200, content=ndjson(
+                {"response": "Looks fine", "done": False},
+                {"response": "", "done": True, "eval_count": 20, "eval_duration": 2_000_000_000}
+            ))
+
+        result = asyncio.run(make_client(handler).generate("prompt"))
+        assert result["tokens_per_second"] == 10.0
+
+    def test_generation_stops_when_json_object_complete(self):
+        """Test the schema is sent and trailing output after the object is never read."""
+        body = json.dumps(VALID_ANALYSIS)
+        def handler(request):
+            payload = json.loads(request.content)
+            assert payload["format"]["required"] == ANALYSIS_SCHEMA["required"]
+            return httpx.Response(200, content=ndjson(
+                {"response": body, "done": False},
+                *[{"response": " trailing", "done": False}] * 50,
+                {"response": "", "done": True}
+            ))
+
+        result = asyncio.run(make_client(handler).analyze_prompt("prompt"))
+        assert result["analysis"] == VALID_ANALYSIS
+        assert result["raw_response"] == body
+        assert result["tokens_generated"] == 1
+        assert "repaired_fields" not in result
+
+    def test_instructions_sent_as_shared_system_prompt(self):
+        """Test every analysis sends identical instructions as the system prompt, ahead of the commit."""
+        payloads = []
+        def handler(request):
+            payloads.append(json.loads(request.content))
+            return httpx.Response(200, content=ndjson(
+                {"response": json.dumps(VALID_ANALYSIS), "done": False},
+                {"response": "", "done": True, "prompt_eval_count": 12, "prompt_eval_duration": 30_000_000}
+            ))
+
+        ollama = make_client(handler)
+        asyncio.run(ollama.analyze_commit("Fix crash on empty list"))
+        result = asyncio.run(ollama.analyze_commit("Add dark mode"))
+
+        assert payloads[0]["system"] == payloads[1]["system"] == ANALYSIS_SYSTEM_PROMPT
+        assert payloads[1]["prompt"] == "Commit Message: Add dark mode\n"
+        # Timings of Ollama's final chunk are kept even though the generation stopped at the closing brace
+        assert result["prompt_eval_ms"] == 30.0
+        assert result["prompt_tokens"] == 12
+        assert ollama.metrics.snapshot()["prompt_eval_p50_ms"] == 30.0
+
+    def test_invalid_fields_repaired_without_rerun(self):
+        """Test only the invalid fields are regenerated and merged into the analysis."""
+        requests = []
+        def handler(request):
+            payload = json.loads(request.content)
+            requests.append(payload)
+            if len(requests) == 1:
+                return httpx.Response(200, content=ndjson(
+                    {"response": json.dumps({**VALID_ANALYSIS, "commit_type": "fix", "impact": None}), "done": False}
+                ))
+            assert sorted(payload["format"]["properties"]) == ["commit_type", "impact"]
+            return httpx.Response(200, content=ndjson(
+                {"response": json.dumps({"commit_type": "bugfix", "impact": "huge"}), "done": False}
+            ))
+
+        ollama = make_client(handler)
+        result = asyncio.run(ollama.analyze_prompt("prompt"))
+
+        assert len(requests) == 2
+        assert result["analysis"]["commit_type"] == "bugfix"
+        assert result["analysis"]["impact"] == "unknown"  # Still invalid after the repair
+        assert result["analysis"]["summary"] == VALID_ANALYSIS["summary"]
+        assert result["repaired_fields"] == ["commit_type", "impact"]
+        assert ollama.metrics.snapshot()["parse_outcomes"]["repaired"] == 1
+
+    def test_failed_repair_keeps_parsed_analysis(self):
+        """Test an Ollama error during the repair call does not fail the analysis."""
+        requests = []
+        def handler(request):
+            requests.append(request)
+            if len(requests) == 1:
+                return httpx.Response(200, content=ndjson(
+                    {"response": json.dumps({**VALID_ANALYSIS, "impact": None}), "done": False}
+                ))
+            return httpx.Response(200, content=ndjson({"error": "model runner has unexpectedly stopped"}))
+
+        result = asyncio.run(make_client(handler).analyze_prompt("prompt"))
+
+        assert len(requests) == 2
+        assert result["analysis"]["summary"] == VALID_ANALYSIS["summary"]
+        assert result["analysis"]["impact"] == "unknown"
+        assert result["repaired_fields"] == ["impact"]
+        assert "impact" in result["validation_errors"]
+
+    def test_ollama_error_is_raised(self):
+        """Test HTTP errors from Ollama surface to the caller."""
+        def handler(request):
+            return httpx.Response(500)
+
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(make_client(handler).analyze_commit("Fix crash"))
+
+class TestBatchAnalysis:
+    """Test cases for analyzing several commits in one generation."""
+
+    def test_batch_split_per_commit(self):
+        """Test a batch answer is matched back to its commits and bad entries are left out."""
+        requests = []
+        answer = {"analyses": [
+            {"commit": 2, **VALID_ANALYSIS, "summary": "Second"},
+            {"commit": 1, **VALID_ANALYSIS, "summary": "First"},
+            {"commit": 3, **VALID_ANALYSIS, "impact": "enormous"}
+        ]}
+
+        def handler(request):
+            requests.append(json.loads(request.content))
+            return httpx.Response(200, content=ndjson(
+                {"response": json.dumps(answer), "done": False},
+                {"response": "", "done": True}
+            ))
+
+        ollama = make_client(handler)
+        results = asyncio.run(ollama.analyze_batch(["Commit Message: a\n", "Commit Message: b\n",
+                                                    "Commit Message: c\n", "Commit Message: d\n"]))
+
+        assert len(requests) == 1
+        assert "### Commit 4" in requests[0]["prompt"]
+        assert requests[0]["format"]["properties"]["analyses"]["type"] == "array"
+        assert [r and r["analysis"]["summary"] for r in results] == ["First", "Second", None, None]
+        assert results[0]["batch_size"] == 4
+        assert "commit" not in results[0]["analysis"]
+        throughput = ollama.metrics.snapshot()["throughput"]["codellama"]
+        assert throughput["batched_commits"] == 2
+
+    def test_throughput_gain_per_model(self):
+        """Test batched and single throughput are compared per model."""
+        ollama = OllamaClient()
+        ollama.metrics.record_throughput("single", "codellama", 2.0, 1)
+        ollama.metrics.record_throughput("batch", "codellama", 3.0, 4)
+
+        report = ollama.metrics.snapshot()["throughput"]["codellama"]
+
+        assert report["single_commits_per_second"] == 0.5
+        assert report["batch_gain"] == 2.67
+
+class TestAnalysisSchema:
+    """Test cases for analysis validation and incremental JSON parsing."""
+
+    def test_parser_completes_on_closing_brace(self):
+        """Test braces inside strings and escaped quotes do not end the object early."""
+        parser = IncrementalJSONParser()
+        assert parser.feed('Here you go: {"summary": "adds \\"{\\" handling", ') is False
+        assert parser.feed('"key_changes": ["}"]') is False
+        assert parser.feed('} and some chatter') is True
+        assert parser.result() == {"summary": 'adds "{" handling', "key_changes": ["}"]}
+
+    def test_incomplete_object_has_no_result(self):
+        """Test a truncated object is reported as unparsed."""
+        parser = IncrementalJSONParser()
+        parser.feed('{"summary": "cut off')
+        assert parser.result() is None
+
+    def test_validation_reports_only_invalid_fields(self):
+        """Test wrong enum values, types and missing fields are reported per field."""
+        analysis = {**VALID_ANALYSIS, "impact": "huge", "key_changes": "one change"}
+        del analysis["complexity"]
+        assert set(validate_analysis(analysis)) == {"impact", "key_changes", "complexity"}
+        assert validate_analysis(VALID_ANALYSIS) == {}
+
+class TestCancelOnDisconnect:
+    """Test cases for cancelling work when the HTTP client goes away."""
+
+    def test_work_cancelled_when_client_disconnects(self):
+        """Test the work is cancelled once the request reports a disconnect."""
+        cancelled = []
+
+        async def work():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def is_disconnected():
+            return True
+
+        request = Mock()
+        request.is_disconnected = is_disconnected
+
+        async def scenario():
+            with pytest.raises(ClientDisconnected):
+                await cancel_on_disconnect(request, work(), poll_interval=0.01)
+            await asyncio.sleep(0)
+
+        asyncio.run(scenario())
+        assert cancelled == [True]
+
+    def test_result_returned_while_connected(self):
+        """Test the work's result is returned when the client stays."""
+        async def work():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        async def is_disconnected():
+            return False
+
+        request = Mock()
+        request.is_disconnected = is_disconnected
+
+        assert asyncio.run(cancel_on_disconnect(request, work(), poll_interval=0.01)) == "done"
@@ -0,0 +1,218 @@
+import asyncio
+import json
+import httpx
+import pytest
+from services.ollama_client import OllamaClient
+from services.ollama_pool import OllamaBackendPool, parse_backend_urls
+from tests.test_ollama_client import ndjson
+
+FAST = "http://fast:11434"
+SLOW = "http://slow:11434"
+
+def make_cluster(backends):
+    """
+    Build an OllamaClient over mock Ollama servers.
+
+    backends maps a URL to (installed models, generate handler); each call is
+    logged as (url, path).
+    """
+    calls = []
+
+    def route(request):
+        url = f"{request.url.scheme}://{request.url.host}:{request.url.port}"
+        calls.append((url, request.url.path))
+        models, generate = backends[url]
+        if request.url.path == "/api/tags":
+            return httpx.Response(200, json={"models": [{"name": model} for model in models]})
+        return generate(request)
+
+    ollama = OllamaClient()
+    ollama.pool = OllamaBackendPool(list(backends))
+    ollama._client = httpx.AsyncClient(transport=httpx.MockTransport(route))
+    return ollama, calls
+
+def answer(text="ok", eval_count=10, eval_duration=1_000_000_000):
+    def handler(request):
+        return httpx.Response(200, content=ndjson(
+            {"response": text, "done": False},
+            {"response": "", "done": True, "eval_count": eval_count, "eval_duration": eval_duration}
+        ))
+    return handler
+
+def generations(calls, url):
+    return sum(1 for called, path in calls if called == url and path == "/api/generate")
+
+class TestBackendPool:
+    """Test cases for least-expected-wait backend selection."""
+
+    def test_parse_backend_urls(self):
+        assert parse_backend_urls("http://a:1/, http://b:2", "http://c:3") == ["http://a:1", "http://b:2"]
+        assert parse_backend_urls("", "http://c:3/") == ["http://c:3"]
+
+    def test_prefers_less_loaded_backend(self):
+        pool = OllamaBackendPool([FAST, SLOW])
+        first, second = pool.backends
+        pool.acquire(first)
+        assert pool.choose() is second
+
+    def test_faster_backend_takes_more_load(self):
+        pool = OllamaBackendPool([FAST, SLOW])
+        fast, slow = pool.backends
+        pool.record_speed(fast, 60.0)
+        pool.record_speed(slow, 20.0)
+        pool.acquire(fast)
+        # A second request on the fast server still beats the first on one a third as fast
+        assert pool.choose() is fast
+        pool.acquire(fast)
+        pool.acquire(fast)
+        assert pool.choose() is slow
+
+    def test_failed_backend_is_avoided(self):
+        pool = OllamaBackendPool([FAST, SLOW])
+        fast, slow = pool.backends
+        pool.record_failure(fast, RuntimeError("down"))
+        assert pool.choose() is slow
+        # A failed backend is still used when nothing else is left
+        assert pool.choose(exclude=[slow]) is fast
+
+class TestMultiBackendClient:
+    """Test cases for dispatching generations over several Ollama servers."""
+
+    def test_dispatches_to_faster_backend(self):
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], answer()),
+            SLOW: (["codellama:latest"], answer())
+        })
+        fast, slow = ollama.pool.backends
+        ollama.pool.record_speed(fast, 50.0)
+        ollama.pool.record_speed(slow, 5.0)
+
+        result = asyncio.run(ollama.generate("hi"))
+
+        assert result["response"] == "ok"
+        assert result["backend"] == FAST
+        assert generations(calls, FAST) == 1
+        assert generations(calls, SLOW) == 0
+        assert fast.outstanding == 0
+
+    def test_fails_over_on_server_error(self):
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], lambda request: httpx.Response(500, json={"error": "out of memory"})),
+            SLOW: (["codellama:latest"], answer())
+        })
+        ollama.pool.record_speed(ollama.pool.backends[0], 50.0)
+
+        result = asyncio.run(ollama.generate("hi"))
+
+        assert result["backend"] == SLOW
+        assert generations(calls, FAST) == 1
+        fast = ollama.pool.backends[0]
+        assert fast.failures == 1 and not fast.available
+        assert fast.outstanding == 0
+
+    def test_fails_over_on_connection_error(self):
+        def refuse(request):
+            raise httpx.ConnectError("connection refused", request=request)
+
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], refuse),
+            SLOW: (["codellama:latest"], answer())
+        })
+        ollama.pool.record_speed(ollama.pool.backends[0], 50.0)
+
+        assert asyncio.run(ollama.generate("hi"))["backend"] == SLOW
+
+    def test_raises_when_every_backend_fails(self):
+        error = lambda request: httpx.Response(503, json={"error": "busy"})
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], error),
+            SLOW: (["codellama:latest"], error)
+        })
+
+        with pytest.raises(httpx.HTTPStatusError):
+            asyncio.run(ollama.generate("hi"))
+        assert generations(calls, FAST) == 1
+        assert generations(calls, SLOW) == 1
+
+    def test_routes_to_backend_with_model(self):
+        ollama, calls = make_cluster({
+            FAST: (["llama3:latest"], answer()),
+            SLOW: (["codellama:latest", "llama3:latest"], answer())
+        })
+        ollama.pool.record_speed(ollama.pool.backends[0], 50.0)
+
+        assert asyncio.run(ollama.generate("hi", model="codellama"))["backend"] == SLOW
+        assert asyncio.run(ollama.generate("hi", model="llama3"))["backend"] == FAST
+        # Model lists are cached between requests
+        assert sum(1 for url, path in calls if path == "/api/tags") == 2
+
+    def test_missing_model_is_an_error(self):
+        ollama, calls = make_cluster({FAST: (["llama3:latest"], answer())})
+
+        with pytest.raises(RuntimeError, match="not available"):
+            asyncio.run(ollama.generate("hi", model="codellama"))
+        assert generations(calls, FAST) == 0
+
+    def test_model_removed_since_tags_fails_over(self):
+        not_found = lambda request: httpx.Response(404, json={"error": "model 'codellama' not found"})
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], not_found),
+            SLOW: (["codellama:latest"], answer())
+        })
+        ollama.pool.record_speed(ollama.pool.backends[0], 50.0)
+
+        assert asyncio.run(ollama.generate("hi"))["backend"] == SLOW
+        fast = ollama.pool.backends[0]
+        assert not fast.has_model("codellama")
+        assert fast.available
+
+    def test_running_models_across_backends(self):
+        def generate(request):
+            return httpx.Response(200, json={"models": [{"name": "codellama:latest"}]})
+
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], generate),
+            SLOW: (["codellama:latest"], generate)
+        })
+
+        running = asyncio.run(ollama.running_models())
+
+        assert [model["backend"] for model in running] == [FAST, SLOW]
+
+    def test_running_models_skip_unreachable_backend(self):
+        def generate(request):
+            return httpx.Response(200, json={"models": [{"name": "codellama:latest"}]})
+
+        def down(request):
+            raise httpx.ConnectError("Connection refused")
+
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], down),
+            SLOW: (["codellama:latest"], generate)
+        })
+        assert [model["backend"] for model in asyncio.run(ollama.running_models())] == [SLOW]
+
+        ollama, calls = make_cluster({
+            FAST: (["codellama:latest"], down),
+            SLOW: (["codellama:latest"], down)
+        })
+        with pytest.raises(httpx.ConnectError):
+            asyncio.run(ollama.running_models())
+
+    def test_preload_only_where_installed(self):
+        loads = []
+
+        def preload(url):
+            def handler(request):
+                loads.append((url, json.loads(request.content)["model"]))
+                return httpx.Response(200, json={"done": True})
+            return handler
+
+        ollama, calls = make_cluster({
+            FAST: (["llama3:latest"], preload(FAST)),
+            SLOW: (["codellama:latest"], preload(SLOW))
+        })
+        asyncio.run(ollama.get_available_models())
+
+        assert asyncio.run(ollama.preload("codellama")) is True
+        assert loads == [(SLOW, "codellama")]
@@ -0,0 +1,70 @@
+from services.prompt_builder import PromptBuilder, estimate_tokens
+
+def vendored_files(count):
+    """A vendoring commit: many small files in a few directories, plus a real change."""
+    files = [
+        {"filename": f"vendor/lib{n % 7}/module{n}.js", "status": "added", "additions": 10 + n % 5}
+        for n in range(count)
+    ]
+    files.append({"filename": "src/app.py", "status": "modified", "additions": 400, "deletions": 120})
+    return files
+
+class TestPromptBuilder:
+    """Test cases for the token-budgeted analysis prompt."""
+
+    def test_small_commit_lists_every_file(self):
+        """Test a prompt within budget keeps the full listing unchanged."""
+        files = [
+            {"filename": "app.py", "status": "modified", "additions": 3, "deletions": 1},
+            {"filename": "README.md", "status": "modified"}
+        ]
+        prompt = PromptBuilder(max_tokens=512).build("Fix crash", files)
+
+        assert prompt == (
+            "Commit Message: Fix crash\n"
+            "\nFiles Changed:\n"
+            "- app.py (modified)\n  +3 lines added\n  -1 lines deleted\n"
+            "- README.md (modified)\n"
+        )
+
+    def test_huge_commit_stays_under_budget(self):
+        """Test a 5,000-file commit is cut to the budget, largest changes first."""
+        builder = PromptBuilder(max_tokens=1024)
+        prompt = builder.build("Vendor dependencies", vendored_files(5000))
+
+        assert estimate_tokens(prompt) <= 1024
+        assert "Files Changed (5001 files" in prompt
+        listing = prompt.split("largest changes first):\n")[1]
+        assert listing.startswith("- src/app.py (modified)")
+        assert builder.stats()["truncated"] == 1
+
+    def test_tail_summarized_by_directory_and_extension(self):
+        """Test files that are not listed are still accounted for in groups."""
+        prompt = PromptBuilder(max_tokens=400).build("Vendor dependencies", vendored_files(5000))
+
+        assert "Other files by directory and type:" in prompt
+        assert "- vendor/lib1/ *.js:" in prompt
+        grouped = sum(
+            int(line.split(": ")[1].split(" files")[0])
+            for line in prompt.splitlines() if line.startswith("- vendor/") and " files, " in line
+        )
+        listed = sum(1 for line in prompt.splitlines() if line.startswith("- vendor/") and "(added)" in line)
+        more = [line for line in prompt.splitlines() if " more files in " in line]
+        folded = int(more[0].split()[1]) if more else 0
+        assert grouped + listed + folded == 5000
+
+    def test_budget_bounds_prompt_whatever_the_commit_size(self):
+        """Test prompt size stops growing with the number of files."""
+        builder = PromptBuilder(max_tokens=600)
+        sizes = [estimate_tokens(builder.build("Vendor", vendored_files(count))) for count in (200, 2000, 20000)]
+
+        assert max(sizes) <= 600
+        assert sizes[2] - sizes[0] < 100
+
+    def test_long_message_truncated(self):
+        """Test a huge commit message cannot take the whole budget."""
+        prompt = PromptBuilder(max_tokens=200).build("Subject\n\n" + "body " * 2000)
+
+        assert prompt.startswith("Commit Message: Subject")
+        assert "[message truncated]" in prompt
+        assert estimate_tokens(prompt) <= 100
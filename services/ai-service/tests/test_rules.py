@@ -0,0 +1,82 @@
+import asyncio
+import pytest
+from models.analysis import AIAnalysis
+from services.analysis_schema import validate_analysis
+from services.analysis_service import AnalysisService
+from services.rules import RuleClassifier
+from tests.test_analysis_cache import FakeOllamaClient
+from tests.conftest import TestingSessionLocal
+
+SMALL_CHANGE = [{"filename": "app/utils.py", "status": "modified", "additions": 3, "deletions": 1}]
+LARGE_CHANGE = [{"filename": "app/core.py", "status": "modified", "additions": 400, "deletions": 120}]
+
+class TestRuleClassifier:
+    """Test cases for the rule-based pre-classifier."""
+
+    @pytest.mark.parametrize("message,files,author,commit_type", [
+        ("docs: explain the retry budget", LARGE_CHANGE, None, "docs"),
+        ("chore(deps): bump httpx to 0.25.2", SMALL_CHANGE, None, "chore"),
+        ("ci: cache pip downloads", SMALL_CHANGE, None, "chore"),
+        ("test: cover empty lists", SMALL_CHANGE, None, "test"),
+        ("fix(api): handle empty list", SMALL_CHANGE, None, "bugfix"),
+        ("feat: add dark mode toggle", SMALL_CHANGE, None, "feature"),
+        ("Merge pull request #42 from octo/feature", LARGE_CHANGE, None, "chore"),
+        ("Bump requests from 2.30.0 to 2.31.0", SMALL_CHANGE, None, "chore"),
+        ("Update lockfile", SMALL_CHANGE, "dependabot[bot]", "chore"),
+    ])
+    def test_trivial_commits_classified(self, message, files, author, commit_type):
+        """Test conventional prefixes, merges and bots are classified with a valid analysis."""
+        analysis = RuleClassifier().classify(message, files, author)
+        assert analysis["commit_type"] == commit_type
+        assert validate_analysis(analysis) == {}
+
+    @pytest.mark.parametrize("message,files", [
+        ("Fix the thing", SMALL_CHANGE),  # No conventional prefix
+        ("feat!: drop the v1 API", SMALL_CHANGE),  # Breaking change
+        ("fix: rewrite the scheduler", LARGE_CHANGE),  # Large diff
+        ("perf: batch inserts", SMALL_CHANGE),  # Type without a fixed classification
+    ])
+    def test_ambiguous_commits_left_to_model(self, message, files):
+        """Test commits that need judgement are not classified by rules."""
+        assert RuleClassifier().classify(message, files) is None
+
+    def test_complexity_follows_diff_size(self):
+        """Test large trivial commits are not reported as simple."""
+        assert RuleClassifier().classify("docs: update guide", SMALL_CHANGE)["complexity"] == "simple"
+        assert RuleClassifier().classify("docs: rewrite guide", LARGE_CHANGE)["complexity"] == "complex"
+
+    def test_disabled_classifier_returns_nothing(self):
+        """Test rules can be switched off."""
+        assert RuleClassifier(enabled=False).classify("docs: update guide", SMALL_CHANGE) is None
+
+class TestRulesFastPath:
+    """Test cases for skipping the model for rule-classified commits."""
+
+    def test_rule_classified_commit_skips_model(self):
+        """Test a trivially classifiable commit never reaches Ollama."""
+        ollama = FakeOllamaClient()
+        service = AnalysisService(ollama, rules=RuleClassifier())
+
+        result = asyncio.run(service.analyze_commit("docs: fix typo in README", SMALL_CHANGE))
+        assert result["model_used"] == "rules"
+        assert ollama.generations == 0
+
+        asyncio.run(service.analyze_commit("Rework caching", SMALL_CHANGE))
+        assert ollama.generations == 1
+        assert service.rules.stats() == {"enabled": True, "hits": 1, "misses": 1}
+
+    def test_rule_analysis_stored_once(self, db_session):
+        """Test rule-based analyses are stored under the rules model and reused."""
+        service = AnalysisService(FakeOllamaClient(), rules=RuleClassifier())
+
+        first, created = asyncio.run(
+            service.analyze_and_store(TestingSessionLocal, "abc123", "docs: fix typo", SMALL_CHANGE)
+        )
+        second, created_again = asyncio.run(
+            service.analyze_and_store(TestingSessionLocal, "abc123", "docs: fix typo", SMALL_CHANGE)
+        )
+
+        assert created is True
+        assert created_again is False
+        assert second["id"] == first["id"]
+        assert db_session.query(AIAnalysis).one().model_used == "rules"
@@ -0,0 +1,166 @@
+import asyncio
+from unittest.mock import Mock
+from models.analysis import AIAnalysis
+from services.analysis_service import AnalysisService
+from services.ollama_client import PROMPT_TEMPLATE_VERSION
+from services.single_flight import SingleFlight
+from tests.test_analysis_cache import FakeOllamaClient
+from tests.conftest import TestingSessionLocal
+
+class SlowOllamaClient(FakeOllamaClient):
+    """Fake client whose generations take a moment, so callers overlap."""
+
+    async def analyze_prompt(self, prompt, model=None):
+        await asyncio.sleep(0.05)
+        return await super().analyze_prompt(prompt, model)
+
+class TestSingleFlight:
+    """Test cases for coalescing concurrent work."""
+
+    def test_concurrent_callers_share_one_execution(self):
+        """Test callers for the same key get one result; other keys run separately."""
+        flights = SingleFlight()
+        runs = []
+
+        async def work(key):
+            runs.append(key)
+            await asyncio.sleep(0.01)
+            return f"result-{key}"
+
+        async def scenario():
+            return await asyncio.gather(
+                flights.do("a", lambda: work("a")),
+                flights.do("a", lambda: work("a")),
+                flights.do("b", lambda: work("b"))
+            )
+
+        results = asyncio.run(scenario())
+        assert runs == ["a", "b"]
+        assert results == [("result-a", False), ("result-a", True), ("result-b", False)]
+        assert flights.in_flight() == 0
+
+    def test_cancelled_waiter_does_not_cancel_others(self):
+        """Test the work keeps running while any caller still waits for it."""
+        flights = SingleFlight()
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def scenario():
+            first = asyncio.ensure_future(flights.do("a", work))
+            second = asyncio.ensure_future(flights.do("a", work))
+            await asyncio.sleep(0.01)
+            first.cancel()
+            return await second
+
+        assert asyncio.run(scenario()) == ("done", True)
+
+    def test_work_cancelled_when_all_waiters_leave(self):
+        """Test abandoned work is cancelled rather than left running."""
+        flights = SingleFlight()
+        finished = []
+
+        async def work():
+            await asyncio.sleep(0.05)
+            finished.append(True)
+
+        async def scenario():
+            caller = asyncio.ensure_future(flights.do("a", work))
+            await asyncio.sleep(0.01)
+            caller.cancel()
+            await asyncio.sleep(0.1)
+
+        asyncio.run(scenario())
+        assert finished == []
+        assert flights.in_flight() == 0
+
+class TestAnalyzeAndStore:
+    """Test cases for storing one analysis per commit, model and prompt version."""
+
+    def test_concurrent_requests_generate_and_store_once(self, db_session):
+        """Test overlapping requests for a commit share one generation and one row."""
+        ollama = SlowOllamaClient()
+        service = AnalysisService(ollama)
+
+        async def scenario():
+            return await asyncio.gather(*[
+                service.analyze_and_store(TestingSessionLocal, "abc123", "Fix crash on empty list")
+                for _ in range(5)
+            ])
+
+        results = asyncio.run(scenario())
+        assert ollama.generations == 1
+        assert db_session.query(AIAnalysis).count() == 1
+        assert [created for _, created in results].count(True) == 1
+        assert len({analysis["id"] for analysis, _ in results}) == 1
+
+    def test_existing_analysis_returned(self, db_session):
+        """Test a stored analysis for the same model and prompt version is reused."""
+        ollama = FakeOllamaClient()
+        service = AnalysisService(ollama)
+
+        first, created = asyncio.run(service.analyze_and_store(TestingSessionLocal, "abc123", "Fix crash"))
+        second, created_again = asyncio.run(service.analyze_and_store(TestingSessionLocal, "abc123", "Fix crash"))
+
+        assert created is True
+        assert created_again is False
+        assert second["id"] == first["id"]
+        assert second["prompt_version"] == first["prompt_version"]
+        assert ollama.generations == 1
+
+    def test_row_stored_during_generation_is_kept(self, db_session):
+        """Test a row another replica stores while this one generates is returned, not duplicated."""
+        service = AnalysisService(FakeOllamaClient())
+
+        async def other_replica():
+            await asyncio.to_thread(service.store_analysis, TestingSessionLocal(), "abc123", {
+                "analysis": {"summary": "Stored elsewhere"}, "processing_time_ms": 5, "model_used": "codellama"
+            })
+            return {"analysis": {"summary": "Generated here"}, "processing_time_ms": 5, "model_used": "codellama"}
+
+        analysis, created = asyncio.run(service._analyze_and_store(
+            TestingSessionLocal, "abc123", ["codellama"], PROMPT_TEMPLATE_VERSION, other_replica
+        ))
+
+        assert created is False
+        assert analysis["analysis_data"]["summary"] == "Stored elsewhere"
+        assert db_session.query(AIAnalysis).count() == 1
+
+    def test_replicas_claim_before_generating(self, db_session, monkeypatch):
+        """Test two replicas analyzing a commit at once generate it only once."""
+        held = set()
+        monkeypatch.setattr(AnalysisService, "_claims_supported", lambda self, bind: True)
+        monkeypatch.setattr(AnalysisService, "_claim_connection", lambda self, bind: Mock())
+        monkeypatch.setattr(AnalysisService, "_try_claim",
+                            lambda self, connection, lock_id: lock_id not in held and not held.add(lock_id))
+        monkeypatch.setattr(AnalysisService, "_release_claim", lambda self, connection, lock_id: held.discard(lock_id))
+        monkeypatch.setattr("services.analysis_service.ANALYSIS_CLAIM_POLL_INTERVAL", 0.01)
+        ollama = SlowOllamaClient()
+        # Separate services do not share single-flight, like separate replicas
+        replicas = [AnalysisService(ollama), AnalysisService(ollama)]
+
+        async def scenario():
+            return await asyncio.gather(*[
+                replica.analyze_and_store(TestingSessionLocal, "abc123", "Fix crash on empty list")
+                for replica in replicas
+            ])
+
+        results = asyncio.run(scenario())
+        assert ollama.generations == 1
+        assert sorted(created for _, created in results) == [False, True]
+        assert db_session.query(AIAnalysis).count() == 1
+        assert not held
+
+    def test_get_analysis_returns_current_version(self, db_session):
+        """Test the newest analysis by the current model and prompt version is returned."""
+        service = AnalysisService(FakeOllamaClient())
+        for summary, version in [("Current", PROMPT_TEMPLATE_VERSION), ("Stale", "0")]:
+            db_session.add(AIAnalysis(
+                commit_hash="abc123", analysis_type="commit_analysis", analysis_data={"summary": summary},
+                model_used="codellama", prompt_version=version, processing_time_ms=5
+            ))
+            db_session.commit()
+
+        assert service.get_analysis(db_session, "abc123").analysis_data["summary"] == "Current"
+        assert service.get_analysis(db_session, "def456") is None
@@ -1,10 +1,19 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse
 import httpx
 import os
+from typing import Optional
 from dotenv import load_dotenv
 import logging
 
+from services.proxy import stream_upstream
+from services.upstream import idempotency_headers
+from services.github_client import github_service, github_feed, GITHUB_SERVICE_URLS, GITHUB_FEED_URL
+from services.ai_client import ai_service, AI_SERVICE_URLS
+from services.compression import CompressionMiddleware, normalize_if_none_match
+from services.rate_limiter import RateLimitMiddleware
+
 # Load environment variables
 load_dotenv()
 
@@ -19,6 +28,9 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Per-client rate limiting and load shedding (added first so CORS headers wrap 429 responses)
+app.add_middleware(RateLimitMiddleware)
+
 # Add CORS middleware (allows frontend to communicate with backend)
 app.add_middleware(
     CORSMiddleware,
@@ -26,11 +38,27 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Allow all HTTP methods
     allow_headers=["*"],  # Allow all headers
+    expose_headers=["ETag", "Location"],  # Let the frontend read validators and ingest run URLs
+)
+
+# Compress responses (brotli/gzip) above a minimum size
+app.add_middleware(
+    CompressionMiddleware,
+    minimum_size=int(os.getenv("COMPRESSION_MINIMUM_SIZE", "1024"))
 )
 
-# Get service URLs from environment variables
-GITHUB_SERVICE_URL = os.getenv("GITHUB_SERVICE_URL", "http://github-service:8001")
-AI_SERVICE_URL = os.getenv("AI_SERVICE_URL", "http://ai-service:8002")
+@app.on_event("startup")
+async def startup_event():
+    """Start background health checks for replicated upstreams"""
+    github_service.start_health_checks()
+    ai_service.start_health_checks()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Close pooled upstream connections"""
+    await github_service.aclose()
+    await github_feed.aclose()
+    await ai_service.aclose()
 
 @app.get("/")
 async def root():
@@ -39,8 +67,9 @@ async def root():
         "message": "GitHub Commit Tracker API Gateway",
         "status": "running",
         "services": {
-            "github_service": GITHUB_SERVICE_URL,
-            "ai_service": AI_SERVICE_URL
+            "github_service": GITHUB_SERVICE_URLS,
+            "github_feed": GITHUB_FEED_URL,
+            "ai_service": AI_SERVICE_URLS
         }
     }
 
@@ -50,30 +79,74 @@ async def health_check():
     return {
         "status": "healthy",
         "service": "api-gateway",
-        "timestamp": "2024-01-01T00:00:00Z"
+        "timestamp": "2024-01-01T00:00:00Z",
+        "upstreams": {
+            "github_service": github_service.status(),
+            "github_feed": github_feed.status(),
+            "ai_service": ai_service.status()
+        }
     }
 
 @app.get("/api/commits")
-async def get_commits():
-    """Get all commits from GitHub service"""
+async def get_commits(request: Request):
+    """Get all commits from GitHub service (streamed through unchanged)"""
     try:
         logger.info("Fetching commits from GitHub service")
         
-        # Make HTTP request to GitHub service
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{GITHUB_SERVICE_URL}/commits")
-            
-            if response.status_code == 200:
-                commits = response.json()
-                logger.info(f"Successfully fetched {len(commits)} commits")
-                return commits
-            else:
-                logger.error(f"GitHub service returned error: {response.status_code}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to fetch commits from GitHub service"
-                )
+        # Let GitHub service answer 304 if the client's copy is still current
+        headers = {}
+        if_none_match = request.headers.get("if-none-match")
+        if if_none_match:
+            headers["If-None-Match"] = normalize_if_none_match(if_none_match)
+        
+        # Relay the GitHub service response body without decoding it
+        return await stream_upstream(
+            github_service,
+            "GET",
+            "/commits",
+            error_detail="Failed to fetch commits from GitHub service",
+            headers=headers
+        )
                 
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="GitHub service is not available"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.get("/api/commits/stream")
+async def stream_commits(request: Request, last_event_id: Optional[str] = None):
+    """Live feed of newly ingested commits and analyses (Server-Sent Events)"""
+    try:
+        logger.info("Opening live commit feed")
+        
+        # Resume after the last event the client saw
+        headers = {}
+        resume_from = request.headers.get("last-event-id") or last_event_id
+        if resume_from:
+            headers["Last-Event-ID"] = resume_from
+        
+        # Only the feed replica holds the event log (other replicas forward to it)
+        return await stream_upstream(
+            github_feed,
+            "GET",
+            "/events",
+            error_detail="Failed to open commit feed",
+            headers=headers,
+            hedge=False
+        )
+        
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Request error: {e}")
         raise HTTPException(
@@ -88,26 +161,34 @@ async def get_commits():
         )
 
 @app.post("/api/tracking/start")
-async def start_tracking():
+async def start_tracking(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """Start commit tracking process"""
     try:
         logger.info("Starting commit tracking")
         
         # Make HTTP request to GitHub service to start tracking
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(f"{GITHUB_SERVICE_URL}/start-tracking")
+        response = await github_service.request(
+            "POST", "/start-tracking", headers=idempotency_headers(idempotency_key)
+        )
+        
+        if response.status_code in (200, 202):
+            result = response.json()
+            logger.info("Successfully started commit tracking")
             
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("Successfully started commit tracking")
-                return result
-            else:
-                logger.error(f"Failed to start tracking: {response.status_code}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to start commit tracking"
-                )
-                
+            # Ingest runs in the background; point the client at the gateway's status route
+            headers = {}
+            if "run" in result:
+                headers["Location"] = f"/api/ingest-runs/{result['run']['id']}"
+            return JSONResponse(status_code=response.status_code, content=result, headers=headers)
+        else:
+            logger.error(f"Failed to start tracking: {response.status_code}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail="Failed to start tracking"
+            )
+
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Request error: {e}")
         raise HTTPException(
@@ -122,26 +203,56 @@ async def start_tracking():
         )
 
 @app.post("/api/fetch-commits")
-async def fetch_commits():
+async def fetch_commits(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """Fetch new commits from GitHub and store in database"""
     try:
         logger.info("Fetching new commits from GitHub")
         
         # Make HTTP request to GitHub service to fetch commits
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.post(f"{GITHUB_SERVICE_URL}/fetch-commits")
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("Successfully fetched commits from GitHub")
-                return result
-            else:
-                logger.error(f"Failed to fetch commits: {response.status_code}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to fetch commits from GitHub"
-                )
-                
+        response = await github_service.request(
+            "POST", "/fetch-commits", headers=idempotency_headers(idempotency_key)
+        )
+        
+        if response.status_code == 200:
+            result = response.json()
+            logger.info("Successfully fetched commits from GitHub")
+            return result
+        else:
+            logger.error(f"Failed to fetch commits: {response.status_code}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail="Failed to fetch commits from GitHub"
+            )
+
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="GitHub service is not available"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.get("/api/ingest-runs/{run_id}")
+async def get_ingest_run(run_id: int):
+    """Get the progress of a background commit ingest run"""
+    try:
+        return await stream_upstream(
+            github_service,
+            "GET",
+            f"/ingest-runs/{run_id}",
+            error_detail="Failed to fetch ingest run",
+            route="/ingest-runs/{run_id}"
+        )
+        
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Request error: {e}")
         raise HTTPException(
@@ -155,27 +266,152 @@ async def fetch_commits():
             detail=f"Internal server error: {str(e)}"
         )
 
+@app.post("/api/analyze/stream")
+async def stream_commit_analysis(request: Request):
+    """Analyze a commit, relaying model tokens as Server-Sent Events
+
+    Emits "token" events as the model generates and a final "result" event,
+    so the UI can render the analysis from the first token on.
+    """
+    try:
+        logger.info("Streaming commit analysis")
+        
+        # Relayed chunk by chunk; the body is never buffered
+        return await stream_upstream(
+            ai_service,
+            "POST",
+            "/analyze/stream",
+            error_detail="Failed to analyze commit",
+            headers={"Content-Type": request.headers.get("content-type", "application/json")},
+            content=await request.body()
+        )
+        
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is not available"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.post("/api/analyze/batch")
+async def analyze_commit_batch(request: Request):
+    """Analyze many commits, relaying one NDJSON result line per commit as it finishes"""
+    try:
+        logger.info("Analyzing commit batch")
+        
+        # Relayed chunk by chunk, so early results reach the caller before the slowest one
+        return await stream_upstream(
+            ai_service,
+            "POST",
+            "/analyze/batch",
+            error_detail="Failed to analyze commit batch",
+            headers={"Content-Type": request.headers.get("content-type", "application/json")},
+            content=await request.body()
+        )
+        
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is not available"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
 @app.get("/api/analysis/{commit_hash}")
 async def get_commit_analysis(commit_hash: str):
-    """Get AI analysis for a specific commit"""
+    """Get AI analysis for a specific commit (streamed through unchanged)"""
     try:
         logger.info(f"Fetching analysis for commit: {commit_hash}")
         
-        # Make HTTP request to AI service
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.get(f"{AI_SERVICE_URL}/analysis/{commit_hash}")
-            
-            if response.status_code == 200:
-                analysis = response.json()
-                logger.info(f"Successfully fetched analysis for commit {commit_hash}")
-                return analysis
-            else:
-                logger.error(f"AI service returned error: {response.status_code}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to fetch commit analysis"
-                )
+        # Relay the AI service response body without decoding it
+        return await stream_upstream(
+            ai_service,
+            "GET",
+            f"/analysis/{commit_hash}",
+            error_detail="Failed to fetch commit analysis",
+            route="/analysis/{commit_hash}"
+        )
                 
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is not available"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.post("/api/analysis/{commit_hash}")
+async def create_commit_analysis(commit_hash: str, request: Request):
+    """Queue an AI analysis for a commit (responds 202 with a job to poll)
+
+    Pass priority=backfill for bulk work so it does not delay interactive requests.
+    """
+    try:
+        logger.info(f"Queueing analysis for commit: {commit_hash}")
+        
+        # Forward the commit data as-is
+        return await stream_upstream(
+            ai_service,
+            "POST",
+            f"/analysis/{commit_hash}",
+            route="/analysis/{commit_hash}",
+            error_detail="Failed to queue commit analysis",
+            headers={"Content-Type": request.headers.get("content-type", "application/json")},
+            params=dict(request.query_params),  # e.g. priority=backfill
+            content=await request.body()
+        )
+        
+    except HTTPException:
+        raise
+    except httpx.RequestError as e:
+        logger.error(f"Request error: {e}")
+        raise HTTPException(
+            status_code=503,
+            detail="AI service is not available"
+        )
+    except Exception as e:
+        logger.error(f"Unexpected error: {e}")
+        raise HTTPException(
+            status_code=500,
+            detail=f"Internal server error: {str(e)}"
+        )
+
+@app.get("/api/analysis-jobs/{job_id}")
+async def get_analysis_job(job_id: int):
+    """Get the state of a queued commit analysis"""
+    try:
+        return await stream_upstream(
+            ai_service,
+            "GET",
+            f"/analysis-jobs/{job_id}",
+            error_detail="Failed to fetch analysis job",
+            route="/analysis-jobs/{job_id}"
+        )
+        
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Request error: {e}")
         raise HTTPException(
@@ -196,20 +432,21 @@ async def clear_commits():
         logger.info("Clearing all commits from database")
         
         # Make HTTP request to GitHub service to clear commits
-        async with httpx.AsyncClient(timeout=30.0) as client:
-            response = await client.delete(f"{GITHUB_SERVICE_URL}/clear-commits")
-            
-            if response.status_code == 200:
-                result = response.json()
-                logger.info("Successfully cleared commits from database")
-                return result
-            else:
-                logger.error(f"Failed to clear commits: {response.status_code}")
-                raise HTTPException(
-                    status_code=response.status_code,
-                    detail="Failed to clear commits from database"
-                )
-                
+        response = await github_service.request("DELETE", "/clear-commits")
+        
+        if response.status_code == 200:
+            result = response.json()
+            logger.info("Successfully cleared commits from database")
+            return result
+        else:
+            logger.error(f"Failed to clear commits: {response.status_code}")
+            raise HTTPException(
+                status_code=response.status_code,
+                detail="Failed to clear commits from database"
+            )
+
+    except HTTPException:
+        raise
     except httpx.RequestError as e:
         logger.error(f"Request error: {e}")
         raise HTTPException(
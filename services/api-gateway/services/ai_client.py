@@ -1,2 +1,18 @@
 # AI client service for API Gateway
-# This file will contain HTTP client for communicating with AI Service
+# HTTP client for communicating with AI Service
+import os
+from dotenv import load_dotenv
+
+from services.upstream import Upstream
+from services.load_balancer import parse_replica_urls
+
+# Load environment variables
+load_dotenv()
+
+AI_SERVICE_URL = os.getenv("AI_SERVICE_URL", "http://ai-service:8002")
+
+# Comma-separated replica URLs; defaults to the single AI_SERVICE_URL
+AI_SERVICE_URLS = parse_replica_urls(os.getenv("AI_SERVICE_URLS"), AI_SERVICE_URL)
+
+# Shared client for AI Service
+ai_service = Upstream("ai-service", AI_SERVICE_URLS)
@@ -0,0 +1,204 @@
+# Response compression for API Gateway
+# Negotiates brotli/gzip with the client and compresses responses above a size threshold
+import zlib
+import logging
+from typing import Optional
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Content types that are never worth compressing (already compressed, or streamed events and
+# NDJSON lines that must reach the client as soon as they are written)
+UNCOMPRESSIBLE_TYPES = ("text/event-stream", "application/x-ndjson", "image/", "video/", "audio/", "application/zip", "application/gzip")
+
+# Suffix added inside the ETag quotes for each encoding, so every representation has its own strong validator
+ETAG_SUFFIXES = {"br": "-br", "gzip": "-gzip"}
+
+def choose_encoding(accept_encoding: str) -> Optional[str]:
+    """
+    Pick the best content encoding supported by both client and gateway
+
+    Args:
+        accept_encoding: Value of the Accept-Encoding request header
+
+    Returns:
+        "br", "gzip" or None if nothing acceptable
+    """
+    accepted = {}
+    for part in accept_encoding.split(","):
+        token, _, params = part.strip().partition(";")
+        token = token.strip().lower()
+        if not token:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[token] = quality
+
+    wildcard = accepted.get("*", 0.0)
+    if brotli is not None and accepted.get("br", wildcard) > 0:
+        return "br"
+    if accepted.get("gzip", wildcard) > 0:
+        return "gzip"
+    return None
+
+def add_etag_suffix(etag: str, encoding: str) -> str:
+    """Mark an ETag as belonging to the compressed representation"""
+    if not etag.endswith('"'):
+        return etag
+    return f"{etag[:-1]}{ETAG_SUFFIXES[encoding]}\""
+
+def strip_etag_suffix(etag: str) -> str:
+    """Map an ETag of a compressed representation back to the upstream ETag"""
+    for suffix in ETAG_SUFFIXES.values():
+        if etag.endswith(f'{suffix}"'):
+            return f"{etag[:-len(suffix) - 1]}\""
+    return etag
+
+def normalize_if_none_match(if_none_match: str) -> str:
+    """
+    Rewrite an If-None-Match header so it can be evaluated by the upstream service
+
+    Clients echo back the encoding-specific ETags issued by this gateway;
+    upstream only knows the ETag of the uncompressed representation.
+    """
+    if if_none_match.strip() == "*":
+        return "*"
+    tags = [strip_etag_suffix(tag.strip()) for tag in if_none_match.split(",") if tag.strip()]
+    return ", ".join(tags)
+
+class _Compressor:
+    """Incremental compressor for one response body"""
+
+    def __init__(self, encoding: str, level: int):
+        self.encoding = encoding
+        if encoding == "br":
+            self._compressor = brotli.Compressor(quality=min(level, 11))
+        else:
+            # wbits=31 selects the gzip container format
+            self._compressor = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: bytes, final: bool) -> bytes:
+        """Compress a chunk, flushing so the client can decode it immediately"""
+        if self.encoding == "br":
+            output = self._compressor.process(data)
+            output += self._compressor.finish() if final else self._compressor.flush()
+        else:
+            output = self._compressor.compress(data)
+            output += self._compressor.flush(zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+        return output
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses responses using the client's preferred encoding"""
+
+    def __init__(self, app, minimum_size: int = 1024, compresslevel: int = 6):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope.get("headers") or [])
+        encoding = choose_encoding(headers.get(b"accept-encoding", b"").decode("latin-1"))
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        responder = _CompressionResponder(send, encoding, self.minimum_size, self.compresslevel)
+        await self.app(scope, receive, responder.send)
+
+class _CompressionResponder:
+    """Wraps the ASGI send callable for a single response"""
+
+    def __init__(self, send, encoding: str, minimum_size: int, compresslevel: int):
+        self._send = send
+        self.encoding = encoding
+        self.minimum_size = minimum_size
+        self.compresslevel = compresslevel
+        self.start_message = None
+        self.compressor = None
+        self.passthrough = False
+
+    async def send(self, message):
+        if message["type"] == "http.response.start":
+            # Hold the start message until we know whether the body gets compressed
+            self.start_message = message
+            return
+
+        if message["type"] != "http.response.body" or self.passthrough:
+            await self._send(message)
+            return
+
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+
+        if self.compressor is None:
+            if not self._should_compress(body, more_body):
+                self.passthrough = True
+                await self._send(self.start_message)
+                await self._send(message)
+                return
+            self.compressor = _Compressor(self.encoding, self.compresslevel)
+            if not more_body:
+                # Whole body is known: compress it in one go and send an exact length
+                compressed = self.compressor.compress(body, final=True)
+                await self._send(self._compressed_start(len(compressed)))
+                await self._send({"type": "http.response.body", "body": compressed})
+                return
+            await self._send(self._compressed_start(None))
+
+        await self._send({
+            "type": "http.response.body",
+            "body": self.compressor.compress(body, final=not more_body),
+            "more_body": more_body
+        })
+
+    def _should_compress(self, body: bytes, more_body: bool) -> bool:
+        """Decide from the start message and first chunk whether to compress"""
+        status = self.start_message["status"]
+        headers = {k.lower(): v for k, v in self.start_message.get("headers", [])}
+
+        if status < 200 or status in (204, 304):
+            return False
+        if b"content-encoding" in headers:
+            return False
+        content_type = headers.get(b"content-type", b"").decode("latin-1")
+        if content_type.startswith(UNCOMPRESSIBLE_TYPES):
+            return False
+        if more_body:
+            # Streamed bodies are judged by their declared length, if any
+            content_length = headers.get(b"content-length")
+            return content_length is None or int(content_length) >= self.minimum_size
+        return len(body) >= self.minimum_size
+
+    def _compressed_start(self, content_length: Optional[int]) -> dict:
+        """Build the start message for the compressed response"""
+        raw_headers = [
+            (name, value) for name, value in self.start_message.get("headers", [])
+            if name.lower() not in (b"content-length", b"etag", b"vary")
+        ]
+        original = {k.lower(): v for k, v in self.start_message.get("headers", [])}
+
+        raw_headers.append((b"content-encoding", self.encoding.encode("latin-1")))
+        vary = original.get(b"vary", b"")
+        raw_headers.append((b"vary", b"Accept-Encoding" if not vary else vary + b", Accept-Encoding"))
+        if b"etag" in original:
+            etag = add_etag_suffix(original[b"etag"].decode("latin-1"), self.encoding)
+            raw_headers.append((b"etag", etag.encode("latin-1")))
+
+        if content_length is not None:
+            raw_headers.append((b"content-length", str(content_length).encode("latin-1")))
+
+        return {**self.start_message, "headers": raw_headers}
@@ -1,2 +1,26 @@
 # GitHub client service for API Gateway
-# This file will contain HTTP client for communicating with GitHub Service
+# HTTP client for communicating with GitHub Service
+import os
+from dotenv import load_dotenv
+
+from services.upstream import Upstream
+from services.load_balancer import parse_replica_urls
+
+# Load environment variables
+load_dotenv()
+
+GITHUB_SERVICE_URL = os.getenv("GITHUB_SERVICE_URL", "http://github-service:8001")
+
+# Comma-separated replica URLs; defaults to the single GITHUB_SERVICE_URL
+GITHUB_SERVICE_URLS = parse_replica_urls(os.getenv("GITHUB_SERVICE_URLS"), GITHUB_SERVICE_URL)
+
+# Replica hosting the live commit feed (defaults to the first replica). The feed's event
+# bus lives in one github-service process, so every subscriber must reach that replica;
+# the other replicas forward the events they publish to it (EVENT_FEED_URL)
+GITHUB_FEED_URL = os.getenv("GITHUB_FEED_URL", GITHUB_SERVICE_URLS[0]).rstrip("/")
+
+# Shared client for GitHub Service
+github_service = Upstream("github-service", GITHUB_SERVICE_URLS)
+
+# Client pinned to the feed replica
+github_feed = Upstream("github-feed", [GITHUB_FEED_URL])
@@ -0,0 +1,143 @@
+# Load balancer for API Gateway
+# Picks a backend replica per request and tracks replica health
+import os
+import time
+import random
+import logging
+from typing import Dict, List, Optional
+
+from dotenv import load_dotenv
+
+from services.resilience import CircuitBreaker
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Balancing settings
+LOAD_BALANCER_STRATEGY = os.getenv("LOAD_BALANCER_STRATEGY", "p2c")  # p2c or least_outstanding
+SLOW_START_SECONDS = float(os.getenv("SLOW_START_SECONDS", "30.0"))
+UNHEALTHY_THRESHOLD = int(os.getenv("HEALTH_CHECK_UNHEALTHY_THRESHOLD", "2"))
+HEALTHY_THRESHOLD = int(os.getenv("HEALTH_CHECK_HEALTHY_THRESHOLD", "2"))
+
+# Weight given to a replica at the very start of its slow-start window
+SLOW_START_MIN_WEIGHT = 0.1
+
+def parse_replica_urls(urls: Optional[str], default: str) -> List[str]:
+    """Split a comma-separated list of replica URLs (falls back to a single default URL)"""
+    parsed = [url.strip().rstrip("/") for url in (urls or "").split(",") if url.strip()]
+    return parsed or [default]
+
+class Replica:
+    """One instance of a backend service"""
+
+    def __init__(self, url: str, failure_threshold: int, recovery_timeout: float):
+        self.url = url
+        self.breaker = CircuitBreaker(failure_threshold, recovery_timeout)
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.recovered_at: Optional[float] = None
+
+    def weight(self, now: float) -> float:
+        """Traffic weight; ramps up linearly after the replica rejoins the pool"""
+        if self.recovered_at is None or SLOW_START_SECONDS <= 0:
+            return 1.0
+        elapsed = now - self.recovered_at
+        if elapsed >= SLOW_START_SECONDS:
+            self.recovered_at = None
+            return 1.0
+        return max(SLOW_START_MIN_WEIGHT, elapsed / SLOW_START_SECONDS)
+
+    def load(self, now: float) -> float:
+        """Outstanding requests scaled by weight (lower is better)"""
+        return (self.outstanding + 1) / self.weight(now)
+
+    def record_probe(self, success: bool):
+        """Feed a health probe result, ejecting or restoring the replica"""
+        if success:
+            self.consecutive_failures = 0
+            self.consecutive_successes += 1
+            if not self.healthy and self.consecutive_successes >= HEALTHY_THRESHOLD:
+                self.healthy = True
+                self.recovered_at = time.monotonic()
+                self.breaker.reset()
+                logger.info(f"Replica {self.url} is healthy again, starting slow-start")
+        else:
+            self.consecutive_successes = 0
+            self.consecutive_failures += 1
+            if self.healthy and self.consecutive_failures >= UNHEALTHY_THRESHOLD:
+                self.healthy = False
+                logger.warning(f"Replica {self.url} failed health checks, ejecting")
+
+    def reset(self):
+        """Return to a healthy, idle state"""
+        self.breaker.reset()
+        self.outstanding = 0
+        self.healthy = True
+        self.consecutive_failures = 0
+        self.consecutive_successes = 0
+        self.recovered_at = None
+
+    def status(self) -> Dict:
+        """Replica state, for health reporting"""
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.breaker.state,
+            "outstanding": self.outstanding,
+            "weight": round(self.weight(time.monotonic()), 2)
+        }
+
+class LoadBalancer:
+    """
+    Chooses replicas by least outstanding requests or power-of-two-choices
+
+    Replicas that failed health checks are skipped while any healthy replica
+    remains; if every replica is unhealthy, all of them are tried rather than
+    failing outright.
+    """
+
+    def __init__(self, urls: List[str], failure_threshold: int = 5, recovery_timeout: float = 10.0,
+                 strategy: str = LOAD_BALANCER_STRATEGY):
+        self.replicas = [Replica(url, failure_threshold, recovery_timeout) for url in urls]
+        self.strategy = strategy
+
+    def choose(self, exclude: Optional[List[Replica]] = None) -> Optional[Replica]:
+        """
+        Pick a replica whose circuit accepts a request
+
+        Args:
+            exclude: Replicas already tried for this request (used only as a last resort)
+
+        Returns:
+            The chosen replica, or None if every circuit is open
+        """
+        exclude = exclude or []
+        healthy = [r for r in self.replicas if r.healthy] or list(self.replicas)
+        candidates = [r for r in healthy if r not in exclude] or healthy
+        now = time.monotonic()
+
+        # Try replicas in preference order until one's circuit lets the request through
+        while candidates:
+            replica = self._pick(candidates, now)
+            if replica.breaker.allow_request():
+                return replica
+            candidates.remove(replica)
+        return None
+
+    def _pick(self, candidates: List[Replica], now: float) -> Replica:
+        if len(candidates) == 1:
+            return candidates[0]
+        if self.strategy == "least_outstanding":
+            return min(candidates, key=lambda r: r.load(now))
+        first, second = random.sample(candidates, 2)
+        return first if first.load(now) <= second.load(now) else second
+
+    def reset(self):
+        """Reset every replica"""
+        for replica in self.replicas:
+            replica.reset()
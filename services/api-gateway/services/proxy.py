@@ -0,0 +1,80 @@
+# Streaming proxy for API Gateway
+# Forwards upstream responses to the client without decoding their bodies
+import logging
+from typing import Dict, Optional
+from fastapi import HTTPException
+from fastapi.responses import StreamingResponse
+from starlette.background import BackgroundTask
+
+from services.upstream import Upstream
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Upstream response headers that are copied onto the gateway response
+PASSTHROUGH_HEADERS = (
+    "content-type",
+    "content-length",
+    "content-encoding",
+    "cache-control",
+    "etag",
+    "last-modified",
+)
+
+async def stream_upstream(
+    upstream: Upstream,
+    method: str,
+    path: str,
+    error_detail: str,
+    headers: Optional[Dict] = None,
+    params: Optional[Dict] = None,
+    content: Optional[bytes] = None,
+    route: Optional[str] = None,
+    hedge: bool = True
+) -> StreamingResponse:
+    """
+    Proxy a request to a backend service and stream its response back as-is
+
+    The upstream body is relayed chunk by chunk in its raw (possibly encoded)
+    form, so the gateway never parses or re-serializes it.
+
+    Args:
+        upstream: Backend service to call
+        method: HTTP method
+        path: Path on the backend service
+        error_detail: Detail message used when upstream returns an error status
+        headers: Optional request headers to send upstream
+        params: Optional query parameters
+        content: Optional raw request body
+        route: Route template of path, for per-route latency tracking (default: path)
+        hedge: Whether an idempotent request may be hedged (False for event streams)
+
+    Returns:
+        StreamingResponse relaying upstream status, selected headers and body
+
+    Raises:
+        HTTPException: If upstream responds with a 4xx/5xx status
+        httpx.RequestError: If upstream cannot be reached
+    """
+    kwargs = {"headers": headers, "params": params}
+    if content is not None:
+        kwargs["content"] = content
+    response = await upstream.request(method, path, stream=True, route=route, hedge=hedge, **kwargs)
+
+    if response.status_code >= 400:
+        await response.aclose()
+        logger.error(f"{upstream.name} {method} {path} returned error: {response.status_code}")
+        raise HTTPException(status_code=response.status_code, detail=error_detail)
+
+    forwarded_headers = {
+        name: response.headers[name]
+        for name in PASSTHROUGH_HEADERS
+        if name in response.headers
+    }
+
+    return StreamingResponse(
+        response.aiter_raw(),
+        status_code=response.status_code,
+        headers=forwarded_headers,
+        background=BackgroundTask(response.aclose)
+    )
@@ -0,0 +1,221 @@
+# Rate limiting for API Gateway
+# Token buckets per client with per-route costs, plus load shedding on saturation
+import os
+import json
+import math
+import time
+import logging
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Rate limiting settings
+RATE_LIMIT_ENABLED = os.getenv("RATE_LIMIT_ENABLED", "true").lower() == "true"
+RATE_LIMIT_CAPACITY = float(os.getenv("RATE_LIMIT_CAPACITY", "60"))
+RATE_LIMIT_REFILL_PER_SECOND = float(os.getenv("RATE_LIMIT_REFILL_PER_SECOND", "1.0"))
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "memory")  # memory or redis
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+TRUST_FORWARDED_FOR = os.getenv("TRUST_FORWARDED_FOR", "false").lower() == "true"
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "200"))
+
+# Token cost per route; anything not listed costs DEFAULT_COST
+ROUTE_COSTS = {
+    ("POST", "/api/tracking/start"): 10,
+    ("POST", "/api/fetch-commits"): 10,
+    ("DELETE", "/api/clear-commits"): 10,
+    ("POST", "/api/analyze/stream"): 10,
+    ("POST", "/api/analyze/batch"): 30,
+}
+DEFAULT_COST = 1
+
+# Routes that are never rate limited
+EXEMPT_PATHS = ("/", "/health", "/docs", "/openapi.json")
+
+# Long-lived streams are rate limited on connect but do not count as in-flight work
+STREAMING_PATHS = ("/api/commits/stream",)
+
+class BucketStore(ABC):
+    """Storage backend for token buckets"""
+
+    @abstractmethod
+    async def take(self, key: str, cost: float, capacity: float, refill_rate: float) -> Tuple[bool, float]:
+        """
+        Try to take tokens from a bucket
+
+        Returns:
+            (allowed, seconds until enough tokens are available if not allowed)
+        """
+
+    @abstractmethod
+    async def reset(self):
+        """Drop all buckets"""
+
+class InMemoryBucketStore(BucketStore):
+    """Per-process buckets; idle clients are evicted beyond max_keys"""
+
+    def __init__(self, max_keys: int = 10000):
+        self.max_keys = max_keys
+        self.buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+
+    async def take(self, key: str, cost: float, capacity: float, refill_rate: float) -> Tuple[bool, float]:
+        now = time.monotonic()
+        tokens, updated = self.buckets.pop(key, (capacity, now))
+        tokens = min(capacity, tokens + (now - updated) * refill_rate)
+
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = (tokens, now)
+        if len(self.buckets) > self.max_keys:
+            self.buckets.popitem(last=False)
+
+        retry_after = 0.0 if allowed else (cost - tokens) / refill_rate
+        return allowed, retry_after
+
+    async def reset(self):
+        self.buckets.clear()
+
+class RedisBucketStore(BucketStore):
+    """Buckets shared by all gateway replicas, updated atomically in Redis"""
+
+    # Refill and take in one atomic step; returns {allowed, retry_after}
+    SCRIPT = """
+    local capacity = tonumber(ARGV[1])
+    local refill_rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + (now - updated) * refill_rate)
+    local allowed = 0
+    local retry_after = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    else
+        retry_after = (cost - tokens) / refill_rate
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / refill_rate) + 1)
+    return {allowed, tostring(retry_after)}
+    """
+
+    def __init__(self, url: str):
+        import redis.asyncio as redis  # imported here so the memory backend does not need a Redis client
+        self.redis = redis.from_url(url)
+        self.script = self.redis.register_script(self.SCRIPT)
+
+    async def take(self, key: str, cost: float, capacity: float, refill_rate: float) -> Tuple[bool, float]:
+        allowed, retry_after = await self.script(
+            keys=[f"ratelimit:{key}"],
+            args=[capacity, refill_rate, cost, time.time()]
+        )
+        return bool(allowed), float(retry_after)
+
+    async def reset(self):
+        async for key in self.redis.scan_iter("ratelimit:*"):
+            await self.redis.delete(key)
+
+def create_bucket_store() -> BucketStore:
+    """Create the configured bucket backend"""
+    if RATE_LIMIT_BACKEND == "redis":
+        logger.info("Using Redis rate limit buckets")
+        return RedisBucketStore(REDIS_URL)
+    return InMemoryBucketStore()
+
+# Shared bucket store for the gateway
+bucket_store = create_bucket_store()
+
+def client_identity(scope: Dict) -> str:
+    """Identify the caller: API key if given, otherwise the client address"""
+    headers = dict(scope.get("headers") or [])
+    api_key = headers.get(b"x-api-key")
+    if api_key:
+        return f"key:{api_key.decode('latin-1')}"
+    if TRUST_FORWARDED_FOR and b"x-forwarded-for" in headers:
+        return f"ip:{headers[b'x-forwarded-for'].decode('latin-1').split(',')[0].strip()}"
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+def route_cost(method: str, path: str) -> float:
+    """Token cost of a request"""
+    return ROUTE_COSTS.get((method, path), DEFAULT_COST)
+
+class RateLimitMiddleware:
+    """
+    ASGI middleware enforcing per-client token buckets and a global in-flight cap
+
+    Requests that exceed their client's bucket, or arrive while the gateway is
+    already handling MAX_IN_FLIGHT_REQUESTS, are rejected with 429 and a
+    Retry-After header before any upstream call is made.
+    """
+
+    def __init__(self, app, store: Optional[BucketStore] = None):
+        self.app = app
+        self.store = store or bucket_store
+        self.in_flight = 0
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not RATE_LIMIT_ENABLED:
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        path = scope["path"]
+        if method == "OPTIONS" or path in EXEMPT_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        streaming = path in STREAMING_PATHS
+        if not streaming and MAX_IN_FLIGHT_REQUESTS and self.in_flight >= MAX_IN_FLIGHT_REQUESTS:
+            logger.warning(f"Shedding {method} {path}: {self.in_flight} requests in flight")
+            await self._reject(send, 1.0, "Gateway is overloaded")
+            return
+
+        key = client_identity(scope)
+        try:
+            allowed, retry_after = await self.store.take(
+                key, route_cost(method, path), RATE_LIMIT_CAPACITY, RATE_LIMIT_REFILL_PER_SECOND
+            )
+        except Exception as e:
+            # A broken shared backend must not take the gateway down with it
+            logger.error(f"Rate limit backend error, allowing request: {e}")
+            allowed, retry_after = True, 0.0
+
+        if not allowed:
+            logger.warning(f"Rate limit exceeded for {key} on {method} {path}")
+            await self._reject(send, retry_after, "Rate limit exceeded")
+            return
+
+        if streaming:
+            await self.app(scope, receive, send)
+            return
+
+        self.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.in_flight -= 1
+
+    async def _reject(self, send, retry_after: float, detail: str):
+        """Send a 429 response"""
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 429,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(max(1, math.ceil(retry_after))).encode()),
+            ]
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,136 @@
+# Resilience primitives for API Gateway
+# Circuit breaker, retry budget and latency tracking used for upstream calls
+import time
+import math
+import logging
+from collections import deque
+from typing import Optional
+
+import httpx
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+class CircuitOpenError(httpx.RequestError):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+class CircuitBreaker:
+    """
+    Circuit breaker with half-open probing
+
+    closed    - requests flow; consecutive failures are counted
+    open      - requests are rejected immediately until recovery_timeout passes
+    half_open - a limited number of probe requests decide whether to close again
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, recovery_timeout: float = 10.0, half_open_max_calls: int = 1):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self.half_open_max_calls = half_open_max_calls
+        self.reset()
+
+    def reset(self):
+        """Return to the closed state and forget all failures"""
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.half_open_calls = 0
+
+    def allow_request(self) -> bool:
+        """Check whether a request may be sent now"""
+        if self.state == self.OPEN:
+            if time.monotonic() - self.opened_at < self.recovery_timeout:
+                return False
+            self.state = self.HALF_OPEN
+            self.half_open_calls = 0
+            logger.info("Circuit half-open, probing upstream")
+
+        if self.state == self.HALF_OPEN:
+            if self.half_open_calls >= self.half_open_max_calls:
+                return False
+            self.half_open_calls += 1
+
+        return True
+
+    def record_success(self):
+        """Record a successful call"""
+        if self.state != self.CLOSED:
+            logger.info("Circuit closed, upstream recovered")
+        self.reset()
+
+    def record_failure(self):
+        """Record a failed call (connection error, timeout or 5xx)"""
+        self.failures += 1
+        if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+            if self.state != self.OPEN:
+                logger.warning(f"Circuit opened after {self.failures} failures")
+            self.state = self.OPEN
+            self.opened_at = time.monotonic()
+            self.half_open_calls = 0
+
+class RetryBudget:
+    """
+    Limits retries and hedged requests to a fraction of recent traffic
+
+    Within the sliding window, at most min_per_second * window + ratio * requests
+    extra attempts are allowed, so retries can never multiply load during an outage.
+    """
+
+    def __init__(self, ratio: float = 0.2, min_per_second: float = 1.0, window: float = 10.0):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.window = window
+        self.requests = deque()
+        self.retries = deque()
+
+    def reset(self):
+        """Forget all recorded traffic"""
+        self.requests.clear()
+        self.retries.clear()
+
+    def _prune(self, now: float):
+        cutoff = now - self.window
+        for timestamps in (self.requests, self.retries):
+            while timestamps and timestamps[0] < cutoff:
+                timestamps.popleft()
+
+    def record_request(self):
+        """Record an original (non-retry) request"""
+        self.requests.append(time.monotonic())
+
+    def try_acquire(self) -> bool:
+        """Take permission for one retry or hedge, if the budget allows it"""
+        now = time.monotonic()
+        self._prune(now)
+        allowed = self.min_per_second * self.window + self.ratio * len(self.requests)
+        if len(self.retries) >= allowed:
+            return False
+        self.retries.append(now)
+        return True
+
+class LatencyTracker:
+    """Rolling window of response latencies used to decide when to hedge"""
+
+    def __init__(self, window_size: int = 200, min_samples: int = 20):
+        self.samples = deque(maxlen=window_size)
+        self.min_samples = min_samples
+
+    def reset(self):
+        """Forget all samples"""
+        self.samples.clear()
+
+    def record(self, seconds: float):
+        """Record the latency of a successful call"""
+        self.samples.append(seconds)
+
+    def percentile(self, percentile: float) -> Optional[float]:
+        """Get a latency percentile in seconds (None until enough samples exist)"""
+        if len(self.samples) < self.min_samples:
+            return None
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, max(0, math.ceil(percentile / 100 * len(ordered)) - 1))
+        return ordered[index]
@@ -0,0 +1,292 @@
+# Upstream client for API Gateway
+# Pooled HTTP client for one backend service, wrapped in a resilience layer
+import asyncio
+import os
+import time
+import logging
+from typing import Dict, List, Optional
+
+import httpx
+from dotenv import load_dotenv
+
+from services.resilience import CircuitOpenError, LatencyTracker, RetryBudget
+from services.load_balancer import LoadBalancer, Replica
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Methods that are safe to retry and hedge
+IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS")
+
+# Requests carrying this header are deduplicated upstream, so they are safe to retry too
+IDEMPOTENCY_KEY_HEADER = "Idempotency-Key"
+
+# Resilience settings (shared defaults for every upstream)
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "30.0"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "5.0"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+RETRY_BACKOFF = float(os.getenv("UPSTREAM_RETRY_BACKOFF", "0.05"))
+RETRY_BUDGET_RATIO = float(os.getenv("RETRY_BUDGET_RATIO", "0.2"))
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_RECOVERY_TIMEOUT = float(os.getenv("CIRCUIT_RECOVERY_TIMEOUT", "10.0"))
+HEDGING_ENABLED = os.getenv("UPSTREAM_HEDGING", "true").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+
+# Routes whose latency is tracked separately; any further routes share one tracker
+MAX_TRACKED_ROUTES = 256
+
+# Health probing of replicas
+HEALTH_CHECK_INTERVAL = float(os.getenv("HEALTH_CHECK_INTERVAL", "5.0"))
+HEALTH_CHECK_TIMEOUT = float(os.getenv("HEALTH_CHECK_TIMEOUT", "2.0"))
+
+def idempotency_headers(key: Optional[str]) -> Optional[Dict]:
+    """Headers forwarding a client's Idempotency-Key, if it sent one"""
+    return {IDEMPOTENCY_KEY_HEADER: key} if key else None
+
+def has_idempotency_key(headers) -> bool:
+    """Check whether request headers carry an Idempotency-Key"""
+    return bool(headers) and any(name.lower() == IDEMPOTENCY_KEY_HEADER.lower() for name in headers)
+
+class Upstream:
+    """
+    Client for one backend service, spread over one or more replicas
+
+    Every attempt is routed to a replica by the load balancer and goes through
+    that replica's circuit breaker. Idempotent requests, and other requests
+    carrying an Idempotency-Key, are retryable: they are retried on another
+    replica after connection errors and 5xx responses while the retry budget
+    allows. Idempotent requests are also hedged with a second attempt once
+    they run longer than the configured latency percentile of their route
+    (for streamed requests, the time until response headers arrive); the
+    losing attempt is cancelled and its response closed. Callers opt out for
+    long-lived streams such as event feeds, where a duplicate would hold a
+    second connection for as long as the stream lasts.
+    """
+
+    def __init__(self, name: str, urls: List[str]):
+        self.name = name
+        self.urls = urls
+        self.balancer = LoadBalancer(urls, CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_RECOVERY_TIMEOUT)
+        self.budget = RetryBudget(ratio=RETRY_BUDGET_RATIO)
+        self.latencies: Dict[str, LatencyTracker] = {}
+        self.max_retries = UPSTREAM_MAX_RETRIES
+        self.hedging = HEDGING_ENABLED
+        self._client: Optional[httpx.AsyncClient] = None
+        self._health_task: Optional[asyncio.Task] = None
+
+    @property
+    def client(self) -> httpx.AsyncClient:
+        """Shared keep-alive connection pool for this upstream"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+            )
+        return self._client
+
+    async def aclose(self):
+        """Stop health checks and close the connection pool"""
+        if self._health_task is not None:
+            self._health_task.cancel()
+            self._health_task = None
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def reset(self):
+        """Reset replicas, budget and latency statistics"""
+        self.balancer.reset()
+        self.budget.reset()
+        self.latencies.clear()
+
+    def status(self) -> Dict:
+        """Current balancing and resilience state, for health reporting"""
+        return {
+            "replicas": [replica.status() for replica in self.balancer.replicas],
+            "p95_latency_ms": {route: self._latency_ms(route, 95) for route in sorted(self.latencies)}
+        }
+
+    def latency(self, route: str) -> LatencyTracker:
+        """Latency tracker of one route template (e.g. "/analysis/{commit_hash}")"""
+        tracker = self.latencies.get(route)
+        if tracker is None:
+            if len(self.latencies) >= MAX_TRACKED_ROUTES:
+                route = "*"
+            tracker = self.latencies.setdefault(route, LatencyTracker())
+        return tracker
+
+    def _latency_ms(self, route: str, percentile: float) -> Optional[int]:
+        value = self.latencies[route].percentile(percentile)
+        return int(value * 1000) if value is not None else None
+
+    def start_health_checks(self):
+        """Probe replicas in the background so unhealthy ones are ejected"""
+        # With a single replica there is nothing to route around
+        if len(self.balancer.replicas) > 1 and self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.gather(*(self._probe(replica) for replica in self.balancer.replicas))
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+
+    async def _probe(self, replica: Replica):
+        """Check one replica's /health endpoint"""
+        try:
+            response = await self.client.get(f"{replica.url}/health", timeout=HEALTH_CHECK_TIMEOUT)
+            replica.record_probe(response.status_code == 200)
+        except httpx.HTTPError:
+            replica.record_probe(False)
+
+    def _choose(self, method: str, path: str, tried: List[Replica]) -> Replica:
+        replica = self.balancer.choose(exclude=tried)
+        if replica is None:
+            raise CircuitOpenError(
+                f"{self.name} circuit is open",
+                request=httpx.Request(method, f"{self.urls[0]}{path}")
+            )
+        return replica
+
+    async def request(self, method: str, path: str, stream: bool = False, route: Optional[str] = None,
+                      hedge: bool = True, **kwargs) -> httpx.Response:
+        """
+        Send a request to this upstream
+
+        Args:
+            method: HTTP method
+            path: Path on the upstream service (e.g. "/commits")
+            stream: Return before the body is read (caller must aclose the response)
+            route: Route template the path belongs to, for latency tracking (default: path)
+            hedge: Whether an idempotent request may be hedged (False for event streams)
+            **kwargs: Passed to httpx (headers, params, json, content)
+
+        Returns:
+            The upstream response (may have a 5xx status if retries are exhausted)
+
+        Raises:
+            CircuitOpenError: If every replica's circuit is open
+            httpx.RequestError: If the upstream cannot be reached
+        """
+        method = method.upper()
+        idempotent = method in IDEMPOTENT_METHODS
+        retryable = idempotent or has_idempotency_key(kwargs.get("headers"))
+        latencies = self.latency(route or path)
+        self.budget.record_request()
+        tried: List[Replica] = []
+        attempt = 0
+
+        while True:
+            replica = self._choose(method, path, tried)
+            tried.append(replica)
+
+            error = None
+            response = None
+            try:
+                if idempotent and self.hedging and hedge:
+                    response = await self._hedged_send(replica, method, path, stream, kwargs, tried, latencies)
+                else:
+                    response = await self._send(replica, method, path, stream, kwargs, latencies)
+                if response.status_code < 500 or not retryable:
+                    return response
+            except CircuitOpenError:
+                raise
+            except httpx.RequestError as e:
+                error = e
+
+            attempt += 1
+            if not retryable or attempt > self.max_retries or not self.budget.try_acquire():
+                if error is not None:
+                    raise error
+                return response
+
+            if response is not None and stream:
+                await response.aclose()
+            logger.warning(f"Retrying {method} {path} on {self.name} (attempt {attempt + 1})")
+            await asyncio.sleep(RETRY_BACKOFF * attempt)
+
+    async def _send(self, replica: Replica, method: str, path: str, stream: bool, kwargs: Dict,
+                    latencies: LatencyTracker) -> httpx.Response:
+        """Send a single attempt and feed its outcome to the replica breaker and latency tracker"""
+        url = f"{replica.url}{path}"
+        start = time.monotonic()
+        replica.outstanding += 1
+        try:
+            if stream:
+                request = self.client.build_request(method, url, **kwargs)
+                response = await self.client.send(request, stream=True)
+            else:
+                response = await getattr(self.client, method.lower())(url, **kwargs)
+        except httpx.RequestError:
+            replica.breaker.record_failure()
+            raise
+        finally:
+            replica.outstanding -= 1
+
+        if response.status_code >= 500:
+            replica.breaker.record_failure()
+        else:
+            replica.breaker.record_success()
+            latencies.record(time.monotonic() - start)
+        return response
+
+    async def _hedged_send(self, replica: Replica, method: str, path: str, stream: bool, kwargs: Dict,
+                           tried: List[Replica], latencies: LatencyTracker) -> httpx.Response:
+        """Send an attempt, racing a second copy if the first is slower than usual for its route"""
+        delay = latencies.percentile(HEDGE_PERCENTILE)
+        primary = asyncio.ensure_future(self._send(replica, method, path, stream, kwargs, latencies))
+        if delay is None:
+            return await primary
+
+        try:
+            return await self._race(primary, delay, method, path, stream, kwargs, tried, latencies)
+        except asyncio.CancelledError:
+            # The caller went away: do not leave attempts running
+            asyncio.ensure_future(self._discard(primary))
+            raise
+
+    async def _race(self, primary: asyncio.Future, delay: float, method: str, path: str, stream: bool,
+                    kwargs: Dict, tried: List[Replica], latencies: LatencyTracker) -> httpx.Response:
+        """Wait for the primary attempt, adding a hedge once it exceeds delay"""
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done or not self.budget.try_acquire():
+            return await primary
+
+        # Prefer a different replica for the hedge
+        hedge_replica = self.balancer.choose(exclude=tried)
+        if hedge_replica is None:
+            return await primary
+        tried.append(hedge_replica)
+
+        logger.info(f"Hedging {method} {path} on {self.name} after {int(delay * 1000)}ms")
+        hedge = asyncio.ensure_future(self._send(hedge_replica, method, path, stream, kwargs, latencies))
+        pending = {primary, hedge}
+        failed = []
+
+        while pending:
+            try:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            except asyncio.CancelledError:
+                asyncio.ensure_future(self._discard(hedge))
+                raise
+            for task in done:
+                if task.exception() is None and task.result().status_code < 500:
+                    for other in list(pending) + failed:
+                        asyncio.ensure_future(self._discard(other))
+                    return task.result()
+                failed.append(task)
+
+        # Both attempts failed: surface the latest failure
+        for task in failed[:-1]:
+            asyncio.ensure_future(self._discard(task))
+        return failed[-1].result()
+
+    async def _discard(self, task: asyncio.Future):
+        """Cancel a losing hedge attempt, closing its response if it already has one"""
+        task.cancel()
+        try:
+            response = await task
+        except BaseException:
+            return
+        await response.aclose()
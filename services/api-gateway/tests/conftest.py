@@ -8,6 +8,9 @@ import sys
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from main import app
+from services.github_client import github_service, github_feed
+from services.ai_client import ai_service
+from services.rate_limiter import bucket_store
 
 @pytest.fixture(scope="session")
 def event_loop():
@@ -16,6 +19,15 @@ def event_loop():
     yield loop
     loop.close()
 
+@pytest.fixture(autouse=True)
+def reset_upstreams():
+    """Give every test closed circuits, fresh retry budgets and full rate limit buckets."""
+    github_service.reset()
+    github_feed.reset()
+    ai_service.reset()
+    asyncio.run(bucket_store.reset())
+    yield
+
 @pytest.fixture(scope="function")
 def client():
     """Create a test client."""
@@ -1,7 +1,21 @@
 import pytest
-from unittest.mock import patch, Mock
+import json
+from unittest.mock import patch, Mock, AsyncMock
 import httpx
 
+def make_stream_response(status_code, body=b"", headers=None):
+    """Build a mock streamed upstream response."""
+    async def aiter_raw():
+        if body:
+            yield body
+
+    mock_response = Mock()
+    mock_response.status_code = status_code
+    mock_response.headers = httpx.Headers(headers or {})
+    mock_response.aiter_raw = aiter_raw
+    mock_response.aclose = AsyncMock()
+    return mock_response
+
 class TestAPIGateway:
     """Test cases for API Gateway endpoints."""
     
@@ -25,13 +39,14 @@ class TestAPIGateway:
         assert data["service"] == "api-gateway"
         assert "timestamp" in data
     
-    @patch('httpx.AsyncClient.get')
-    def test_get_commits_success(self, mock_get, client, mock_github_service_response):
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_success(self, mock_send, client, mock_github_service_response):
         """Test successful commit retrieval through API Gateway."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = mock_github_service_response
-        mock_get.return_value = mock_response
+        mock_send.return_value = make_stream_response(
+            200,
+            json.dumps(mock_github_service_response).encode(),
+            {"content-type": "application/json"}
+        )
         
         response = client.get("/api/commits")
         assert response.status_code == 200
@@ -46,22 +61,20 @@ class TestAPIGateway:
         assert commit["message"] == "Test commit message"
         assert commit["repository"] == "test/repo"
     
-    @patch('httpx.AsyncClient.get')
-    def test_get_commits_github_service_error(self, mock_get, client):
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_github_service_error(self, mock_send, client):
         """Test commit retrieval when GitHub service returns error."""
-        mock_response = Mock()
-        mock_response.status_code = 500
-        mock_get.return_value = mock_response
+        mock_send.return_value = make_stream_response(500)
         
         response = client.get("/api/commits")
         assert response.status_code == 500
         data = response.json()
         assert "Failed to fetch commits from GitHub service" in data["detail"]
     
-    @patch('httpx.AsyncClient.get')
-    def test_get_commits_github_service_unavailable(self, mock_get, client):
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_github_service_unavailable(self, mock_send, client):
         """Test commit retrieval when GitHub service is unavailable."""
-        mock_get.side_effect = httpx.RequestError("Connection failed")
+        mock_send.side_effect = httpx.RequestError("Connection failed")
         
         response = client.get("/api/commits")
         assert response.status_code == 503
@@ -89,7 +102,50 @@ class TestAPIGateway:
         assert session["repository"] == "test/repo"
         assert session["status"] == "active"
         assert data["commits_fetched"] == 1
-    
+
+    @patch('httpx.AsyncClient.post')
+    def test_start_tracking_forwards_idempotency_key(self, mock_post, client, mock_tracking_response):
+        """Test the client's Idempotency-Key is passed on to the GitHub service."""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = mock_tracking_response
+        mock_post.return_value = mock_response
+
+        response = client.post("/api/tracking/start", headers={"Idempotency-Key": "abc-123"})
+        assert response.status_code == 200
+        assert mock_post.call_args.kwargs["headers"] == {"Idempotency-Key": "abc-123"}
+
+    @patch('httpx.AsyncClient.post')
+    def test_start_tracking_accepted_run(self, mock_post, client):
+        """Test a background ingest run is relayed as 202 with its status URL."""
+        mock_response = Mock()
+        mock_response.status_code = 202
+        mock_response.json.return_value = {
+            "message": "Tracking started successfully. Fetching commits in the background.",
+            "session": {"repository": "test/repo", "status": "active"},
+            "run": {"id": 7, "status": "queued"}
+        }
+        mock_post.return_value = mock_response
+
+        response = client.post("/api/tracking/start")
+        assert response.status_code == 202
+        assert response.headers["location"] == "/api/ingest-runs/7"
+        assert response.json()["run"]["id"] == 7
+
+    @patch('httpx.AsyncClient.send')
+    def test_get_ingest_run(self, mock_send, client):
+        """Test ingest run progress is proxied from the GitHub service."""
+        mock_send.return_value = make_stream_response(
+            200,
+            body=json.dumps({"id": 7, "status": "running", "pages_fetched": 2}).encode(),
+            headers={"content-type": "application/json"}
+        )
+
+        response = client.get("/api/ingest-runs/7")
+        assert response.status_code == 200
+        assert response.json()["pages_fetched"] == 2
+        assert mock_send.call_args.args[0].url.path == "/ingest-runs/7"
+
     @patch('httpx.AsyncClient.post')
     def test_start_tracking_github_service_error(self, mock_post, client):
         """Test tracking start when GitHub service returns error."""
@@ -169,13 +225,12 @@ class TestAPIGateway:
         response = client.post("/api/commits")  # Should be GET
         assert response.status_code == 405
     
-    @patch('httpx.AsyncClient.get')
-    def test_get_commits_empty_response(self, mock_get, client):
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_empty_response(self, mock_send, client):
         """Test commit retrieval with empty response."""
-        mock_response = Mock()
-        mock_response.status_code = 200
-        mock_response.json.return_value = []
-        mock_get.return_value = mock_response
+        mock_send.return_value = make_stream_response(
+            200, b"[]", {"content-type": "application/json"}
+        )
         
         response = client.get("/api/commits")
         assert response.status_code == 200
@@ -193,12 +248,238 @@ class TestAPIGateway:
         data = response.json()
         assert "GitHub service is not available" in data["detail"]
     
-    @patch('httpx.AsyncClient.get')
-    def test_get_commits_timeout(self, mock_get, client):
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_timeout(self, mock_send, client):
         """Test commit retrieval with timeout."""
-        mock_get.side_effect = httpx.TimeoutException("Request timed out")
+        mock_send.side_effect = httpx.TimeoutException("Request timed out")
         
         response = client.get("/api/commits")
         assert response.status_code == 503
         data = response.json()
         assert "GitHub service is not available" in data["detail"]
+    
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_passthrough_is_not_decoded(self, mock_send, client):
+        """Test that upstream bytes and headers are relayed unchanged."""
+        body = b'[{"commit_hash": "abc",   "author": "Test User"}]'
+        upstream = make_stream_response(
+            200, body, {"content-type": "application/json", "x-internal": "secret"}
+        )
+        mock_send.return_value = upstream
+        
+        response = client.get("/api/commits")
+        assert response.status_code == 200
+        assert response.content == body
+        assert response.headers["content-type"] == "application/json"
+        assert "x-internal" not in response.headers
+        upstream.json.assert_not_called()
+        upstream.aclose.assert_awaited()
+    
+    @patch('httpx.AsyncClient.send')
+    def test_get_commit_analysis_not_found(self, mock_send, client):
+        """Test analysis retrieval keeps the upstream error status."""
+        mock_send.return_value = make_stream_response(404)
+        
+        response = client.get("/api/analysis/unknown")
+        assert response.status_code == 404
+        data = response.json()
+        assert "Failed to fetch commit analysis" in data["detail"]
+    
+    @patch('httpx.AsyncClient.send')
+    def test_create_analysis_queued(self, mock_send, client):
+        """Test queueing an analysis relays the AI service's 202 and job."""
+        mock_send.return_value = make_stream_response(
+            202,
+            body=json.dumps({"message": "Analysis queued", "job": {"id": 3, "status": "queued"}}).encode(),
+            headers={"content-type": "application/json"}
+        )
+        
+        response = client.post("/api/analysis/abc123?priority=backfill", json={"message": "Fix crash"})
+        assert response.status_code == 202
+        assert response.json()["job"]["id"] == 3
+        
+        request = mock_send.call_args.args[0]
+        assert request.method == "POST"
+        assert request.url.path == "/analysis/abc123"
+        assert request.url.params["priority"] == "backfill"
+        assert json.loads(request.content) == {"message": "Fix crash"}
+    
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_gzip_compressed(self, mock_send, client, mock_github_service_response):
+        """Test large commit lists are gzip-compressed with an encoding-specific ETag."""
+        body = json.dumps(mock_github_service_response * 50).encode()
+        mock_send.return_value = make_stream_response(
+            200, body, {"content-type": "application/json", "etag": '"commits-v3"'}
+        )
+        
+        response = client.get("/api/commits", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert response.headers["content-encoding"] == "gzip"
+        assert response.headers["etag"] == '"commits-v3-gzip"'
+        assert "Accept-Encoding" in response.headers["vary"]
+        assert response.json() == mock_github_service_response * 50
+    
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_small_body_not_compressed(self, mock_send, client):
+        """Test bodies below the size threshold are sent uncompressed."""
+        mock_send.return_value = make_stream_response(
+            200, b"[]", {"content-type": "application/json", "content-length": "2"}
+        )
+        
+        response = client.get("/api/commits", headers={"Accept-Encoding": "gzip"})
+        assert response.status_code == 200
+        assert "content-encoding" not in response.headers
+    
+    @patch('httpx.AsyncClient.send')
+    def test_get_commits_not_modified(self, mock_send, client):
+        """Test If-None-Match is normalized for upstream and 304 is relayed."""
+        mock_send.return_value = make_stream_response(304, headers={"etag": '"commits-v3"'})
+        
+        response = client.get(
+            "/api/commits",
+            headers={"If-None-Match": '"commits-v3-gzip"', "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 304
+        assert response.content == b""
+        upstream_request = mock_send.call_args[0][0]
+        assert upstream_request.headers["if-none-match"] == '"commits-v3"'
+    
+    @patch('httpx.AsyncClient.send')
+    def test_commit_stream_resumes_from_last_event_id(self, mock_send, client):
+        """Test the live feed is relayed uncompressed and resumes upstream."""
+        body = b'id: 1:2\nevent: commit\ndata: {"commit_hash": "abc"}\n\n' * 100
+        mock_send.return_value = make_stream_response(
+            200, body, {"content-type": "text/event-stream; charset=utf-8"}
+        )
+        
+        response = client.get(
+            "/api/commits/stream",
+            headers={"Last-Event-ID": "1:1", "Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "content-encoding" not in response.headers
+        assert response.content == body
+        upstream_request = mock_send.call_args[0][0]
+        assert upstream_request.url.path == "/events"
+        assert upstream_request.headers["last-event-id"] == "1:1"
+
+    @patch('httpx.AsyncClient.send')
+    def test_slow_replica_is_hedged(self, mock_send, client, monkeypatch):
+        """Test a commit list request stuck on a slow replica is answered by a hedge."""
+        import asyncio
+        import main
+        from services.upstream import Upstream
+        upstream = Upstream("github-service", ["http://slow", "http://fast"])
+        monkeypatch.setattr(main, "github_service", upstream)
+        tracker = upstream.latency("/commits")
+        for _ in range(tracker.min_samples):
+            tracker.record(0.01)
+
+        async def respond(request, stream=False):
+            if request.url.host == "slow":
+                await asyncio.sleep(5.0)
+            return make_stream_response(200, b"[]", {"content-type": "application/json"})
+
+        mock_send.side_effect = respond
+        # Keep the first attempt on the slow replica
+        monkeypatch.setattr(upstream.balancer, "choose", lambda exclude=None: next(
+            replica for replica in upstream.balancer.replicas if replica not in (exclude or [])
+        ))
+
+        response = client.get("/api/commits")
+        assert response.status_code == 200
+        assert response.json() == []
+        assert [call[0][0].url.host for call in mock_send.call_args_list] == ["slow", "fast"]
+
+    @patch('httpx.AsyncClient.post')
+    @patch('httpx.AsyncClient.send')
+    def test_feed_pinned_and_ingests_balanced(self, mock_send, mock_post, client, monkeypatch):
+        """Test the live feed goes to the feed replica while ingests stay on the balanced replicas."""
+        import main
+        from services.upstream import Upstream
+        monkeypatch.setattr(main, "github_service", Upstream("github-service", ["http://gh-1"]))
+        monkeypatch.setattr(main, "github_feed", Upstream("github-feed", ["http://gh-2"]))
+        mock_send.return_value = make_stream_response(200, b": keep-alive\n\n")
+        mock_post.return_value = Mock(status_code=200, json=Mock(return_value={"message": "ok"}))
+
+        assert client.get("/api/commits/stream").status_code == 200
+        assert client.post("/api/tracking/start").status_code == 200
+        assert client.post("/api/fetch-commits").status_code == 200
+
+        assert [call[0][0].url.host for call in mock_send.call_args_list] == ["gh-2"]
+        assert [call[0][0] for call in mock_post.call_args_list] == [
+            "http://gh-1/start-tracking", "http://gh-1/fetch-commits"
+        ]
+
+    @patch('httpx.AsyncClient.send')
+    def test_analysis_stream_relayed(self, mock_send, client):
+        """Test streamed analysis tokens are relayed uncompressed from the AI service."""
+        body = (b'event: token\ndata: {"text": "{"}\n\n' * 100
+                + b'event: result\ndata: {"analysis": {}}\n\n')
+        mock_send.return_value = make_stream_response(
+            200, body, {"content-type": "text/event-stream; charset=utf-8"}
+        )
+        
+        response = client.post(
+            "/api/analyze/stream",
+            json={"message": "Fix crash"},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        assert "content-encoding" not in response.headers
+        assert response.content == body
+        upstream_request = mock_send.call_args[0][0]
+        assert upstream_request.url.path == "/analyze/stream"
+        assert json.loads(upstream_request.content) == {"message": "Fix crash"}
+    
+    @patch('httpx.AsyncClient.send')
+    def test_analysis_batch_relayed(self, mock_send, client):
+        """Test per-commit batch results are relayed uncompressed from the AI service."""
+        body = b'{"index": 0, "commit_hash": "a1", "analysis": {}}\n' * 50 + b'{"done": true}\n'
+        mock_send.return_value = make_stream_response(
+            200, body, {"content-type": "application/x-ndjson"}
+        )
+        
+        response = client.post(
+            "/api/analyze/batch",
+            json={"commits": [{"commit_hash": "a1", "message": "Fix crash"}]},
+            headers={"Accept-Encoding": "gzip"}
+        )
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("application/x-ndjson")
+        assert "content-encoding" not in response.headers
+        assert response.content == body
+        upstream_request = mock_send.call_args[0][0]
+        assert upstream_request.url.path == "/analyze/batch"
+    
+    @patch('httpx.AsyncClient.post')
+    def test_expensive_route_rate_limited(self, mock_post, client):
+        """Test repeated expensive POSTs are rejected with 429 and Retry-After."""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"message": "Fetched 0 new commits", "total_new_commits": 0}
+        mock_post.return_value = mock_response
+        
+        statuses = [client.post("/api/fetch-commits").status_code for _ in range(7)]
+        assert statuses[:6] == [200] * 6
+        assert statuses[6] == 429
+        
+        response = client.post("/api/fetch-commits")
+        assert response.status_code == 429
+        assert int(response.headers["retry-after"]) >= 1
+        assert mock_post.call_count == 6
+    
+    @patch('httpx.AsyncClient.post')
+    def test_rate_limit_is_per_client(self, mock_post, client):
+        """Test one client's exhausted bucket does not affect another client."""
+        mock_response = Mock()
+        mock_response.status_code = 200
+        mock_response.json.return_value = {"message": "Fetched 0 new commits", "total_new_commits": 0}
+        mock_post.return_value = mock_response
+        
+        for _ in range(6):
+            client.post("/api/fetch-commits", headers={"X-API-Key": "noisy"})
+        assert client.post("/api/fetch-commits", headers={"X-API-Key": "noisy"}).status_code == 429
+        assert client.post("/api/fetch-commits", headers={"X-API-Key": "quiet"}).status_code == 200
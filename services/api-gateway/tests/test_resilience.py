@@ -0,0 +1,277 @@
+import asyncio
+import pytest
+from unittest.mock import patch, Mock, AsyncMock
+import httpx
+
+from services.resilience import CircuitBreaker, RetryBudget, LatencyTracker
+from services.upstream import Upstream
+from services.load_balancer import LoadBalancer, parse_replica_urls
+
+def make_response(status_code):
+    """Build a mock upstream response."""
+    response = Mock()
+    response.status_code = status_code
+    response.aclose = AsyncMock()
+    return response
+
+class TestCircuitBreaker:
+    """Test cases for the circuit breaker."""
+    
+    def test_opens_after_threshold_and_rejects(self):
+        """Test the circuit opens after consecutive failures."""
+        breaker = CircuitBreaker(failure_threshold=3, recovery_timeout=60)
+        for _ in range(3):
+            assert breaker.allow_request()
+            breaker.record_failure()
+        
+        assert breaker.state == CircuitBreaker.OPEN
+        assert not breaker.allow_request()
+    
+    def test_half_open_allows_single_probe(self):
+        """Test only one probe passes once the recovery timeout expires."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        
+        assert breaker.allow_request()
+        assert breaker.state == CircuitBreaker.HALF_OPEN
+        assert not breaker.allow_request()
+        
+        breaker.record_success()
+        assert breaker.state == CircuitBreaker.CLOSED
+    
+    def test_failed_probe_reopens(self):
+        """Test a failed probe opens the circuit again."""
+        breaker = CircuitBreaker(failure_threshold=1, recovery_timeout=0)
+        breaker.record_failure()
+        breaker.allow_request()
+        breaker.record_failure()
+        assert breaker.state == CircuitBreaker.OPEN
+
+class TestRetryBudget:
+    """Test cases for the retry budget."""
+    
+    def test_budget_is_a_fraction_of_traffic(self):
+        """Test retries are capped at the configured ratio of requests."""
+        budget = RetryBudget(ratio=0.1, min_per_second=0)
+        for _ in range(50):
+            budget.record_request()
+        
+        granted = sum(budget.try_acquire() for _ in range(20))
+        assert granted == 5
+
+class TestLatencyTracker:
+    """Test cases for latency percentiles."""
+    
+    def test_percentile_requires_samples(self):
+        """Test no percentile is reported until enough samples exist."""
+        tracker = LatencyTracker(min_samples=10)
+        for i in range(9):
+            tracker.record(i)
+        assert tracker.percentile(95) is None
+        
+        tracker.record(9)
+        assert tracker.percentile(50) == 4
+        assert tracker.percentile(100) == 9
+
+class TestLoadBalancer:
+    """Test cases for replica selection."""
+    
+    def test_parse_replica_urls(self):
+        """Test replica lists fall back to the single service URL."""
+        assert parse_replica_urls("http://a:1/, http://b:2", "http://x") == ["http://a:1", "http://b:2"]
+        assert parse_replica_urls(None, "http://x") == ["http://x"]
+    
+    def test_prefers_replica_with_fewer_outstanding_requests(self):
+        """Test power-of-two-choices picks the less loaded replica."""
+        balancer = LoadBalancer(["http://a", "http://b"])
+        busy, idle = balancer.replicas
+        busy.outstanding = 5
+        
+        assert all(balancer.choose() is idle for _ in range(10))
+    
+    def test_unhealthy_replica_is_ejected_then_slow_started(self):
+        """Test failed probes eject a replica and recovery ramps its weight."""
+        balancer = LoadBalancer(["http://a", "http://b"], strategy="least_outstanding")
+        sick, well = balancer.replicas
+        for _ in range(2):
+            sick.record_probe(False)
+        
+        assert not sick.healthy
+        assert all(balancer.choose() is well for _ in range(10))
+        
+        for _ in range(2):
+            sick.record_probe(True)
+        assert sick.healthy
+        assert sick.weight(sick.recovered_at) < 1.0
+        
+        # Fresh replica gets less traffic than an equally loaded one at full weight
+        well.outstanding = 1
+        sick.outstanding = 0
+        assert balancer.choose() is well
+    
+    def test_open_replica_circuit_is_skipped(self):
+        """Test replicas with open circuits are not chosen."""
+        balancer = LoadBalancer(["http://a", "http://b"], failure_threshold=1, recovery_timeout=60)
+        broken, working = balancer.replicas
+        broken.breaker.record_failure()
+        
+        assert all(balancer.choose() is working for _ in range(10))
+
+class TestUpstream:
+    """Test cases for resilient upstream calls."""
+    
+    @patch('httpx.AsyncClient.get')
+    def test_get_retried_after_server_error(self, mock_get):
+        """Test idempotent requests are retried on 5xx."""
+        mock_get.side_effect = [make_response(503), make_response(200)]
+        upstream = Upstream("test", ["http://upstream"])
+        
+        response = asyncio.run(upstream.request("GET", "/commits"))
+        assert response.status_code == 200
+        assert mock_get.call_count == 2
+    
+    @patch('httpx.AsyncClient.post')
+    def test_post_not_retried(self, mock_post):
+        """Test non-idempotent requests are never retried."""
+        mock_post.side_effect = httpx.ConnectError("Connection failed")
+        upstream = Upstream("test", ["http://upstream"])
+        
+        with pytest.raises(httpx.RequestError):
+            asyncio.run(upstream.request("POST", "/start-tracking"))
+        assert mock_post.call_count == 1
+
+    @patch('httpx.AsyncClient.post')
+    def test_post_with_idempotency_key_retried(self, mock_post):
+        """Test POSTs carrying an Idempotency-Key are retried like GETs."""
+        mock_post.side_effect = [
+            httpx.ConnectError("Connection failed"),
+            Mock(status_code=200)
+        ]
+        upstream = Upstream("test", ["http://upstream"])
+
+        response = asyncio.run(
+            upstream.request("POST", "/start-tracking", headers={"Idempotency-Key": "abc"})
+        )
+        assert response.status_code == 200
+        assert mock_post.call_count == 2
+
+    @patch('httpx.AsyncClient.post')
+    def test_open_circuit_fails_fast(self, mock_post):
+        """Test calls are rejected without reaching upstream once the circuit opens."""
+        mock_post.side_effect = httpx.ConnectError("Connection failed")
+        upstream = Upstream("test", ["http://upstream"])
+        upstream.balancer.replicas[0].breaker.failure_threshold = 2
+        
+        for _ in range(2):
+            with pytest.raises(httpx.RequestError):
+                asyncio.run(upstream.request("POST", "/fetch-commits"))
+        
+        with pytest.raises(httpx.RequestError, match="circuit is open"):
+            asyncio.run(upstream.request("POST", "/fetch-commits"))
+        assert mock_post.call_count == 2
+    
+    @patch('httpx.AsyncClient.get')
+    def test_slow_get_is_hedged(self, mock_get):
+        """Test a GET slower than the latency percentile is raced by a hedge."""
+        calls = []
+        
+        async def respond(url, **kwargs):
+            calls.append(url)
+            if len(calls) == 1:
+                await asyncio.sleep(1.0)
+            return make_response(200)
+        
+        mock_get.side_effect = respond
+        upstream = Upstream("test", ["http://upstream"])
+        tracker = upstream.latency("/commits")
+        for _ in range(tracker.min_samples):
+            tracker.record(0.01)
+        
+        async def scenario():
+            start = asyncio.get_running_loop().time()
+            response = await upstream.request("GET", "/commits")
+            return response, asyncio.get_running_loop().time() - start
+        
+        response, elapsed = asyncio.run(scenario())
+        assert response.status_code == 200
+        assert len(calls) == 2
+        assert elapsed < 0.5
+    
+    @patch('httpx.AsyncClient.get')
+    def test_hedge_delay_is_per_route(self, mock_get):
+        """Test fast samples of one route do not set the hedge delay of another."""
+        calls = []
+        
+        async def respond(url, **kwargs):
+            calls.append(url)
+            await asyncio.sleep(0.05)
+            return make_response(200)
+        
+        mock_get.side_effect = respond
+        upstream = Upstream("test", ["http://upstream"])
+        health = upstream.latency("/health")
+        for _ in range(health.min_samples):
+            health.record(0.001)
+        
+        response = asyncio.run(upstream.request("GET", "/analysis/abc123", route="/analysis/{commit_hash}"))
+        assert response.status_code == 200
+        assert len(calls) == 1
+        assert set(upstream.status()["p95_latency_ms"]) == {"/health", "/analysis/{commit_hash}"}
+    
+    @patch('httpx.AsyncClient.send')
+    def test_streamed_get_is_hedged_on_headers(self, mock_send):
+        """Test a streamed GET slow to send headers is hedged and the losing stream closed."""
+        responses = []
+        
+        async def respond(request, stream=False):
+            responses.append(make_response(200))
+            response = responses[-1]
+            await asyncio.sleep(1.0 if len(responses) == 1 else 0.0)
+            return response
+        
+        mock_send.side_effect = respond
+        upstream = Upstream("test", ["http://a", "http://b"])
+        tracker = upstream.latency("/commits")
+        for _ in range(tracker.min_samples):
+            tracker.record(0.01)
+        
+        async def scenario():
+            response = await upstream.request("GET", "/commits", stream=True)
+            await asyncio.sleep(0.05)
+            return response
+        
+        response = asyncio.run(scenario())
+        assert len(responses) == 2
+        assert response is responses[1]
+        assert not response.aclose.called
+    
+    @patch('httpx.AsyncClient.send')
+    def test_event_stream_is_not_hedged(self, mock_send):
+        """Test an event feed is never raced by a second connection."""
+        calls = []
+        
+        async def respond(request, stream=False):
+            calls.append(request)
+            await asyncio.sleep(0.2)
+            return make_response(200)
+        
+        mock_send.side_effect = respond
+        upstream = Upstream("test", ["http://a", "http://b"])
+        tracker = upstream.latency("/events")
+        for _ in range(tracker.min_samples):
+            tracker.record(0.01)
+        
+        response = asyncio.run(upstream.request("GET", "/events", stream=True, hedge=False))
+        assert response.status_code == 200
+        assert len(calls) == 1
+    
+    @patch('httpx.AsyncClient.get')
+    def test_retry_goes_to_another_replica(self, mock_get):
+        """Test a failed attempt is retried on a different replica."""
+        mock_get.side_effect = [httpx.ConnectError("Connection failed"), make_response(200)]
+        upstream = Upstream("test", ["http://a", "http://b"])
+        
+        response = asyncio.run(upstream.request("GET", "/commits"))
+        assert response.status_code == 200
+        first_url, second_url = [call.args[0] for call in mock_get.call_args_list]
+        assert first_url != second_url
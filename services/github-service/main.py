@@ -1,16 +1,21 @@
-from fastapi import FastAPI, HTTPException, Depends
+from fastapi import FastAPI, HTTPException, Depends, Header, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
 from sqlalchemy.orm import Session
-from typing import List, Dict
+from typing import List, Dict, Optional
 import logging
 import os
 from dotenv import load_dotenv
 from datetime import datetime
 
 # Import our modules
-from models.database import get_db, init_db
+from models.database import SessionLocal, get_db, init_db
 from models.commit import Commit
 from models.tracking_session import TrackingSession
+from models.ingest_run import IngestRun
 from services.github_client import GitHubClient
+from services.data_version import COMMITS_DATA, get_data_version, bump_data_version, make_etag, etag_matches
+from services.event_bus import event_bus
+from services.ingest import ingest_coordinator, idempotency_store, fail_interrupted_runs
 
 # Load environment variables
 load_dotenv()
@@ -36,6 +41,15 @@ async def startup_event():
         init_db()
         logger.info("Database initialized successfully")
         
+        # Runs that were in flight when the service stopped will never finish
+        db = SessionLocal()
+        try:
+            interrupted = fail_interrupted_runs(db)
+            if interrupted:
+                logger.warning(f"Marked {interrupted} interrupted ingest runs as failed")
+        finally:
+            db.close()
+        
         # Test GitHub connection
         if github_client.test_connection():
             logger.info("GitHub API connection successful")
@@ -65,9 +79,19 @@ async def health_check():
     }
 
 @app.get("/commits")
-async def get_commits(db: Session = Depends(get_db)):
+async def get_commits(request: Request, response: Response, db: Session = Depends(get_db)):
     """Get all commits from database"""
     try:
+        # The ETag only changes when an ingest modifies the commits table,
+        # so an unchanged list can be answered without querying it
+        etag = make_etag(COMMITS_DATA, get_data_version(db, COMMITS_DATA))
+        cache_headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=cache_headers)
+        
+        response.headers.update(cache_headers)
+        
         # Query all commits from database
         commits = db.query(Commit).order_by(Commit.commit_timestamp_utc.desc()).all()
         
@@ -99,148 +123,175 @@ async def get_commit(commit_hash: str, db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail=str(e))
 
 @app.post("/start-tracking")
-async def start_tracking(db: Session = Depends(get_db)):
-    """Start tracking commits for a repository and fetch initial commits"""
+async def start_tracking(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
+    """Start tracking commits for a repository and fetch its commits in the background"""
     try:
         # For now, we'll use a default repository
         # In a real application, this would come from the request body
         repository = "Pavan200312/Microserivices-With-Agent"  # Your actual repository
         branch = "main"
         
-        # Check if tracking session already exists
-        existing_session = db.query(TrackingSession).filter(
-            TrackingSession.repository == repository,
-            TrackingSession.status == "active"
-        ).first()
+        # A retried request with the same key gets the original response
+        result = await idempotency_store.run(
+            f"start-tracking:{idempotency_key}" if idempotency_key else None,
+            lambda: _start_tracking(repository, branch)
+        )
         
-        if existing_session:
-            # If session exists, fetch new commits anyway
-            logger.info(f"Tracking session already exists for {repository}, fetching commits...")
-        else:
-            # Create new tracking session
-            new_session = TrackingSession(
-                repository=repository,
-                branch=branch,
-                status="active"
-            )
-            db.add(new_session)
-            db.commit()
-            db.refresh(new_session)
-            logger.info(f"Started tracking for repository: {repository}")
-        
-        # Fetch commits from GitHub and store in database
-        try:
-            commits = github_client.get_commits(repository=repository, branch=branch)
-            new_commits_count = 0
-            
-            for commit_data in commits:
-                # Check if commit already exists using hash as unique identifier
-                existing_commit = db.query(Commit).filter(
-                    Commit.hash == commit_data["commit_hash"]
-                ).first()
-                
-                if not existing_commit:
-                    # Create new commit record matching your schema
-                    new_commit = Commit(
-                        hash=commit_data["commit_hash"],  # Store in hash column
-                        author=commit_data["author"],
-                        message=commit_data["message"],
-                        commit_timestamp_utc=datetime.fromisoformat(commit_data["timestamp"].replace('Z', '+00:00'))
-                    )
-                    
-                    db.add(new_commit)
-                    new_commits_count += 1
-                    logger.info(f"Added new commit: {commit_data['commit_hash'][:8]} - {commit_data['message'][:50]}")
-            
-            # Update session with latest commit hash
-            if commits:
-                session_to_update = existing_session if existing_session else new_session
-                session_to_update.last_commit_hash = commits[0]["commit_hash"]
-                session_to_update.last_polled_at = datetime.now()
-            
-            db.commit()
-            logger.info(f"Successfully stored {new_commits_count} new commits for {repository}")
-            
-            return {
-                "message": f"Tracking started successfully. Fetched {new_commits_count} new commits.",
-                "session": (existing_session or new_session).to_dict(),
-                "commits_fetched": new_commits_count
-            }
-            
-        except Exception as e:
-            logger.error(f"Failed to fetch commits for {repository}: {e}")
-            raise HTTPException(status_code=500, detail=f"Failed to fetch commits: {str(e)}")
+        # The run continues after we respond; clients poll its status URL
+        return JSONResponse(
+            status_code=202,
+            content=result,
+            headers={"Location": f"/ingest-runs/{result['run']['id']}"}
+        )
         
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Failed to start tracking: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+async def _start_tracking(repository: str, branch: str) -> Dict:
+    """Ensure a tracking session exists for a repository and start an ingest run"""
+    # Idempotent work can outlive the request (and be shared with a retry of it),
+    # so it uses its own session rather than the request's
+    db = ingest_coordinator.session_factory()
+    try:
+        return await _start_tracking_in(db, repository, branch)
+    finally:
+        db.close()
+
+async def _start_tracking_in(db: Session, repository: str, branch: str) -> Dict:
+    """Body of _start_tracking, run in the given session"""
+    # Check if tracking session already exists
+    session = db.query(TrackingSession).filter(
+        TrackingSession.repository == repository,
+        TrackingSession.status == "active"
+    ).first()
+    
+    if session:
+        # If session exists, fetch new commits anyway
+        logger.info(f"Tracking session already exists for {repository}, fetching commits...")
+    else:
+        # Create new tracking session
+        session = TrackingSession(
+            repository=repository,
+            branch=branch,
+            status="active"
+        )
+        db.add(session)
+        db.commit()
+        db.refresh(session)
+        logger.info(f"Started tracking for repository: {repository}")
+    
+    # Fetch commits from GitHub in the background; a run already in flight is reused
+    run = ingest_coordinator.start(db, github_client, repository, branch)
+    
+    return {
+        "message": "Tracking started successfully. Fetching commits in the background.",
+        "session": session.to_dict(),
+        "run": run.to_dict()
+    }
+
 @app.post("/fetch-commits")
-async def fetch_commits(db: Session = Depends(get_db)):
+async def fetch_commits(idempotency_key: Optional[str] = Header(None, alias="Idempotency-Key")):
     """Fetch new commits from GitHub and store in database"""
     try:
-        # Get active tracking sessions
-        active_sessions = db.query(TrackingSession).filter(
-            TrackingSession.status == "active"
-        ).all()
+        return await idempotency_store.run(
+            f"fetch-commits:{idempotency_key}" if idempotency_key else None,
+            _fetch_commits
+        )
         
-        if not active_sessions:
-            return {"message": "No active tracking sessions"}
+    except Exception as e:
+        logger.error(f"Failed to fetch commits: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+async def _fetch_commits() -> Dict:
+    """Run an ingest for every active tracking session and wait for them"""
+    # Like _start_tracking, independent of the request's session
+    db = ingest_coordinator.session_factory()
+    try:
+        return await _fetch_commits_in(db)
+    finally:
+        db.close()
+
+async def _fetch_commits_in(db: Session) -> Dict:
+    """Body of _fetch_commits, run in the given session"""
+    # Get active tracking sessions
+    active_sessions = db.query(TrackingSession).filter(
+        TrackingSession.status == "active"
+    ).all()
+    
+    if not active_sessions:
+        return {"message": "No active tracking sessions"}
+    
+    # One run per repository, even if several sessions track it
+    repositories = {}
+    for session in active_sessions:
+        repositories.setdefault(session.repository, session.branch)
+    
+    total_new_commits = 0
+    runs = []
+    
+    for repository, branch in repositories.items():
+        run = await ingest_coordinator.ingest(db, github_client, repository, branch)
+        runs.append(run.to_dict())
         
-        total_new_commits = 0
+        # A failed run is reported in its errors; the other repositories still run
+        if run.status == "completed":
+            total_new_commits += run.rows_inserted
+            logger.info(f"Fetched {run.rows_inserted} new commits for {repository}")
+    
+    return {
+        "message": f"Fetched {total_new_commits} new commits",
+        "total_new_commits": total_new_commits,
+        "runs": runs
+    }
+
+@app.get("/ingest-runs/{run_id}")
+async def get_ingest_run(run_id: int, db: Session = Depends(get_db)):
+    """Get the progress of an ingest run"""
+    try:
+        run = db.query(IngestRun).filter(IngestRun.id == run_id).first()
         
-        for session in active_sessions:
-            try:
-                # Get commits from GitHub
-                commits = github_client.get_commits(
-                    repository=session.repository,
-                    branch=session.branch
-                )
-                
-                new_commits_count = 0
-                
-                for commit_data in commits:
-                    # Check if commit already exists using hash as unique identifier
-                    existing_commit = db.query(Commit).filter(
-                        Commit.hash == commit_data["commit_hash"]
-                    ).first()
-                    
-                    if not existing_commit:
-                        # Create new commit record matching your schema
-                        new_commit = Commit(
-                            hash=commit_data["commit_hash"],  # Store in hash column
-                            author=commit_data["author"],
-                            message=commit_data["message"],
-                            commit_timestamp_utc=datetime.fromisoformat(commit_data["timestamp"].replace('Z', '+00:00'))
-                        )
-                        
-                        db.add(new_commit)
-                        new_commits_count += 1
-                        logger.info(f"Added new commit: {commit_data['commit_hash'][:8]} - {commit_data['message'][:50]}")
-                
-                # Update session with latest commit hash
-                if commits:
-                    session.last_commit_hash = commits[0]["commit_hash"]
-                    session.last_polled_at = datetime.now()
-                
-                db.commit()
-                total_new_commits += new_commits_count
-                
-                logger.info(f"Fetched {new_commits_count} new commits for {session.repository}")
-                
-            except Exception as e:
-                logger.error(f"Failed to fetch commits for {session.repository}: {e}")
-                continue
+        if not run:
+            raise HTTPException(status_code=404, detail="Ingest run not found")
         
-        return {
-            "message": f"Fetched {total_new_commits} new commits",
-            "total_new_commits": total_new_commits
-        }
+        return run.to_dict()
         
+    except HTTPException:
+        raise
     except Exception as e:
-        logger.error(f"Failed to fetch commits: {e}")
+        logger.error(f"Failed to get ingest run {run_id}: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+@app.get("/events")
+async def stream_events(request: Request, last_event_id: Optional[str] = None):
+    """Stream newly ingested commits and analyses as Server-Sent Events"""
+    # Browsers send Last-Event-ID automatically when reconnecting
+    resume_from = request.headers.get("last-event-id") or last_event_id
+    
+    return StreamingResponse(
+        event_bus.subscribe(resume_from),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache"}
+    )
+
+@app.post("/events")
+async def publish_event(event: Dict):
+    """
+    Publish an event to the live feed (used by other services and replicas, e.g. new analyses)
+    
+    Returns a null id if this replica forwarded the event to the feed replica.
+    """
+    event_type = event.get("type")
+    data = event.get("data")
+    
+    if not event_type or not isinstance(data, dict):
+        raise HTTPException(status_code=400, detail="Event type and data are required")
+    
+    event_id = event_bus.publish(event_type, data)
+    return {"id": event_id}
+
 @app.get("/tracking-sessions")
 async def get_tracking_sessions(db: Session = Depends(get_db)):
     """Get all tracking sessions"""
@@ -258,8 +309,14 @@ async def clear_commits(db: Session = Depends(get_db)):
     try:
         # Delete all commits
         deleted_count = db.query(Commit).delete()
+        if deleted_count:
+            bump_data_version(db, COMMITS_DATA)
         db.commit()
         
+        # Live feed subscribers must reload their commit lists
+        if deleted_count:
+            event_bus.publish("reset", {"reason": "commits cleared"})
+        
         logger.info(f"Cleared {deleted_count} commits from database")
         
         return {
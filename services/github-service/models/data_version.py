@@ -0,0 +1,27 @@
+from sqlalchemy import Column, Integer, String, DateTime
+from sqlalchemy.sql import func
+from .database import Base
+
+class DataVersion(Base):
+    """Model for versioning data sets so clients can cache them"""
+    __tablename__ = "data_versions"
+    
+    # Name of the versioned data set (e.g. "commits")
+    name = Column(String(100), primary_key=True)
+    
+    # Incremented every time the data set changes
+    version = Column(Integer, nullable=False, default=0)
+    
+    # Timestamps
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+    
+    def __repr__(self):
+        return f"<DataVersion(name={self.name}, version={self.version})>"
+    
+    def to_dict(self):
+        """Convert data version to dictionary"""
+        return {
+            "name": self.name,
+            "version": self.version,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,60 @@
+from sqlalchemy import Column, Integer, String, DateTime, Float, JSON
+from sqlalchemy.sql import func
+from .database import Base
+
+class IngestRun(Base):
+    """Model for background runs that fetch a repository's commits from GitHub"""
+    __tablename__ = "ingest_runs"
+
+    # Primary key
+    id = Column(Integer, primary_key=True, index=True)
+
+    # Repository information
+    repository = Column(String(255), nullable=False, index=True)
+    branch = Column(String(100), default='main')
+
+    # Run status
+    status = Column(String(50), default='queued')  # queued, running, completed, failed
+
+    # Progress counters
+    pages_fetched = Column(Integer, default=0)
+    commits_seen = Column(Integer, default=0)
+    rows_inserted = Column(Integer, default=0)
+    errors = Column(JSON, default=list)  # Error messages, in order
+
+    # Timing
+    started_at = Column(DateTime(timezone=True))
+    finished_at = Column(DateTime(timezone=True))
+    duration_seconds = Column(Float)
+
+    # Timestamps
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+    updated_at = Column(DateTime(timezone=True), onupdate=func.now())
+
+    def __repr__(self):
+        return f"<IngestRun(id={self.id}, repository={self.repository}, status={self.status})>"
+
+    def throughput(self):
+        """Rows inserted per second while the run was active"""
+        if not self.duration_seconds:
+            return None
+        return round((self.rows_inserted or 0) / self.duration_seconds, 2)
+
+    def to_dict(self):
+        """Convert ingest run to dictionary"""
+        return {
+            "id": self.id,
+            "repository": self.repository,
+            "branch": self.branch,
+            "status": self.status,
+            "pages_fetched": self.pages_fetched or 0,
+            "commits_seen": self.commits_seen or 0,
+            "rows_inserted": self.rows_inserted or 0,
+            "rows_per_second": self.throughput(),
+            "errors": self.errors or [],
+            "started_at": self.started_at.isoformat() if self.started_at else None,
+            "finished_at": self.finished_at.isoformat() if self.finished_at else None,
+            "duration_seconds": self.duration_seconds,
+            "created_at": self.created_at.isoformat() if self.created_at else None,
+            "updated_at": self.updated_at.isoformat() if self.updated_at else None
+        }
@@ -0,0 +1,53 @@
+# Data version tracking for GitHub Service
+# Provides cheap version numbers and ETags for data sets that change on ingest
+import logging
+from typing import Optional
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from sqlalchemy.sql import func
+
+from models.data_version import DataVersion
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Name of the data set covering the commits table
+COMMITS_DATA = "commits"
+
+# Dialects whose INSERT supports ON CONFLICT DO UPDATE
+UPSERT_INSERTS = {"postgresql": postgresql.insert, "sqlite": sqlite.insert}
+
+def get_data_version(db: Session, name: str = COMMITS_DATA) -> int:
+    """Get the current version of a data set (0 if it has never changed)"""
+    row = db.query(DataVersion).filter(DataVersion.name == name).first()
+    return row.version if row else 0
+
+def bump_data_version(db: Session, name: str = COMMITS_DATA) -> None:
+    """
+    Increment the version of a data set
+
+    The update is added to the caller's transaction, so the new version
+    becomes visible together with the data change it describes. The row is
+    created and incremented in one upsert, so concurrent first bumps cannot
+    both insert it and fail the losing transaction.
+    """
+    insert = UPSERT_INSERTS[db.get_bind().dialect.name]
+    statement = insert(DataVersion).values(name=name, version=1)
+    db.execute(statement.on_conflict_do_update(
+        index_elements=[DataVersion.name],
+        # onupdate defaults do not apply to upserts
+        set_={"version": DataVersion.version + 1, "updated_at": func.now()}
+    ))
+    logger.info(f"Bumped data version for {name}")
+
+def make_etag(name: str, version: int) -> str:
+    """Build a strong ETag for a data set version"""
+    return f'"{name}-v{version}"'
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """Check an If-None-Match header against the current ETag"""
+    if not if_none_match:
+        return False
+    if if_none_match.strip() == "*":
+        return True
+    return etag in [tag.strip() for tag in if_none_match.split(",")]
@@ -0,0 +1,209 @@
+# Event bus for GitHub Service
+# Keeps a bounded in-process log of commit feed events and fans them out to SSE subscribers
+import asyncio
+import json
+import logging
+import os
+import queue
+import threading
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import requests
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Seconds between keep-alive comments on idle streams (must stay below proxy read timeouts)
+HEARTBEAT_INTERVAL = 15.0
+
+# Replica hosting the live feed, set on every other replica so they forward their events
+# there; unset on the feed replica itself (and when there is only one replica)
+EVENT_FEED_URL = os.getenv("EVENT_FEED_URL", "").rstrip("/")
+# Events waiting to be forwarded before new ones are dropped
+EVENT_FORWARD_QUEUE_SIZE = 1000
+
+class FeedEvent:
+    """A single event in the commit feed"""
+
+    def __init__(self, event_id: str, event_type: str, data: Dict):
+        self.id = event_id
+        self.type = event_type
+        self.data = data
+
+    def to_sse(self) -> str:
+        """Format the event as a Server-Sent Events message"""
+        payload = json.dumps(self.data, default=str)
+        return f"id: {self.id}\nevent: {self.type}\ndata: {payload}\n\n"
+
+class EventBus:
+    """
+    Bounded, resumable log of feed events
+
+    Event ids have the form "<epoch>:<sequence>". The epoch changes every time
+    the service starts, so a client resuming with an id from a previous run (or
+    one that has fallen out of the buffer) receives a "reset" event telling it
+    to reload the full commit list instead of silently missing events.
+
+    The log is held in process memory, so it only spans one replica: an id
+    from one replica always resets on another. With several replicas, the
+    gateway sends every feed subscriber to one of them (GITHUB_FEED_URL),
+    and the others are given forward_url so the events they publish are
+    forwarded there instead of kept locally.
+    """
+
+    def __init__(self, max_events: int = 1000, forward_url: Optional[str] = None):
+        self.forwarder = EventForwarder(forward_url) if forward_url else None
+        self.epoch = str(int(time.time()))
+        self._events = deque(maxlen=max_events)
+        self._sequence = 0
+        self._lock = threading.Lock()
+        self._subscribers: List[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = []
+
+    def publish(self, event_type: str, data: Dict) -> str:
+        """
+        Append an event and wake up subscribers
+
+        Safe to call from request handlers and from worker threads.
+
+        Returns:
+            Id of the published event, or None if it was forwarded to the feed replica
+        """
+        if self.forwarder is not None:
+            self.forwarder.send(event_type, data)
+            return None
+
+        with self._lock:
+            self._sequence += 1
+            event = FeedEvent(f"{self.epoch}:{self._sequence}", event_type, data)
+            self._events.append((self._sequence, event))
+            subscribers = list(self._subscribers)
+
+        for loop, waiter in subscribers:
+            loop.call_soon_threadsafe(waiter.set)
+
+        return event.id
+
+    def _parse_event_id(self, last_event_id: Optional[str]) -> Optional[int]:
+        """Map a Last-Event-ID to a sequence number in this epoch (None if unusable)"""
+        if not last_event_id:
+            return None
+        epoch, _, sequence = last_event_id.partition(":")
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        return int(sequence)
+
+    def events_after(self, sequence: int) -> List[FeedEvent]:
+        """Get buffered events newer than a sequence number"""
+        with self._lock:
+            return [event for seq, event in self._events if seq > sequence]
+
+    def _resume_point(self, last_event_id: Optional[str]) -> Tuple[int, bool]:
+        """
+        Work out where a subscriber resumes
+
+        Returns:
+            (sequence to resume after, whether the client must reload everything)
+        """
+        with self._lock:
+            current = self._sequence
+            oldest = self._events[0][0] if self._events else current + 1
+
+        if last_event_id is None:
+            # Fresh subscriber: only new events from now on
+            return current, False
+
+        sequence = self._parse_event_id(last_event_id)
+        if sequence is None or sequence > current or sequence < oldest - 1:
+            return current, True
+        return sequence, False
+
+    async def subscribe(self, last_event_id: Optional[str] = None) -> AsyncIterator[str]:
+        """
+        Stream feed events as SSE messages, resuming after last_event_id
+
+        Yields:
+            SSE-formatted messages, including periodic keep-alive comments
+        """
+        waiter = asyncio.Event()
+        subscriber = (asyncio.get_running_loop(), waiter)
+        with self._lock:
+            self._subscribers.append(subscriber)
+
+        try:
+            cursor, reset = self._resume_point(last_event_id)
+            # Tell the client how often to reconnect and, if needed, to reload
+            yield "retry: 3000\n\n"
+            if reset:
+                yield FeedEvent(f"{self.epoch}:{cursor}", "reset", {"reason": "resume point unavailable"}).to_sse()
+
+            while True:
+                waiter.clear()
+                for event in self.events_after(cursor):
+                    cursor = int(event.id.partition(":")[2])
+                    yield event.to_sse()
+
+                try:
+                    await asyncio.wait_for(waiter.wait(), timeout=HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+        finally:
+            with self._lock:
+                self._subscribers.remove(subscriber)
+
+class EventForwarder:
+    """
+    Forwards events to the feed replica's POST /events in the background
+
+    Events are sent in order by one daemon thread, so publishers (including
+    request handlers on the event loop) never wait on the network. Delivery
+    is best effort, like the AI service's: subscribers that miss an event see
+    it on their next commit list reload.
+    """
+
+    def __init__(self, url: str, timeout: float = 5.0):
+        self.url = url
+        self.timeout = timeout
+        self.forwarded = 0
+        self.failures = 0
+        self._queue: "queue.Queue[Tuple[str, Dict]]" = queue.Queue(maxsize=EVENT_FORWARD_QUEUE_SIZE)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def send(self, event_type: str, data: Dict):
+        """Queue an event for forwarding (dropped if the queue is full)"""
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="event-forwarder", daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((event_type, data))
+        except queue.Full:
+            self.failures += 1
+            logger.warning(f"Event forward queue full, dropping {event_type} event")
+
+    def _run(self):
+        while True:
+            event_type, data = self._queue.get()
+            try:
+                response = requests.post(
+                    f"{self.url}/events",
+                    data=json.dumps({"type": event_type, "data": data}, default=str),
+                    headers={"Content-Type": "application/json"},
+                    timeout=self.timeout
+                )
+                response.raise_for_status()
+                self.forwarded += 1
+            except requests.exceptions.RequestException as e:
+                self.failures += 1
+                logger.warning(f"Failed to forward {event_type} event to {self.url}: {e}")
+            finally:
+                self._queue.task_done()
+
+# Shared event bus for the service
+event_bus = EventBus(forward_url=EVENT_FEED_URL or None)
@@ -3,7 +3,7 @@ import os
 from dotenv import load_dotenv
 import logging
 from datetime import datetime
-from typing import List, Dict, Optional
+from typing import Iterator, List, Dict, Optional
 
 # Load environment variables (only if .env file exists)
 load_dotenv()
@@ -59,22 +59,60 @@ class GitHubClient:
             logger.info(f"Successfully fetched {len(commits)} commits from {repository}")
             
             # Process commits to extract needed information
-            processed_commits = []
-            for commit in commits:
-                processed_commit = {
-                    "commit_hash": commit["sha"],
-                    "author": commit["commit"]["author"]["name"],
-                    "message": commit["commit"]["message"],
-                    "timestamp": commit["commit"]["author"]["date"]
-                }
-                processed_commits.append(processed_commit)
-            
-            return processed_commits
+            return [self._process_commit(commit) for commit in commits]
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Failed to fetch commits from {repository}: {e}")
             raise
     
+    def iter_commit_pages(self, repository: str, branch: str = "main", since: Optional[str] = None,
+                          max_pages: Optional[int] = None) -> Iterator[List[Dict]]:
+        """
+        Get commits from a GitHub repository one page at a time, newest first
+        
+        Follows the Link header of each response until the last page.
+        
+        Args:
+            repository: Repository name (e.g., "username/repo")
+            branch: Branch name (default: "main")
+            since: ISO 8601 timestamp to get commits since
+            max_pages: Stop after this many pages (default: no limit)
+            
+        Yields:
+            Lists of commit dictionaries, in the same format as get_commits
+        """
+        url = f"{self.base_url}/repos/{repository}/commits"
+        params = {
+            "sha": branch,
+            "per_page": 100  # Maximum commits per request
+        }
+        
+        if since:
+            params["since"] = since
+        
+        pages = 0
+        while url and (max_pages is None or pages < max_pages):
+            logger.info(f"Fetching commit page {pages + 1} from {repository} branch {branch}")
+            
+            response = requests.get(url, headers=self.headers, params=params)
+            response.raise_for_status()
+            pages += 1
+            
+            yield [self._process_commit(commit) for commit in response.json()]
+            
+            # The next page URL already carries the query parameters
+            url = response.links.get("next", {}).get("url")
+            params = None
+    
+    def _process_commit(self, commit: Dict) -> Dict:
+        """Extract the fields we store from a GitHub commit object"""
+        return {
+            "commit_hash": commit["sha"],
+            "author": commit["commit"]["author"]["name"],
+            "message": commit["commit"]["message"],
+            "timestamp": commit["commit"]["author"]["date"]
+        }
+    
     def _get_commit_files(self, repository: str, commit_hash: str) -> List[Dict]:
         """
         Get files changed in a specific commit
@@ -101,7 +139,9 @@ class GitHubClient:
                     "status": file["status"],  # added, modified, removed
                     "additions": file.get("additions", 0),
                     "deletions": file.get("deletions", 0),
-                    "changes": file.get("changes", 0)
+                    "changes": file.get("changes", 0),
+                    # Unified diff of the file; GitHub omits it for binary and very large files
+                    "patch": file.get("patch")
                 }
                 files_changed.append(file_info)
             
@@ -0,0 +1,294 @@
+# Ingest service for GitHub Service
+# Fetches commits from GitHub in background runs and coalesces concurrent triggers
+import asyncio
+import os
+import time
+import logging
+from collections import OrderedDict
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from dotenv import load_dotenv
+from sqlalchemy.orm import Session
+from starlette.concurrency import run_in_threadpool
+
+from models.database import SessionLocal
+from models.commit import Commit
+from models.ingest_run import IngestRun
+from models.tracking_session import TrackingSession
+from services.data_version import COMMITS_DATA, bump_data_version
+from services.event_bus import event_bus
+
+# Load environment variables
+load_dotenv()
+
+# Set up logging
+logger = logging.getLogger(__name__)
+
+# Upper bound on GitHub pages (100 commits each) fetched per run
+INGEST_MAX_PAGES = int(os.getenv("INGEST_MAX_PAGES", "10"))
+
+def store_commits(db: Session, commits: List[Dict]) -> List[Commit]:
+    """
+    Add the commits that are not stored yet to the session
+
+    Args:
+        db: Database session
+        commits: Commit dictionaries as returned by the GitHub client
+
+    Returns:
+        The newly added Commit rows
+    """
+    # Look up all fetched hashes in one query instead of one query per commit
+    hashes = [commit_data["commit_hash"] for commit_data in commits]
+    existing_hashes = set()
+    if hashes:
+        existing_hashes = {
+            row[0] for row in db.query(Commit.hash).filter(Commit.hash.in_(hashes)).all()
+        }
+
+    new_commits: List[Commit] = []
+    for commit_data in commits:
+        if commit_data["commit_hash"] in existing_hashes:
+            continue
+
+        # Create new commit record matching your schema
+        new_commit = Commit(
+            hash=commit_data["commit_hash"],  # Store in hash column
+            author=commit_data["author"],
+            message=commit_data["message"],
+            commit_timestamp_utc=datetime.fromisoformat(commit_data["timestamp"].replace('Z', '+00:00'))
+        )
+        db.add(new_commit)
+        new_commits.append(new_commit)
+        existing_hashes.add(commit_data["commit_hash"])
+        logger.info(f"Added new commit: {commit_data['commit_hash'][:8]} - {commit_data['message'][:50]}")
+
+    return new_commits
+
+def ingest_repository(db: Session, github_client, run: IngestRun, stop_at_known: bool = False) -> IngestRun:
+    """
+    Fetch a repository's commits from GitHub page by page and store the new ones
+
+    Each page is committed on its own, so progress counters on the run are
+    visible while it is still going. New commits bump the commits data version
+    and are published to the live feed. Failures are recorded on the run
+    rather than raised.
+
+    Args:
+        db: Database session
+        github_client: Client used to call the GitHub API
+        run: The ingest run to execute and update
+        stop_at_known: Stop at the first page with no new commits; only safe
+            when every older commit was stored by an earlier complete run
+
+    Returns:
+        The updated ingest run
+    """
+    start = time.monotonic()
+    run.status = "running"
+    run.started_at = datetime.now()
+    db.commit()
+
+    latest_hash = None
+    try:
+        pages = github_client.iter_commit_pages(run.repository, run.branch, max_pages=INGEST_MAX_PAGES)
+        for page in pages:
+            new_commits = store_commits(db, page)
+            if new_commits:
+                bump_data_version(db, COMMITS_DATA)
+            if page and latest_hash is None:
+                latest_hash = page[0]["commit_hash"]
+
+            run.pages_fetched = (run.pages_fetched or 0) + 1
+            run.commits_seen = (run.commits_seen or 0) + len(page)
+            run.rows_inserted = (run.rows_inserted or 0) + len(new_commits)
+            run.duration_seconds = time.monotonic() - start
+            db.commit()
+
+            # Push the new commits to live feed subscribers
+            for new_commit in new_commits:
+                event_bus.publish("commit", new_commit.to_dict())
+
+            if stop_at_known and not new_commits:
+                break
+
+        # Update sessions with latest commit hash
+        if latest_hash:
+            sessions = db.query(TrackingSession).filter(
+                TrackingSession.repository == run.repository,
+                TrackingSession.status == "active"
+            ).all()
+            for session in sessions:
+                session.last_commit_hash = latest_hash
+                session.last_polled_at = datetime.now()
+
+        run.status = "completed"
+        logger.info(f"Successfully stored {run.rows_inserted} new commits for {run.repository}")
+
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Ingest run {run.id} for {run.repository} failed: {e}")
+        run.status = "failed"
+        run.errors = (run.errors or []) + [str(e)]
+
+    run.finished_at = datetime.now()
+    run.duration_seconds = time.monotonic() - start
+    db.commit()
+    return run
+
+def previous_run_completed(db: Session, run: IngestRun) -> bool:
+    """Check whether the last finished run for the same repository completed"""
+    previous = db.query(IngestRun).filter(
+        IngestRun.repository == run.repository,
+        IngestRun.id != run.id,
+        IngestRun.finished_at.isnot(None)
+    ).order_by(IngestRun.id.desc()).first()
+    return previous is not None and previous.status == "completed"
+
+def fail_interrupted_runs(db: Session) -> int:
+    """Mark runs left queued or running by a previous process as failed"""
+    interrupted = db.query(IngestRun).filter(IngestRun.status.in_(["queued", "running"])).all()
+    for run in interrupted:
+        run.status = "failed"
+        run.errors = (run.errors or []) + ["Interrupted by service restart"]
+        run.finished_at = datetime.now()
+    db.commit()
+    return len(interrupted)
+
+class IngestCoordinator:
+    """
+    Runs ingests in the background and coalesces runs for the same repository
+
+    A trigger that arrives while a run for its repository is in flight does not
+    start a second GitHub fetch; it gets the run already in flight. Runs use
+    their own database session since they outlive the request that started them.
+    """
+
+    def __init__(self, session_factory: Callable[[], Session] = SessionLocal):
+        self.session_factory = session_factory
+        self._in_flight: Dict[str, asyncio.Future] = {}
+        self._run_ids: Dict[str, int] = {}
+
+    def _launch(self, repository: str, work: Callable[[], Awaitable]) -> asyncio.Future:
+        """Start work for a repository unless a run is already in flight"""
+        future = self._in_flight.get(repository)
+        if future is None:
+            future = asyncio.ensure_future(work())
+            self._in_flight[repository] = future
+            future.add_done_callback(lambda _: self._finish(repository))
+        else:
+            logger.info(f"Joining ingest already running for {repository}")
+        return future
+
+    def _finish(self, repository: str):
+        self._in_flight.pop(repository, None)
+        self._run_ids.pop(repository, None)
+
+    def start(self, db: Session, github_client, repository: str, branch: str) -> IngestRun:
+        """
+        Start a background ingest run for a repository
+
+        Returns:
+            The new run, or the run already in flight for the repository
+        """
+        run_id = self._run_ids.get(repository)
+        if run_id is not None:
+            logger.info(f"Ingest run {run_id} already in flight for {repository}")
+            return db.query(IngestRun).filter(IngestRun.id == run_id).first()
+
+        run = IngestRun(repository=repository, branch=branch, status="queued", errors=[])
+        db.add(run)
+        db.commit()
+        db.refresh(run)
+
+        self._run_ids[repository] = run.id
+        self._launch(repository, lambda: run_in_threadpool(self._execute, run.id, github_client))
+        logger.info(f"Started ingest run {run.id} for {repository}")
+        return run
+
+    async def wait(self, repository: str):
+        """Wait for the run in flight for a repository, if any"""
+        future = self._in_flight.get(repository)
+        if future is not None:
+            # Shield so one caller going away does not cancel the run for the others
+            await asyncio.shield(future)
+
+    async def ingest(self, db: Session, github_client, repository: str, branch: str) -> IngestRun:
+        """Start (or join) a run for a repository and wait for it to finish"""
+        run = self.start(db, github_client, repository, branch)
+        await self.wait(repository)
+        db.refresh(run)
+        return run
+
+    def _execute(self, run_id: int, github_client):
+        """Execute a run in a worker thread with its own database session"""
+        db = self.session_factory()
+        try:
+            run = db.query(IngestRun).filter(IngestRun.id == run_id).first()
+            ingest_repository(db, github_client, run, stop_at_known=previous_run_completed(db, run))
+        finally:
+            db.close()
+
+class IdempotencyStore:
+    """
+    Remembers responses to requests carrying an Idempotency-Key header
+
+    A retried request with the same key gets the stored response instead of
+    triggering another run. Entries expire after ttl seconds and the oldest are
+    dropped beyond max_entries.
+    """
+
+    def __init__(self, ttl: float = 24 * 3600, max_entries: int = 1000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._in_flight: Dict[str, asyncio.Future] = {}
+
+    def get(self, key: str) -> Optional[Dict]:
+        """Get the stored response for a key, if still valid"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        stored_at, response = entry
+        if time.monotonic() - stored_at > self.ttl:
+            del self._entries[key]
+            return None
+        return response
+
+    def put(self, key: str, response: Dict):
+        """Store the response for a key"""
+        self._entries[key] = (time.monotonic(), response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    async def run(self, key: Optional[str], work: Callable[[], Awaitable[Dict]]) -> Dict:
+        """
+        Run work once per idempotency key
+
+        Without a key the work simply runs. With a key, a stored response is
+        returned if present, and a request racing the first one waits for it.
+        Failed runs are not stored, so the client may retry them.
+        """
+        if not key:
+            return await work()
+
+        stored = self.get(key)
+        if stored is not None:
+            logger.info(f"Replaying stored response for idempotency key {key}")
+            return stored
+
+        future = self._in_flight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(work())
+            self._in_flight[key] = future
+            future.add_done_callback(lambda _: self._in_flight.pop(key, None))
+
+        response = await asyncio.shield(future)
+        self.put(key, response)
+        return response
+
+# Shared coordinators for the service
+ingest_coordinator = IngestCoordinator()
+idempotency_store = IdempotencyStore()
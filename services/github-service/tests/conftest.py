@@ -6,6 +6,7 @@ from sqlalchemy.orm import sessionmaker
 from sqlalchemy.pool import StaticPool
 import os
 import sys
+import time
 
 # Add the parent directory to the path so we can import our modules
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -15,6 +16,7 @@ from models.database import Base, get_db
 from models.commit import Commit
 from models.tracking_session import TrackingSession
 from services.github_client import GitHubClient
+from services.ingest import ingest_coordinator
 
 # Test database URL (in-memory SQLite for testing)
 SQLALCHEMY_DATABASE_URL = "sqlite:///./test.db"
@@ -52,7 +54,7 @@ def db_session():
         Base.metadata.drop_all(bind=engine)
 
 @pytest.fixture(scope="function")
-def client(db_session):
+def client(db_session, monkeypatch):
     """Create a test client with a fresh database."""
     def override_get_db():
         try:
@@ -61,10 +63,26 @@ def client(db_session):
             pass
     
     app.dependency_overrides[get_db] = override_get_db
+    # Background ingest runs open their own sessions
+    monkeypatch.setattr(ingest_coordinator, "session_factory", TestingSessionLocal)
     with TestClient(app) as test_client:
         yield test_client
     app.dependency_overrides.clear()
 
+@pytest.fixture
+def wait_for_run(client, db_session):
+    """Poll an ingest run until it finishes."""
+    def wait(run_id, timeout=5.0):
+        deadline = time.monotonic() + timeout
+        while True:
+            # Runs are written from another session; drop cached rows before reading
+            db_session.expire_all()
+            run = client.get(f"/ingest-runs/{run_id}").json()
+            if run["status"] in ("completed", "failed") or time.monotonic() > deadline:
+                return run
+            time.sleep(0.05)
+    return wait
+
 @pytest.fixture
 def sample_commit_data():
     """Sample commit data for testing."""
@@ -130,6 +148,9 @@ def mock_github_client(monkeypatch):
                     ]
                 }
             ]
+        
+        def iter_commit_pages(self, repository, branch="main", since=None, max_pages=None):
+            yield self.get_commits(repository, branch)
     
     mock_client = MockGitHubClient()
     monkeypatch.setattr("main.github_client", mock_client)
@@ -60,6 +60,22 @@ class TestAPIEndpoints:
         assert commit_data["message"] == sample_commit_data["message"]
         assert commit_data["repository"] == sample_commit_data["repository"]
     
+    def test_get_commits_revalidated_by_etag(self, client, mock_github_client, wait_for_run):
+        """Test /commits answers 304 for a current ETag and sends a new one after an ingest."""
+        etag = client.get("/commits").headers["etag"]
+
+        unchanged = client.get("/commits", headers={"If-None-Match": etag})
+        assert unchanged.status_code == 304
+        assert unchanged.headers["etag"] == etag
+
+        response = client.post("/start-tracking")
+        assert wait_for_run(response.json()["run"]["id"])["rows_inserted"] == 1
+
+        changed = client.get("/commits", headers={"If-None-Match": etag})
+        assert changed.status_code == 200
+        assert changed.headers["etag"] != etag
+        assert len(changed.json()) == 1
+
     def test_get_commit_by_hash(self, client, db_session, sample_commit_data):
         """Test getting a specific commit by hash."""
         # Create a test commit
@@ -90,26 +106,34 @@ class TestAPIEndpoints:
         data = response.json()
         assert data["detail"] == "Commit not found"
     
-    def test_start_tracking_new_session(self, client, mock_github_client):
+    def test_start_tracking_new_session(self, client, mock_github_client, wait_for_run):
         """Test starting tracking for a new repository."""
         response = client.post("/start-tracking")
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         
         assert "message" in data
         assert "Tracking started successfully" in data["message"]
         assert "session" in data
-        assert "commits_fetched" in data
+        assert "run" in data
+        assert response.headers["location"] == f"/ingest-runs/{data['run']['id']}"
         
         session = data["session"]
         assert session["repository"] == "Pavan200312/Microserivices-With-Agent"
         assert session["branch"] == "main"
         assert session["status"] == "active"
         
+        run = wait_for_run(data["run"]["id"])
+        assert run["status"] == "completed"
+        assert run["pages_fetched"] == 1
+        assert run["commits_seen"] == 1
+        assert run["rows_inserted"] == 1
+        assert run["errors"] == []
+        
         # Verify GitHub client was called
         assert mock_github_client.get_commits_called
     
-    def test_start_tracking_existing_session(self, client, db_session, mock_github_client):
+    def test_start_tracking_existing_session(self, client, db_session, mock_github_client, wait_for_run):
         """Test starting tracking when session already exists."""
         # Create an existing tracking session
         session = TrackingSession(
@@ -121,17 +145,35 @@ class TestAPIEndpoints:
         db_session.commit()
         
         response = client.post("/start-tracking")
-        assert response.status_code == 200
+        assert response.status_code == 202
         data = response.json()
         
         assert "message" in data
         assert "Tracking started successfully" in data["message"]
         assert "session" in data
-        assert "commits_fetched" in data
+        assert "run" in data
+        
+        wait_for_run(data["run"]["id"])
         
         # Verify GitHub client was called
         assert mock_github_client.get_commits_called
     
+    def test_start_tracking_idempotency_key(self, client, mock_github_client, wait_for_run):
+        """Test a retried start with the same Idempotency-Key returns the same run."""
+        headers = {"Idempotency-Key": "start-1"}
+        first = client.post("/start-tracking", headers=headers)
+        wait_for_run(first.json()["run"]["id"])
+        second = client.post("/start-tracking", headers=headers)
+        
+        assert second.status_code == 202
+        assert second.json()["run"]["id"] == first.json()["run"]["id"]
+    
+    def test_get_ingest_run_not_found(self, client):
+        """Test getting an ingest run that does not exist."""
+        response = client.get("/ingest-runs/999")
+        assert response.status_code == 404
+        assert response.json()["detail"] == "Ingest run not found"
+    
     def test_fetch_commits_no_active_sessions(self, client):
         """Test fetching commits when no active sessions exist."""
         response = client.post("/fetch-commits")
@@ -191,18 +233,21 @@ class TestAPIEndpoints:
         assert session_data["branch"] == sample_tracking_session_data["branch"]
         assert session_data["status"] == sample_tracking_session_data["status"]
     
-    def test_start_tracking_github_error(self, client, monkeypatch):
+    def test_start_tracking_github_error(self, client, monkeypatch, wait_for_run):
         """Test starting tracking when GitHub API fails."""
         class MockGitHubClient:
-            def get_commits(self, repository, branch="main"):
+            def iter_commit_pages(self, repository, branch="main", since=None, max_pages=None):
                 raise Exception("GitHub API error")
         
         monkeypatch.setattr("main.github_client", MockGitHubClient())
         
         response = client.post("/start-tracking")
-        assert response.status_code == 500
-        data = response.json()
-        assert "Failed to fetch commits" in data["detail"]
+        assert response.status_code == 202
+        
+        # The failure is reported on the run
+        run = wait_for_run(response.json()["run"]["id"])
+        assert run["status"] == "failed"
+        assert "GitHub API error" in run["errors"][0]
     
     def test_fetch_commits_github_error(self, client, db_session, monkeypatch):
         """Test fetching commits when GitHub API fails."""
@@ -216,7 +261,7 @@ class TestAPIEndpoints:
         db_session.commit()
         
         class MockGitHubClient:
-            def get_commits(self, repository, branch="main"):
+            def iter_commit_pages(self, repository, branch="main", since=None, max_pages=None):
                 raise Exception("GitHub API error")
         
         monkeypatch.setattr("main.github_client", MockGitHubClient())
@@ -225,8 +270,9 @@ class TestAPIEndpoints:
         assert response.status_code == 200  # Should handle error gracefully
         data = response.json()
         assert data["total_new_commits"] == 0
+        assert data["runs"][0]["status"] == "failed"
     
-    def test_commit_duplicate_handling(self, client, db_session, sample_commit_data, mock_github_client):
+    def test_commit_duplicate_handling(self, client, db_session, sample_commit_data, mock_github_client, wait_for_run):
         """Test that duplicate commits are not stored."""
         # Create an existing commit
         commit = Commit(
@@ -244,11 +290,12 @@ class TestAPIEndpoints:
         
         # Start tracking (should not add duplicate)
         response = client.post("/start-tracking")
-        assert response.status_code == 200
-        data = response.json()
+        assert response.status_code == 202
+        run = wait_for_run(response.json()["run"]["id"])
         
         # Should fetch commits but not add duplicates
-        assert data["commits_fetched"] == 0
+        assert run["commits_seen"] == 1
+        assert run["rows_inserted"] == 0
         
         # Verify only one commit exists
         commits_response = client.get("/commits")
@@ -0,0 +1,94 @@
+import asyncio
+import json
+import threading
+from unittest.mock import Mock
+from services.event_bus import EventBus
+
+async def collect(stream, count):
+    """Read a number of messages from an event stream."""
+    messages = []
+    async for message in stream:
+        messages.append(message)
+        if len(messages) == count:
+            break
+    await stream.aclose()
+    return messages
+
+def parse(message):
+    """Parse an SSE message into a dictionary of fields."""
+    fields = {}
+    for line in message.strip().split("\n"):
+        name, _, value = line.partition(": ")
+        fields[name] = value
+    return fields
+
+class TestEventBus:
+    """Test cases for the live feed event bus."""
+    
+    def test_subscriber_receives_published_events(self):
+        """Test events published after subscribing are streamed in order."""
+        bus = EventBus()
+        
+        async def scenario():
+            stream = bus.subscribe()
+            assert await stream.__anext__() == "retry: 3000\n\n"
+            bus.publish("commit", {"commit_hash": "abc"})
+            bus.publish("analysis", {"commit_hash": "abc"})
+            return await collect(stream, 2)
+        
+        first, second = [parse(m) for m in asyncio.run(scenario())]
+        assert first["event"] == "commit"
+        assert json.loads(first["data"]) == {"commit_hash": "abc"}
+        assert second["event"] == "analysis"
+        assert first["id"] == f"{bus.epoch}:1"
+    
+    def test_resume_after_last_event_id(self):
+        """Test a reconnecting client only receives events it missed."""
+        bus = EventBus()
+        first_id = bus.publish("commit", {"commit_hash": "one"})
+        bus.publish("commit", {"commit_hash": "two"})
+        
+        messages = asyncio.run(collect(bus.subscribe(first_id), 2))
+        event = parse(messages[1])
+        assert json.loads(event["data"]) == {"commit_hash": "two"}
+    
+    def test_resume_from_unknown_epoch_sends_reset(self):
+        """Test a stale Last-Event-ID tells the client to reload."""
+        bus = EventBus()
+        bus.publish("commit", {"commit_hash": "one"})
+        
+        messages = asyncio.run(collect(bus.subscribe("12345:7"), 2))
+        assert parse(messages[1])["event"] == "reset"
+    
+    def test_resume_from_evicted_event_sends_reset(self):
+        """Test resuming before the buffered window tells the client to reload."""
+        bus = EventBus(max_events=2)
+        first_id = bus.publish("commit", {"commit_hash": "one"})
+        for name in ("two", "three", "four"):
+            bus.publish("commit", {"commit_hash": name})
+        
+        messages = asyncio.run(collect(bus.subscribe(first_id), 2))
+        assert parse(messages[1])["event"] == "reset"
+    
+    def test_events_forwarded_to_feed_replica(self, monkeypatch):
+        """Test a replica not hosting the feed forwards its events in order instead of buffering them."""
+        posted = []
+        delivered = threading.Event()
+        
+        def post(url, data, headers, timeout):
+            posted.append((url, json.loads(data)))
+            if len(posted) == 2:
+                delivered.set()
+            return Mock(raise_for_status=Mock())
+        
+        monkeypatch.setattr("services.event_bus.requests.post", post)
+        bus = EventBus(forward_url="http://github-service-1:8001")
+        assert bus.publish("commit", {"commit_hash": "one"}) is None
+        bus.publish("reset", {"reason": "commits cleared"})
+        
+        assert delivered.wait(timeout=5)
+        assert posted == [
+            ("http://github-service-1:8001/events", {"type": "commit", "data": {"commit_hash": "one"}}),
+            ("http://github-service-1:8001/events", {"type": "reset", "data": {"reason": "commits cleared"}})
+        ]
+        assert bus.events_after(0) == []
@@ -165,3 +165,31 @@ class TestGitHubClient:
             
             with pytest.raises(ValueError, match="GitHub token is required"):
                 client.get_commits("test/repo", "main")
+    
+    @patch('requests.get')
+    def test_iter_commit_pages_follows_links(self, mock_get):
+        """Test commit pages are fetched by following the Link header."""
+        def make_page(sha, next_url=None):
+            response = Mock()
+            response.status_code = 200
+            response.json.return_value = [{
+                "sha": sha,
+                "commit": {
+                    "author": {"name": "Test User", "date": "2025-08-15T10:00:00Z"},
+                    "message": "Test commit message"
+                }
+            }]
+            response.links = {"next": {"url": next_url}} if next_url else {}
+            return response
+        
+        mock_get.side_effect = [
+            make_page("a" * 40, "https://api.github.com/repos/test/repo/commits?page=2"),
+            make_page("b" * 40)
+        ]
+        
+        client = GitHubClient()
+        pages = list(client.iter_commit_pages("test/repo", "main"))
+        
+        assert [page[0]["commit_hash"] for page in pages] == ["a" * 40, "b" * 40]
+        assert mock_get.call_args_list[1].args[0] == "https://api.github.com/repos/test/repo/commits?page=2"
+        assert mock_get.call_args_list[1].kwargs["params"] is None
@@ -0,0 +1,120 @@
+import asyncio
+import threading
+from models.commit import Commit
+from models.ingest_run import IngestRun
+from services.ingest import IngestCoordinator, IdempotencyStore
+from tests.conftest import TestingSessionLocal
+
+def make_commit(index):
+    return {
+        "commit_hash": f"{index:040d}",
+        "author": "Test User",
+        "message": f"Commit {index}",
+        "timestamp": "2025-08-15T10:00:00Z"
+    }
+
+class GatedGitHubClient:
+    """GitHub client whose fetch blocks until released, so triggers overlap a run."""
+
+    def __init__(self, error=None):
+        self.error = error
+        self.fetches = 0
+        self.release = threading.Event()
+
+    def iter_commit_pages(self, repository, branch="main", since=None, max_pages=None):
+        self.fetches += 1
+        self.release.wait(5)
+        if self.error:
+            raise self.error
+        yield [make_commit(1), make_commit(2)]
+
+class TestIngestCoordinator:
+    """Test cases for coalescing concurrent ingest runs."""
+
+    def test_concurrent_starts_for_same_repository_are_coalesced(self, db_session):
+        """Test a trigger arriving mid-run gets the run in flight instead of a second fetch."""
+        coordinator = IngestCoordinator(TestingSessionLocal)
+        github_client = GatedGitHubClient()
+
+        async def scenario():
+            first = coordinator.start(db_session, github_client, "test/repo", "main")
+            second = coordinator.start(db_session, github_client, "test/repo", "main")
+            github_client.release.set()
+            await coordinator.wait("test/repo")
+            return first.id, second.id
+
+        first_id, second_id = asyncio.run(scenario())
+        assert first_id == second_id
+        assert github_client.fetches == 1
+        db_session.expire_all()
+        run = db_session.query(IngestRun).filter(IngestRun.id == first_id).one()
+        assert run.status == "completed"
+        assert run.rows_inserted == 2
+        assert db_session.query(Commit).count() == 2
+
+    def test_failures_are_shared_and_not_kept(self, db_session):
+        """Test joined callers see the failed run and the next trigger starts a new one."""
+        coordinator = IngestCoordinator(TestingSessionLocal)
+        github_client = GatedGitHubClient(error=RuntimeError("GitHub API error"))
+
+        async def scenario():
+            runs = asyncio.gather(
+                coordinator.ingest(db_session, github_client, "test/repo", "main"),
+                coordinator.ingest(db_session, github_client, "test/repo", "main")
+            )
+            await asyncio.sleep(0.05)
+            github_client.release.set()
+            first, second = await runs
+            retried = await coordinator.ingest(db_session, github_client, "test/repo", "main")
+            return first, second, retried
+
+        first, second, retried = asyncio.run(scenario())
+        assert first.id == second.id
+        assert first.status == "failed"
+        assert "GitHub API error" in first.errors[0]
+        assert retried.id != first.id
+        assert github_client.fetches == 2
+
+class TestIdempotencyStore:
+    """Test cases for Idempotency-Key handling."""
+
+    def test_same_key_replays_response(self):
+        """Test a retried request with the same key does not run again."""
+        store = IdempotencyStore()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return {"commits_fetched": len(calls)}
+
+        async def scenario():
+            first = await store.run("key-1", work)
+            second = await store.run("key-1", work)
+            third = await store.run("key-2", work)
+            return first, second, third
+
+        first, second, third = asyncio.run(scenario())
+        assert first == second == {"commits_fetched": 1}
+        assert third == {"commits_fetched": 2}
+
+    def test_no_key_always_runs(self):
+        """Test requests without a key are not deduplicated."""
+        store = IdempotencyStore()
+        calls = []
+
+        async def work():
+            calls.append(1)
+            return {}
+
+        async def scenario():
+            await store.run(None, work)
+            await store.run(None, work)
+
+        asyncio.run(scenario())
+        assert len(calls) == 2
+
+    def test_expired_entries_are_dropped(self):
+        """Test stored responses expire after the TTL."""
+        store = IdempotencyStore(ttl=0)
+        store.put("key-1", {"commits_fetched": 1})
+        assert store.get("key-1") is None